@@ -16,9 +16,105 @@ class Settings(BaseSettings):
     enable_schematron: bool = False
     enable_verapdf: bool = False
 
+    # CII templates: precompiled at image build (python -m app.pipeline.cii_builder compile).
+    # Falls back to app/templates/*.j2 when the directory is empty or missing.
+    jinja_compiled_templates_dir: str = "/app/app/templates_compiled"
+    jinja_auto_reload: bool = False
+    # jinja (templates) | lxml (direct tree builder, see app/pipeline/cii_tree.py)
+    cii_builder_engine: str = "jinja"
+    # EN16931 invoices with at least this many lines are streamed to disk (etree.xmlfile);
+    # only with the lxml engine and the minified output mode, the form the stream writes
+    cii_stream_min_lines: int = 1000
+    # pretty (as rendered) | minified (no indentation/comments) | c14n (canonical XML, no declaration)
+    cii_output_mode: str = "pretty"
+    # POST /v1/xml/batch
+    xml_batch_max_items: int = 10000
+
+    # Uploads are copied to storage in chunks; larger ones are rejected with 413.
+    # max_request_mb caps the whole request body (checked on Content-Length, before parsing).
+    max_upload_mb: int = 50
+    max_request_mb: int = 500
+
+    # POST /v1/invoices/convert-bulk: PDFs per request
+    bulk_convert_max_items: int = 500
+
+    # Job status events (Redis pub/sub): GET /v1/invoices/{id}/events (SSE) and /status?wait=
+    enable_job_events: bool = True
+    job_events_heartbeat_s: float = 15.0
+    job_events_max_stream_s: float = 600.0
+    job_events_long_poll_max_s: float = 60.0
+    # Re-read interval of the job row when Redis is unreachable
+    job_events_poll_fallback_s: float = 2.0
+
+    # Outbound job webhooks (queue `webhooks`): events within the window are sent as one
+    # batch; a failing batch is retried with exponential backoff up to max_attempts.
+    enable_webhooks: bool = True
+    webhook_batch_window_s: float = 5.0
+    webhook_batch_max: int = 100
+    webhook_timeout_s: float = 10.0
+    webhook_max_attempts: int = 8
+    webhook_retry_base_s: int = 30
+    webhook_retry_max_s: int = 3600
+    # Endpoints must resolve to public addresses; allow private ones for local development
+    # only (e.g. the compose webhook-receiver service).
+    webhook_allow_private_targets: bool = False
+
+    # Downloads: none (FileResponse, Range supported) | x-accel (X-Accel-Redirect, nginx/Caddy)
+    # | x-sendfile (X-Sendfile, Apache/lighttpd). With x-accel, files under storage_local_root
+    # are addressed as <download_offload_prefix>/<path relative to the root>.
+    download_offload: str = "none"
+    download_offload_prefix: str = "/_protected"
+
+    # Idempotency-Key (POST /v1/invoices, convert-direct, conversions/archive): results are
+    # replayed for ttl_h; a duplicate of a request still running gets 409 + Retry-After, and
+    # a claim older than stale_s (crashed request) is taken over. Expired keys are deleted
+    # by the celery beat task every purge_interval_s.
+    idempotency_ttl_h: int = 24
+    idempotency_stale_s: float = 900.0
+    idempotency_purge_interval_s: float = 3600.0
+
+    # convert-direct output cache (<storage root>/cache/convert, shared by the API replicas
+    # through the volume): same PDF + invoice data + profile -> stored Factur-X, no recompute.
+    # Least recently used entries are evicted past max_mb (checked every prune_interval_s).
+    enable_convert_cache: bool = True
+    convert_cache_max_mb: int = 2048
+    convert_cache_prune_interval_s: float = 60.0
+
     # PDF/A conversion (ocrmypdf with forced OCR)
     enable_pdfa_convert: bool = True
 
+    # Split PDFs containing several invoices into one child job per invoice (opt-in: a
+    # split needs both a "page 1/n" marker and a new invoice number, see pipeline/split.py)
+    enable_invoice_split: bool = False
+
+    # Bulk POST /v1/invoices: jobs per process_invoice_batch task, extraction processes per task
+    invoice_batch_size: int = 20
+    batch_extract_workers: int = 4
+
+    # Finalize chain stages (build_xml -> pdfa -> wrap -> validate), each retried on its own
+    stage_max_retries: int = 2
+    stage_retry_delay_s: int = 10
+    # Stage manifest (/data/<job_id>/stages.json): retries skip stages whose inputs are unchanged
+    enable_stage_checkpoints: bool = True
+
+    # Celery worker_process_init warm-up (imports, templates, XSD/XSLT, synthetic invoice)
+    enable_worker_warmup: bool = True
+    worker_warmup_timeout_s: float = 60.0
+
+    # Prometheus exporter of the Celery worker (0 disables); the API serves /metrics
+    worker_metrics_port: int = 9808
+
+    # convert-direct: blocking stages run on a bounded pool, off the event loop.
+    # Requests beyond the queue, or waiting longer than max_wait, get 503 + Retry-After.
+    convert_pool_workers: int = 4
+    convert_queue_max: int = 32
+    convert_queue_max_wait_s: float = 30.0
+
+    # Tracing: none | otlp | file | console ("{pid}" in the file path is replaced per process)
+    tracing_exporter: str = "none"
+    otlp_traces_endpoint: str = "http://localhost:4318/v1/traces"
+    tracing_file_path: str = "/data/traces/spans-{pid}.jsonl"
+
     # ✅ JWT (aliases pour env + compat security.py)
     jwt_secret: str = Field(default="9a4d73a0d3258ecb4f0bb186eb32f0f7", alias="JWT_SECRET")
     jwt_algorithm: str = Field(default="HS256", alias="JWT_ALGORITHM")
@@ -1,4 +1,5 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import declarative_base, sessionmaker
 
 from app.config import settings
@@ -7,6 +8,38 @@ engine = create_engine(settings.database_url, pool_pre_ping=True)
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
 Base = declarative_base()
 
+# Columns added to tables that already existed in deployed databases. create_all() only
+# creates missing tables, so upgrade_schema() adds these (and their indexes) at startup.
+# Append here whenever a model gains a column: (table, column, SQL type, indexed)
+ADDED_COLUMNS: list[tuple[str, str, str, bool]] = [
+    ("invoice_jobs", "parent_job_id", "VARCHAR REFERENCES invoice_jobs (id)", True),
+    ("invoice_jobs", "xml_sha256", "VARCHAR(64)", True),
+    ("invoice_jobs", "metrics", "JSON", False),
+    ("invoice_jobs", "input_sha256", "VARCHAR(64)", True),
+    ("invoice_jobs", "user_id", "VARCHAR REFERENCES users (id)", True),
+    ("invoice_jobs", "output_sha256", "VARCHAR(64)", False),
+    ("conversion_records", "pdf_sha256", "VARCHAR(64)", False),
+    ("conversion_records", "xml_sha256", "VARCHAR(64)", False),
+]
+
+
+def upgrade_schema(bind: Engine = engine) -> list[str]:
+    """Add the ADDED_COLUMNS a database lacks; idempotent. Returns the added "table.column"."""
+    added = []
+    if_not_exists = "IF NOT EXISTS " if bind.dialect.name == "postgresql" else ""
+    with bind.begin() as conn:
+        insp = inspect(conn)
+        for table, column, sql_type, indexed in ADDED_COLUMNS:
+            if not insp.has_table(table):
+                continue  # created complete by create_all()
+            if column not in {c["name"] for c in insp.get_columns(table)}:
+                # IF NOT EXISTS (PostgreSQL): API replicas may upgrade concurrently
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {if_not_exists}{column} {sql_type}"))
+                added.append(f"{table}.{column}")
+            if indexed:
+                conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_{column} ON {table} ({column})"))
+    return added
+
 
 def get_db():
     db = SessionLocal()
@@ -0,0 +1,212 @@
+"""Job status events over Redis pub/sub.
+
+Every InvoiceJob status transition (API or worker) is published on `pfx:job:<job_id>`
+once the transaction commits, from a session hook: no call site has to remember it.
+Commits made on the event loop (async routes) publish from the default executor.
+GET /v1/invoices/{job_id}/events (SSE) and /status?wait= (long-poll) subscribe to it.
+Settled transitions of jobs that have an owner also feed the webhooks (app.webhooks).
+
+Publishing is best effort: if Redis is down the transition is only logged, and the
+subscribers fall back to re-reading the job row periodically.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import time
+from collections.abc import AsyncIterator
+from typing import Any
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.db import SessionLocal
+from app.models import InvoiceJob, JobStatus
+
+logger = logging.getLogger(__name__)
+
+# Statuses after which a job does not move on its own
+SETTLED_STATUSES = {JobStatus.VALIDATED.value, JobStatus.FAILED.value, JobStatus.NEEDS_REVIEW.value}
+
+_PENDING_KEY = "pfx_job_events"
+_WEBHOOK_KEY = "pfx_job_webhooks"
+_publisher: Any = None
+
+
+def job_channel(job_id: str) -> str:
+    return f"pfx:job:{job_id}"
+
+
+def _redis() -> Any:
+    global _publisher
+    if _publisher is None:
+        import redis
+
+        _publisher = redis.Redis.from_url(settings.redis_url, socket_timeout=2, socket_connect_timeout=2)
+    return _publisher
+
+
+def status_event(job: InvoiceJob) -> dict[str, Any]:
+    status = job.status.value if isinstance(job.status, JobStatus) else str(job.status)
+    return {
+        "job_id": job.id,
+        "status": status,
+        "error_message": job.error_message,
+        "parent_job_id": job.parent_job_id,
+        "ts": time.time(),
+    }
+
+
+def publish(events: list[dict[str, Any]]) -> None:
+    if not events or not settings.enable_job_events:
+        return
+    try:
+        pipe = _redis().pipeline(transaction=False)
+        for ev in events:
+            pipe.publish(job_channel(ev["job_id"]), json.dumps(ev))
+        pipe.execute()
+    except Exception as e:
+        logger.info("job events not published (%d): %s", len(events), e)
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _collect_status_changes(session: Session, _flush_context: Any) -> None:
+    pending = session.info.setdefault(_PENDING_KEY, {})
+    webhooks = session.info.setdefault(_WEBHOOK_KEY, {})
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, InvoiceJob) and (obj in session.new or inspect(obj).attrs.status.history.has_changes()):
+            ev = status_event(obj)
+            pending[obj.id] = ev  # last transition of the transaction wins
+            if obj.user_id and ev["status"] in SETTLED_STATUSES:
+                webhooks[obj.id] = {**ev, "user_id": obj.user_id}
+
+
+def _dispatch(events: list[dict[str, Any]], webhooks: list[dict[str, Any]]) -> None:
+    publish(events)
+    if webhooks:
+        from app.webhooks import enqueue_job_events
+
+        enqueue_job_events(webhooks)
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _publish_status_changes(session: Session) -> None:
+    events = list(session.info.pop(_PENDING_KEY, {}).values())
+    webhooks = list(session.info.pop(_WEBHOOK_KEY, {}).values())
+    if not events and not webhooks:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        _dispatch(events, webhooks)  # worker, or a sync route's threadpool thread
+        return
+    # Committed from an async route: the Redis publish and webhook queries would block the loop
+    loop.run_in_executor(None, _dispatch, events, webhooks)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _drop_status_changes(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
+    session.info.pop(_WEBHOOK_KEY, None)
+
+
+def read_status(job_id: str) -> dict[str, Any] | None:
+    """Current status from the DB (status columns only, not the JSON payloads)."""
+    db = SessionLocal()
+    try:
+        row = (
+            db.query(InvoiceJob.id, InvoiceJob.status, InvoiceJob.error_message, InvoiceJob.parent_job_id)
+            .filter(InvoiceJob.id == job_id)
+            .one_or_none()
+        )
+    finally:
+        db.close()
+    if row is None:
+        return None
+    return {
+        "job_id": row.id,
+        "status": row.status.value,
+        "error_message": row.error_message,
+        "parent_job_id": row.parent_job_id,
+        "ts": time.time(),
+    }
+
+
+async def _read_status_async(job_id: str) -> dict[str, Any] | None:
+    return await asyncio.to_thread(read_status, job_id)
+
+
+async def job_updates(
+    job_id: str, timeout_s: float, heartbeat_s: float, stop_when_settled: bool = True
+) -> AsyncIterator[dict[str, Any] | None]:
+    """Current status, then each change, until `timeout_s` elapses (or the job settles).
+
+    Yields None every `heartbeat_s` without a change (SSE keep-alive). The job row is
+    re-read on those ticks too, so a missed message (or no Redis at all) only costs latency.
+    """
+    deadline = time.monotonic() + timeout_s
+    client = pubsub = None
+    listening = False
+    try:
+        if settings.enable_job_events:
+            try:
+                import redis.asyncio as aioredis
+
+                client = aioredis.Redis.from_url(settings.redis_url, socket_connect_timeout=2)
+                pubsub = client.pubsub(ignore_subscribe_messages=True)
+                # Subscribe before reading the row: no transition can slip in between.
+                await pubsub.subscribe(job_channel(job_id))
+                listening = True
+            except Exception as e:
+                logger.info("job events: Redis unavailable, polling the DB instead: %s", e)
+
+        last = await _read_status_async(job_id)
+        if last is None:
+            return
+        yield last
+        if stop_when_settled and last["status"] in SETTLED_STATUSES:
+            return
+
+        # Without Redis, poll the row (cheap: status columns only) instead of waiting a full heartbeat.
+        tick = heartbeat_s if listening else min(heartbeat_s, settings.job_events_poll_fallback_s)
+        idle = 0.0
+        while (remaining := deadline - time.monotonic()) > 0:
+            wait = min(tick, remaining)
+            started = time.monotonic()
+            message = None
+            if listening:
+                try:
+                    message = await pubsub.get_message(timeout=wait)
+                except Exception as e:
+                    logger.info("job events: subscription lost, polling the DB instead: %s", e)
+                    listening = False
+                    tick = min(heartbeat_s, settings.job_events_poll_fallback_s)
+                    continue
+            else:
+                await asyncio.sleep(wait)
+
+            if message is not None:
+                current = json.loads(message["data"])
+            else:
+                idle += time.monotonic() - started
+                current = await _read_status_async(job_id)
+                if current is None:
+                    return
+            if current["status"] != last["status"]:
+                last, idle = current, 0.0
+                yield current
+                if stop_when_settled and current["status"] in SETTLED_STATUSES:
+                    return
+            elif message is None and idle >= heartbeat_s:
+                idle = 0.0
+                yield None
+    finally:
+        for closeable in (pubsub, client):
+            if closeable is not None:
+                try:
+                    await closeable.aclose()
+                except Exception:
+                    pass
@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import math
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, TypeVar
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from app.config import settings
+from app.metrics import STAGE_BUCKETS
+
+T = TypeVar("T")
+
+POOL_QUEUE_WAIT = Histogram(
+    "pfx_pool_queue_wait_seconds", "Time spent waiting for a pool slot", ["pool"], buckets=STAGE_BUCKETS
+)
+POOL_RUN = Histogram(
+    "pfx_pool_run_seconds", "Time spent running in the pool", ["pool"], buckets=STAGE_BUCKETS
+)
+POOL_WAITING = Gauge("pfx_pool_waiting", "Requests waiting for a slot", ["pool"], multiprocess_mode="livesum")
+POOL_RUNNING = Gauge("pfx_pool_running", "Requests running in the pool", ["pool"], multiprocess_mode="livesum")
+POOL_REJECTED = Counter("pfx_pool_rejected_total", "Requests turned away with 503", ["pool", "reason"])
+
+
+class PoolSaturated(Exception):
+    """The admission queue is full, or the max wait elapsed. Maps to 503 + Retry-After."""
+
+    def __init__(self, pool: str, reason: str, retry_after_s: int) -> None:
+        super().__init__(f"{pool} pool saturated ({reason})")
+        self.reason = reason
+        self.retry_after_s = retry_after_s
+
+
+class BoundedPool:
+    """Size-limited thread pool with an admission queue, for blocking work called from async routes.
+
+    The blocking stages (ocrmypdf/ghostscript subprocesses, pikepdf, lxml) release the GIL,
+    so threads are enough to keep the event loop free. At most `max_workers` jobs run; at
+    most `max_queue` wait, each for at most `max_wait_s`.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int, max_wait_s: float) -> None:
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self.max_wait_s = max_wait_s
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=name)
+        self._slots: asyncio.Semaphore | None = None
+        self._waiting = 0
+        self._avg_run_s = 1.0  # EWMA, feeds Retry-After
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        # Created lazily so it binds to the running event loop.
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers)
+        return self._slots
+
+    def retry_after_s(self) -> int:
+        """Rough time until a slot frees up for a new request."""
+        estimate = self._avg_run_s * (self._waiting + 1) / self.max_workers
+        return int(min(max(math.ceil(estimate), 1), 300))
+
+    async def run(self, fn: Callable[[], T]) -> T:
+        slots = self._semaphore()
+        if slots.locked() and self._waiting >= self.max_queue:
+            POOL_REJECTED.labels(self.name, "queue_full").inc()
+            raise PoolSaturated(self.name, "queue_full", self.retry_after_s())
+
+        self._waiting += 1
+        POOL_WAITING.labels(self.name).inc()
+        t0 = time.perf_counter()
+        acquire = asyncio.ensure_future(slots.acquire())
+        acquired = False
+        try:
+            try:
+                await asyncio.wait_for(asyncio.shield(acquire), timeout=self.max_wait_s)
+                acquired = True
+            except BaseException as e:
+                # Timed out or cancelled: a slot granted in the meantime goes back.
+                if acquire.done() and not acquire.cancelled() and acquire.exception() is None:
+                    acquired = True
+                else:
+                    acquire.cancel()
+                if isinstance(e, asyncio.TimeoutError):
+                    POOL_REJECTED.labels(self.name, "max_wait").inc()
+                    raise PoolSaturated(self.name, "max_wait", self.retry_after_s()) from None
+                raise
+            finally:
+                self._waiting -= 1
+                POOL_WAITING.labels(self.name).dec()
+                POOL_QUEUE_WAIT.labels(self.name).observe(time.perf_counter() - t0)
+
+            POOL_RUNNING.labels(self.name).inc()
+            t1 = time.perf_counter()
+
+            def _done(_: Any) -> None:
+                run_s = time.perf_counter() - t1
+                self._avg_run_s = 0.8 * self._avg_run_s + 0.2 * run_s
+                POOL_RUN.labels(self.name).observe(run_s)
+                POOL_RUNNING.labels(self.name).dec()
+
+            # copy_context: the worker thread keeps the request's trace/span context.
+            ctx = contextvars.copy_context()
+            future = asyncio.get_running_loop().run_in_executor(self._executor, ctx.run, fn)
+            future.add_done_callback(_done)
+            return await future
+        finally:
+            # Also on cancellation (client gone): the call is dropped if it has not started,
+            # otherwise it finishes in the background within the executor's max_workers.
+            if acquired:
+                slots.release()
+
+conversion_pool = BoundedPool(
+    "convert",
+    max_workers=settings.convert_pool_workers,
+    max_queue=settings.convert_queue_max,
+    max_wait_s=settings.convert_queue_max_wait_s,
+)
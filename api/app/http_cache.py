@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+from pathlib import Path
+from urllib.parse import quote
+
+from fastapi import Request, Response
+from fastapi.responses import FileResponse
+
+from app.config import settings
+
+
+def _opaque(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """If-None-Match check (weak comparison, as RFC 9110 requires for this header)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return _opaque(etag) in {_opaque(t) for t in if_none_match.split(",")}
+
+
+def not_modified(etag: str, cache_control: str = "no-cache") -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+
+
+def _content_disposition(filename: str) -> str:
+    if filename.isascii():
+        return f'attachment; filename="{filename}"'
+    return f"attachment; filename*=utf-8''{quote(filename)}"
+
+
+def file_download(
+    request: Request, path: str, media_type: str, filename: str, content_sha256: str
+) -> Response:
+    """Serve a stored file with a strong ETag (its content hash).
+
+    If-None-Match -> 304; Range / If-Range are handled by FileResponse. With
+    settings.download_offload the route only authorizes: the proxy streams the bytes
+    (and answers Range itself), so no API worker is held during large downloads.
+    """
+    etag = f'"{content_sha256}"'
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return not_modified(etag, cache_control="private, no-cache")
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+    mode = (settings.download_offload or "none").strip().lower()
+    if mode in ("x-accel", "x-sendfile"):
+        target = Path(path).resolve()
+        try:
+            relative = target.relative_to(Path(settings.storage_local_root).resolve())
+        except ValueError:
+            relative = None  # outside the served root: stream it ourselves
+        if relative is not None:
+            headers["Content-Disposition"] = _content_disposition(filename)
+            if mode == "x-accel":
+                prefix = settings.download_offload_prefix.rstrip("/")
+                headers["X-Accel-Redirect"] = f"{prefix}/{quote(relative.as_posix())}"
+            else:
+                headers["X-Sendfile"] = str(target)
+            return Response(status_code=200, media_type=media_type, headers=headers)
+
+    return FileResponse(path, media_type=media_type, filename=filename, headers=headers)
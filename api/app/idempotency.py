@@ -0,0 +1,172 @@
+"""Idempotency-Key support for POST endpoints that create work.
+
+A request carrying `Idempotency-Key` first claims the key (row in idempotency_records,
+keyed by endpoint + user + key). The claimant runs normally and stores its result with
+complete(); a failure releases the key so a retry runs again. A duplicate gets:
+
+- the stored result (replay) when the first request completed. POST /v1/invoices
+  completes in the transaction that creates the jobs: a duplicate attaches to those
+  jobs while the pipeline is still running,
+- 409 + Retry-After, right away, while the first request is still running (no wait
+  on the request path),
+- 422 when the key was used for a different request (fingerprint mismatch).
+
+The DB work is synchronous: async routes go through claim()/to_thread, never on the
+event loop. Expired rows are ignored here and deleted by purge_expired(), which the
+`purge_idempotency_keys` beat task runs every settings.idempotency_purge_interval_s.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+from dataclasses import dataclass
+from datetime import UTC, datetime, timedelta
+from typing import Any
+
+from fastapi import HTTPException, Request
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import IdempotencyRecord
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAY_HEADER = "Idempotent-Replayed"
+
+
+@dataclass
+class Claim:
+    record_id: str
+    # Stored result of the original request (None: this request owns the key)
+    replay: dict[str, Any] | None = None
+
+
+def idempotency_key(request: Request) -> str | None:
+    key = (request.headers.get(IDEMPOTENCY_HEADER) or "").strip()
+    if not key:
+        return None
+    if len(key) > 255:
+        raise HTTPException(status_code=400, detail=f"{IDEMPOTENCY_HEADER} is too long (max 255)")
+    return key
+
+
+def fingerprint(*parts: Any) -> str:
+    return hashlib.sha256("\x1f".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+
+
+def _record_id(endpoint: str, user_id: str | None, key: str) -> str:
+    return fingerprint(endpoint, user_id or "-", key)
+
+
+def _aware(value: datetime | None) -> datetime | None:
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=UTC)
+    return value
+
+
+def purge_expired(db: Session) -> int:
+    """Delete the records past their TTL (periodic purge, off the request path)."""
+    deleted = (
+        db.query(IdempotencyRecord)
+        .filter(IdempotencyRecord.expires_at < datetime.now(UTC))
+        .delete(synchronize_session=False)
+    )
+    db.commit()
+    return deleted
+
+
+def _try_claim(db: Session, endpoint: str, record_id: str, request_fp: str) -> Claim | None:
+    """Claim or replay; None while another request holds the key."""
+    now = datetime.now(UTC)
+    db.add(
+        IdempotencyRecord(
+            id=record_id,
+            endpoint=endpoint,
+            fingerprint=request_fp,
+            status="in_progress",
+            expires_at=now + timedelta(hours=settings.idempotency_ttl_h),
+        )
+    )
+    try:
+        db.commit()
+        return Claim(record_id)
+    except IntegrityError:
+        db.rollback()
+
+    record = db.get(IdempotencyRecord, record_id, populate_existing=True)
+    if record is not None and _aware(record.expires_at) < now:
+        db.delete(record)  # expired, not purged yet: the key is free again
+        db.commit()
+        record = None
+    if record is None:  # released in the meantime
+        return _try_claim(db, endpoint, record_id, request_fp)
+    if record.fingerprint != request_fp:
+        raise HTTPException(
+            status_code=422, detail=f"{IDEMPOTENCY_HEADER} was already used with a different request"
+        )
+    if record.status == "completed":
+        return Claim(record_id, replay=record.response_json)
+    created = _aware(record.created_at)
+    if created is not None and (now - created).total_seconds() > settings.idempotency_stale_s:
+        record.created_at = now  # the first request died without releasing: take over
+        db.commit()
+        return Claim(record_id)
+    return None
+
+
+def _busy() -> HTTPException:
+    return HTTPException(
+        status_code=409,
+        detail="A request with this Idempotency-Key is still in progress",
+        headers={"Retry-After": "5"},
+    )
+
+
+async def claim(db: Session, endpoint: str, user_id: str | None, key: str, request_fp: str) -> Claim:
+    """For async routes: the DB work runs in a thread."""
+    result = await asyncio.to_thread(_try_claim, db, endpoint, _record_id(endpoint, user_id, key), request_fp)
+    if result is None:
+        raise _busy()
+    return result
+
+
+def claim_blocking(db: Session, endpoint: str, user_id: str | None, key: str, request_fp: str) -> Claim:
+    """claim() for sync routes (they run in the threadpool)."""
+    result = _try_claim(db, endpoint, _record_id(endpoint, user_id, key), request_fp)
+    if result is None:
+        raise _busy()
+    return result
+
+
+def complete(db: Session, claim_: Claim, result: dict[str, Any], commit: bool = True) -> None:
+    """Store the result; commit=False stages it in the caller's transaction."""
+    record = db.get(IdempotencyRecord, claim_.record_id)
+    if record is not None:
+        record.status = "completed"
+        record.response_json = result
+    if commit:
+        db.commit()
+
+
+def reclaim(db: Session, claim_: Claim) -> Claim:
+    """Run a completed request again under its key (its stored result is unusable)."""
+    record = db.get(IdempotencyRecord, claim_.record_id)
+    if record is not None:
+        record.status = "in_progress"
+        record.response_json = None
+        record.created_at = datetime.now(UTC)
+        db.commit()
+    return Claim(claim_.record_id)
+
+
+def release(db: Session, claim_: Claim) -> None:
+    """Forget the key (the request failed): a retry will run again.
+
+    A completed result is kept: the work it describes exists.
+    """
+    db.rollback()
+    db.query(IdempotencyRecord).filter(
+        IdempotencyRecord.id == claim_.record_id, IdempotencyRecord.status == "in_progress"
+    ).delete(synchronize_session=False)
+    db.commit()
@@ -1,8 +1,10 @@
 import time
 
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
+from opentelemetry.trace import SpanKind
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 from slowapi.util import get_remote_address
@@ -10,8 +12,11 @@ from sqlalchemy import text
 from sqlalchemy.exc import OperationalError
 
 from app.routes.invoices import router as invoices_router
+from app import events  # noqa: F401  (publishes job status transitions)
 from app.config import settings
-from app.db import Base, engine
+from app.db import Base, engine, upgrade_schema
+from app.metrics import HTTP_REQUEST_DURATION, build_registry, render_latest
+from app.tracing import configure_tracing, extract_http_context, tracer
 
 # Rate limiting configuration
 limiter = Limiter(key_func=get_remote_address, default_limits=["100/minute"])
@@ -30,6 +35,50 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+metrics_registry = build_registry(api=True)
+configure_tracing("pont-facturx-api")
+
+
+@app.middleware("http")
+async def _observe_request(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    # Server span (continues an incoming traceparent); Celery publishes inherit it.
+    with tracer.start_as_current_span(
+        f"{request.method} {request.url.path}",
+        context=extract_http_context(request.headers),
+        kind=SpanKind.SERVER,
+    ) as current:
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            # Endpoint name (e.g. get_invoice), not the raw path: keeps label cardinality bounded.
+            route = request.scope.get("route")
+            route_name = getattr(route, "name", None) or "unmatched"
+            HTTP_REQUEST_DURATION.labels(request.method, route_name, str(status)).observe(
+                time.perf_counter() - start
+            )
+            current.update_name(f"{request.method} {route_name}")
+            current.set_attribute("http.request.method", request.method)
+            current.set_attribute("url.path", request.url.path)
+            current.set_attribute("http.response.status_code", status)
+
+
+@app.middleware("http")
+async def _limit_request_size(request: Request, call_next):
+    # Reject oversized bodies before they are parsed/spooled; chunked uploads without a
+    # Content-Length are capped per file while they are copied (app.storage.store_upload).
+    limit = settings.max_request_mb * 1024 * 1024
+    length = request.headers.get("content-length")
+    if limit and length and length.isdigit() and int(length) > limit:
+        return JSONResponse(
+            status_code=413, content={"detail": f"Request too large (max {settings.max_request_mb} MB)"}
+        )
+    return await call_next(request)
+
+
 # Mini UI (single-page) for human review/correction of final_json
 # Open: http://localhost:8000/ui (or /ui?job_id=<id>)
 app.mount("/ui", StaticFiles(directory="app/static", html=True), name="ui")
@@ -59,6 +108,19 @@ def _startup_db() -> None:
     
     _wait_for_db(timeout_seconds=60, interval_seconds=1.0)
     Base.metadata.create_all(bind=engine)
+    added = upgrade_schema(engine)
+    if added:
+        logger.warning(f"🚀 Schema upgraded, added columns: {added}")
+
+    from app.pipeline.cii_builder import check_cii_templates
+
+    logger.warning(f"🚀 CII templates self-check: {check_cii_templates()}")
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    body, content_type = render_latest(metrics_registry)
+    return Response(content=body, media_type=content_type)
 
 
 @app.get("/health")
@@ -0,0 +1,144 @@
+"""Prometheus metrics shared by the API and the Celery workers.
+
+Multi-process: when PROMETHEUS_MULTIPROC_DIR is set (uvicorn --workers, Celery prefork),
+every process writes its samples to mmap files in that directory and the exporters
+aggregate them at scrape time. Observing a sample only touches the process-local
+value: no cross-process lock, no I/O on the hot path.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+from typing import Any
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.registry import REGISTRY, Collector
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+STAGE_DURATION = Histogram(
+    "pfx_stage_duration_seconds",
+    "Pipeline stage wall time",
+    ["stage", "outcome"],
+    buckets=STAGE_BUCKETS,
+)
+HTTP_REQUEST_DURATION = Histogram(
+    "pfx_http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route", "status"],
+    buckets=STAGE_BUCKETS,
+)
+CACHE_EVENTS = Counter(
+    "pfx_cache_events_total",
+    "Cache lookups (stage checkpoints, output cache)",
+    ["cache", "result"],
+)
+SUBPROCESS_FAILURES = Counter(
+    "pfx_subprocess_failures_total",
+    "External tool failures (ocrmypdf, saxon, verapdf)",
+    ["tool", "reason"],
+)
+JOBS_IN_FLIGHT = Gauge(
+    "pfx_jobs_in_flight",
+    "Celery tasks currently executing",
+    ["task"],
+    multiprocess_mode="livesum",
+)
+
+CELERY_QUEUES = ("invoices", "light", "ocr", "java-validate", "webhooks")
+
+
+def observe_stage(stage: str, wall_s: float, failed: bool = False) -> None:
+    STAGE_DURATION.labels(stage, "failed" if failed else "ok").observe(wall_s)
+
+
+def cache_event(cache: str, hit: bool) -> None:
+    CACHE_EVENTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def subprocess_failure(tool: str, reason: str = "failed") -> None:
+    SUBPROCESS_FAILURES.labels(tool, reason).inc()
+
+
+class QueueDepthCollector(Collector):
+    """Celery queue lengths, read from the Redis broker at scrape time."""
+
+    def collect(self):
+        gauge = GaugeMetricFamily("pfx_celery_queue_depth", "Messages waiting in a Celery queue", labels=["queue"])
+        try:
+            import redis
+
+            client = redis.Redis.from_url(settings.redis_url, socket_timeout=1, socket_connect_timeout=1)
+            for queue in CELERY_QUEUES:
+                gauge.add_metric([queue], client.llen(queue))
+        except Exception as e:
+            logger.info("queue depth scrape failed: %s", e)
+        yield gauge
+
+
+class DbPoolCollector(Collector):
+    """SQLAlchemy pool utilization of the scraped process."""
+
+    def collect(self):
+        from app.db import engine
+
+        pool = engine.pool
+        for name, attr, doc in (
+            ("pfx_db_pool_size", "size", "Configured pool size"),
+            ("pfx_db_pool_checked_out", "checkedout", "Connections in use"),
+            ("pfx_db_pool_overflow", "overflow", "Connections above pool size"),
+            ("pfx_db_pool_checked_in", "checkedin", "Idle connections in the pool"),
+        ):
+            fn = getattr(pool, attr, None)
+            if fn is not None:
+                yield GaugeMetricFamily(name, doc, value=fn())
+
+
+def multiprocess_enabled() -> bool:
+    return bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR") or os.environ.get("prometheus_multiproc_dir"))
+
+
+def build_registry(*, api: bool) -> CollectorRegistry:
+    """Registry to expose: aggregated over processes when multi-process mode is on."""
+    if multiprocess_enabled():
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    if api:
+        for collector in (QueueDepthCollector(), DbPoolCollector()):
+            try:
+                registry.register(collector)
+            except ValueError:
+                pass  # already registered on the global registry
+    return registry
+
+
+def render_latest(registry: CollectorRegistry) -> tuple[bytes, str]:
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid: int) -> None:
+    if multiprocess_enabled():
+        multiprocess.mark_process_dead(pid)
+
+
+def start_worker_exporter(port: int) -> Any:
+    """HTTP exporter for a Celery worker (aggregates its prefork children)."""
+    from prometheus_client import start_http_server
+
+    return start_http_server(port, registry=build_registry(api=False))
@@ -26,6 +26,12 @@ class InvoiceJob(Base):
     input_pdf_url = Column(String, nullable=False)
     output_pdf_url = Column(String, nullable=True)
     output_xml_url = Column(String, nullable=True)
+    # SHA-256 of the uploaded PDF, computed while it is stored
+    input_sha256 = Column(String(64), nullable=True, index=True)
+    # SHA-256 of the canonical (C14N, whitespace-stripped) XML: same value whatever the output mode
+    xml_sha256 = Column(String(64), nullable=True, index=True)
+    # SHA-256 of the Factur-X PDF as stored (download ETag)
+    output_sha256 = Column(String(64), nullable=True)
 
     extracted_json = Column(JSON, nullable=True)
     final_json = Column(JSON, nullable=True)
@@ -33,6 +39,16 @@ class InvoiceJob(Base):
 
     error_message = Column(Text, nullable=True)
 
+    # Per-stage {wall_s, cpu_s, children_cpu_s, peak_rss_mb, children_peak_rss_mb}
+    metrics = Column(JSON, nullable=True)
+
+    # Owner (when uploaded with a bearer token): receives the job's webhooks
+    user_id = Column(String, ForeignKey("users.id"), nullable=True, index=True)
+
+    # Multi-invoice PDFs are split into one child job per invoice; convert-bulk groups
+    # (POST /v1/invoices/convert-bulk) hold one child job per uploaded PDF.
+    parent_job_id = Column(String, ForeignKey("invoice_jobs.id"), nullable=True, index=True)
+
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
     EXTRACTED = "EXTRACTED"
@@ -122,6 +138,9 @@ class ConversionRecord(Base):
     status = Column(String, nullable=False, default="ready")
     pdf_path = Column(String, nullable=False)
     xml_path = Column(String, nullable=True)
+    # SHA-256 of the stored files (download ETags)
+    pdf_sha256 = Column(String(64), nullable=True)
+    xml_sha256 = Column(String(64), nullable=True)
     metadata_json = Column(
         "metadata",
         JSON,
@@ -131,3 +150,42 @@ class ConversionRecord(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     expires_at = Column(DateTime(timezone=True), nullable=True)
 
+
+class WebhookEndpoint(Base):
+    __tablename__ = "webhook_endpoints"
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = Column(String, ForeignKey("users.id"), nullable=False, index=True)
+    url = Column(String, nullable=False)
+    secret = Column(String, nullable=False)  # HMAC-SHA256 signing key
+    # Job statuses to notify (None: VALIDATED, NEEDS_REVIEW and FAILED)
+    events = Column(JSON, nullable=True)
+    active = Column(Boolean, nullable=False, default=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+
+class WebhookDelivery(Base):
+    __tablename__ = "webhook_deliveries"
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    endpoint_id = Column(String, ForeignKey("webhook_endpoints.id"), nullable=False, index=True)
+    event = Column(JSON, nullable=False)
+    status = Column(String, nullable=False, default="pending", index=True)  # pending | delivered | failed
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    delivered_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class IdempotencyRecord(Base):
+    __tablename__ = "idempotency_records"
+
+    # sha256(endpoint, user, Idempotency-Key)
+    id = Column(String(64), primary_key=True)
+    endpoint = Column(String, nullable=False)
+    # sha256 of the meaningful request fields: a reused key with another request is a 422
+    fingerprint = Column(String(64), nullable=False)
+    status = Column(String, nullable=False, default="in_progress")  # in_progress | completed
+    response_json = Column(JSON, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import time
+from collections.abc import Callable
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any
+
+from app.config import settings
+from app.metrics import cache_event
+from app.storage import job_file_path
+
+logger = logging.getLogger(__name__)
+
+# /data/<job_id>/stages.json: {stage: {input_hash, output, duration_s, finished_at}}
+MANIFEST_NAME = "stages.json"
+
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def json_sha256(obj: Any) -> str:
+    return hashlib.sha256(
+        json.dumps(obj, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")
+    ).hexdigest()
+
+
+def inputs_hash(*parts: str) -> str:
+    """Combine the fingerprints of everything a stage reads into one hash."""
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+def load_manifest(job_id: str) -> dict[str, Any]:
+    path = job_file_path(job_id, MANIFEST_NAME)
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        logger.warning("stage manifest for %s is unreadable, ignoring it: %s", job_id, e)
+        return {}
+
+
+def _write_manifest(job_id: str, manifest: dict[str, Any]) -> None:
+    # Write-then-rename: a worker killed mid-write never leaves a truncated manifest.
+    path = job_file_path(job_id, MANIFEST_NAME)
+    tmp = path.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def cached_output(job_id: str, stage: str, input_hash: str) -> str | None:
+    """Output path of a previous run of `stage` with the same inputs, if still on disk."""
+    entry = load_manifest(job_id).get(stage)
+    if not entry or entry.get("input_hash") != input_hash:
+        return None
+    output = entry.get("output")
+    if not output or not Path(output).exists():
+        return None
+    return output
+
+
+def record_stage(job_id: str, stage: str, input_hash: str, output: str, duration_s: float) -> None:
+    manifest = load_manifest(job_id)
+    manifest[stage] = {
+        "input_hash": input_hash,
+        "output": output,
+        "duration_s": round(duration_s, 3),
+        "finished_at": datetime.now(UTC).isoformat(),
+    }
+    _write_manifest(job_id, manifest)
+
+
+def run_checkpointed(job_id: str, stage: str, input_hash: str, fn: Callable[[], str]) -> str:
+    """Run `fn` (which returns the stage output path) unless a checkpoint already covers it.
+
+    A stage is skipped when the manifest holds an entry with the same input hash and
+    its output file still exists; otherwise it runs and its checkpoint is replaced.
+    """
+    if settings.enable_stage_checkpoints:
+        output = cached_output(job_id, stage, input_hash)
+        cache_event("stage_checkpoint", hit=bool(output))
+        if output:
+            logger.info("stage %s for %s resumed from checkpoint: %s", stage, job_id, output)
+            return output
+
+    t0 = time.perf_counter()
+    output = fn()
+    if settings.enable_stage_checkpoints:
+        record_stage(job_id, stage, input_hash, output, time.perf_counter() - t0)
+    return output
@@ -1,13 +1,27 @@
 from __future__ import annotations
 
+import hashlib
+import logging
+import time
+from collections.abc import Callable, Iterable, Iterator
+from dataclasses import dataclass, field
 from datetime import date, datetime
 from pathlib import Path
 from typing import Any
 
-from jinja2 import Environment, FileSystemLoader, select_autoescape
+from jinja2 import BaseLoader, Environment, FileSystemLoader, ModuleLoader, select_autoescape
+
+from app.config import settings
+from app.storage import job_file_path, save_job_file
+
+logger = logging.getLogger(__name__)
 
 TEMPLATES_DIR = Path(__file__).resolve().parents[1] / "templates"
 
+CII_TEMPLATES = ("cii_basic_wl.xml.j2", "cii_en16931.xml.j2")
+
+CII_FILENAME = "factur-x.xml"
+
 
 def _date_to_102(value: Any) -> str:
     """Return date in UN/CEFACT format 102 (YYYYMMDD).
@@ -59,20 +73,59 @@ def _normalize_invoice_for_en16931(invoice: dict[str, Any]) -> dict[str, Any]:
     return _normalize_invoice_base(invoice, include_lines=True)
 
 
-def _normalize_invoice_base(invoice: dict[str, Any], include_lines: bool = False) -> dict[str, Any]:
+def _normalize_invoice_for_en16931_lazy(invoice: dict[str, Any]) -> dict[str, Any]:
+    """Like `_normalize_invoice_for_en16931`, but `lines` is a generator (streaming builder)."""
+    return _normalize_invoice_base(invoice, include_lines=True, lazy_lines=True)
+
+
+def _f(x, default=0.0):
+    if x is None:
+        return float(default)
+    try:
+        return float(x)
+    except Exception:
+        return float(default)
+
+
+def _iter_normalized_lines(
+    lines: Any, total_ht: float, vat_rate: float, vat_category: str
+) -> Iterator[dict[str, Any]]:
+    """Normalize invoice lines one at a time (`lines` may be any iterable)."""
+    empty = True
+    for idx, line in enumerate(lines or [], 1):
+        empty = False
+        line_dict = dict(line or {})
+        line_dict["line_id"] = line_dict.get("line_id") or str(idx)
+        line_dict["description"] = line_dict.get("description") or "Prestation"
+        line_dict["quantity"] = _f(line_dict.get("quantity"), 1.0)
+        line_dict["unit_price"] = _f(line_dict.get("unit_price"), 0.0)
+        line_dict["total"] = _f(line_dict.get("total"), 0.0)
+        line_dict["vat_rate"] = _f(line_dict.get("vat_rate"), vat_rate)
+        line_dict["vat_category"] = line_dict.get("vat_category") or vat_category
+        yield line_dict
+
+    if empty:
+        # EN16931 requires at least one line (BR-16)
+        # Create a synthetic line from totals if none exist
+        yield {
+            "line_id": "1",
+            "description": "Prestation",
+            "quantity": 1.0,
+            "unit_price": total_ht,
+            "total": total_ht,
+            "vat_rate": vat_rate,
+            "vat_category": vat_category,
+        }
+
+
+def _normalize_invoice_base(
+    invoice: dict[str, Any], include_lines: bool = False, lazy_lines: bool = False
+) -> dict[str, Any]:
     """Base normalization logic for all profiles."""
 
     inv = dict(invoice or {})
     totals = dict(inv.get("totals") or {})
 
-    def _f(x, default=0.0):
-        if x is None:
-            return float(default)
-        try:
-            return float(x)
-        except Exception:
-            return float(default)
-
     total_ht = _f(totals.get("total_ht"), 0.0)
     total_vat = _f(totals.get("total_vat"), 0.0)
     total_ttc = totals.get("total_ttc")
@@ -125,74 +178,267 @@ def _normalize_invoice_base(invoice: dict[str, Any], include_lines: bool = False
 
     # Lines: for EN16931/COMFORT profile
     if include_lines:
-        lines = inv.get("lines") or []
-        if not lines:
-            # EN16931 requires at least one line (BR-16)
-            # Create a synthetic line from totals if none exist
-            lines = [
-                {
-                    "description": "Prestation",
-                    "quantity": 1.0,
-                    "unit_price": total_ht,
-                    "total": total_ht,
-                    "vat_rate": vat_rate,
-                    "vat_category": vat_category,
-                }
-            ]
-        # Normalize each line
-        normalized_lines = []
-        for idx, line in enumerate(lines, 1):
-            line_dict = dict(line or {})
-            line_dict["line_id"] = line_dict.get("line_id") or str(idx)
-            line_dict["description"] = line_dict.get("description") or "Prestation"
-            line_dict["quantity"] = _f(line_dict.get("quantity"), 1.0)
-            line_dict["unit_price"] = _f(line_dict.get("unit_price"), 0.0)
-            line_dict["total"] = _f(line_dict.get("total"), 0.0)
-            line_dict["vat_rate"] = _f(line_dict.get("vat_rate"), vat_rate)
-            line_dict["vat_category"] = line_dict.get("vat_category") or vat_category
-            normalized_lines.append(line_dict)
-        inv["lines"] = normalized_lines
+        lines = _iter_normalized_lines(inv.get("lines"), total_ht, vat_rate, vat_category)
+        inv["lines"] = lines if lazy_lines else list(lines)
 
     return inv
 
 
-env = Environment(
-    loader=FileSystemLoader(str(TEMPLATES_DIR)),
-    autoescape=select_autoescape(enabled_extensions=("xml",)),
-)
-env.filters["date102"] = _date_to_102
+def _make_env(loader: BaseLoader) -> Environment:
+    e = Environment(
+        loader=loader,
+        autoescape=select_autoescape(enabled_extensions=("xml",)),
+        # Without auto_reload Jinja does not stat() the template file on every get_template.
+        auto_reload=settings.jinja_auto_reload,
+    )
+    e.filters["date102"] = _date_to_102
+    return e
 
 
-def build_cii_xml(job_id: str, profile: str, invoice: dict[str, Any]) -> str:
-    """Build a CII XML file for a given Factur-X profile.
+def _default_loader() -> BaseLoader:
+    """Prefer templates precompiled at image build time, fall back to the .j2 sources."""
+    compiled = Path(settings.jinja_compiled_templates_dir) if settings.jinja_compiled_templates_dir else None
+    if compiled and compiled.is_dir() and any(compiled.glob("tmpl_*.py")):
+        return ModuleLoader(str(compiled))
+    return FileSystemLoader(str(TEMPLATES_DIR))
 
-    Supports: MINIMUM, BASIC_WL, EN16931
-    """
+
+env = _make_env(_default_loader())
+
+
+def compile_cii_templates(target_dir: str) -> list[str]:
+    """Compile the CII templates to Python modules loadable by `ModuleLoader`."""
+    source_env = _make_env(FileSystemLoader(str(TEMPLATES_DIR)))
+    Path(target_dir).mkdir(parents=True, exist_ok=True)
+    source_env.compile_templates(
+        target_dir, zip=None, filter_func=lambda name: name in CII_TEMPLATES, ignore_errors=False
+    )
+    return sorted(str(p) for p in Path(target_dir).glob("tmpl_*.py"))
+
+
+SAMPLE_INVOICE: dict[str, Any] = {
+    "invoice_number": "SELF-CHECK-1",
+    "issue_date": "2024-01-31",
+    "seller": {"name": "Seller SAS", "address": {"line1": "1 rue A", "postcode": "75001", "city": "Paris"}},
+    "buyer": {"name": "Buyer", "address": {"country": "FR"}},
+    "totals": {"total_ht": 100.0, "total_vat": 20.0, "total_ttc": 120.0},
+    "lines": [{"description": "Prestation", "quantity": 1, "unit_price": 100.0, "total": 100.0}],
+}
+
+SELF_CHECK_PROFILES = ("MINIMUM", "BASIC_WL", "EN16931")
+
+
+def check_cii_templates() -> dict[str, Any]:
+    """Startup self-check: every profile renders well-formed XML with the active loader."""
+    from lxml import etree
+
+    for profile in SELF_CHECK_PROFILES:
+        xml_str = render_cii_xml(profile, SAMPLE_INVOICE)
+        etree.fromstring(xml_str.encode("utf-8"))
+    return {"loader": type(env.loader).__name__, "profiles": list(SELF_CHECK_PROFILES)}
+
+
+def benchmark_cii_templates(iterations: int = 200) -> dict[str, dict[str, float]]:
+    """Cold (fresh Environment) vs warm (cached template) render time per profile, in ms."""
+    global env
+
+    results: dict[str, dict[str, float]] = {}
+    active = env
+    try:
+        for profile in SELF_CHECK_PROFILES:
+            env = _make_env(_default_loader())
+            t0 = time.perf_counter()
+            render_cii_xml(profile, SAMPLE_INVOICE)
+            cold_ms = (time.perf_counter() - t0) * 1000
+
+            t0 = time.perf_counter()
+            for _ in range(iterations):
+                render_cii_xml(profile, SAMPLE_INVOICE)
+            warm_ms = (time.perf_counter() - t0) * 1000 / iterations
+            results[profile] = {"cold_ms": round(cold_ms, 3), "warm_ms": round(warm_ms, 3)}
+    finally:
+        env = active
+    return results
+
+
+def _profile_renderer(profile: str) -> tuple[Callable[[dict[str, Any]], dict[str, Any]], str]:
+    """(normalizer, template name) for a Factur-X profile."""
     profile_norm = (profile or "BASIC_WL").strip().upper()
 
     if profile_norm in ("MINIMUM", "MIN"):
         # MINIMUM uses same structure as BASIC_WL but with minimal data
-        inv = _normalize_invoice_for_basic_wl(invoice)
-        template = env.get_template("cii_basic_wl.xml.j2")
-        xml_str = template.render(invoice=inv)
-    elif profile_norm in ("BASIC_WL", "BASICWL", "BASIC-WL"):
-        inv = _normalize_invoice_for_basic_wl(invoice)
-        template = env.get_template("cii_basic_wl.xml.j2")
-        xml_str = template.render(invoice=inv)
-    elif profile_norm in ("EN16931", "COMFORT"):
-        inv = _normalize_invoice_for_en16931(invoice)
-        template = env.get_template("cii_en16931.xml.j2")
-        xml_str = template.render(invoice=inv)
+        return _normalize_invoice_for_basic_wl, "cii_basic_wl.xml.j2"
+    if profile_norm in ("BASIC_WL", "BASICWL", "BASIC-WL"):
+        return _normalize_invoice_for_basic_wl, "cii_basic_wl.xml.j2"
+    if profile_norm in ("EN16931", "COMFORT"):
+        return _normalize_invoice_for_en16931, "cii_en16931.xml.j2"
+    raise NotImplementedError(f"Profile '{profile}' not implemented. Supported: MINIMUM, BASIC_WL, EN16931.")
+
+
+def validate_profile(profile: str) -> None:
+    """Raise NotImplementedError if no renderer handles `profile`."""
+    _profile_renderer(profile)
+
+
+def render_cii_xml(profile: str, invoice: dict[str, Any]) -> str:
+    """Render the CII XML string for a Factur-X profile (no disk I/O)."""
+    normalize, template_name = _profile_renderer(profile)
+    return env.get_template(template_name).render(invoice=normalize(invoice))
+
+
+def build_cii_xml_many(
+    invoices: Iterable[Any],
+    profile: str,
+    *,
+    validate: bool = False,
+    out_dir: str | None = None,
+) -> Iterator[dict[str, Any]]:
+    """Render many invoices through render_cii (same engine and output mode as the jobs).
+
+    Templates and XSDs are compiled once per process, so the batch stays warm.
+    Per-item failures are reported in the result (`ok: False`) instead of stopping the batch.
+    XML files are written to `out_dir` only when it is given.
+    """
+    validate_profile(profile)  # unknown profile: fail before the first item
+    if validate:
+        from app.pipeline.validate import validate_xml_xsd_inprocess
+    if out_dir:
+        Path(out_dir).mkdir(parents=True, exist_ok=True)
+
+    for index, invoice in enumerate(invoices):
+        if not isinstance(invoice, dict):
+            yield {"index": index, "ok": False, "errors": ["invoice must be a JSON object"]}
+            continue
+        try:
+            cii = render_cii(profile, invoice)
+        except Exception as e:
+            yield {"index": index, "ok": False, "errors": [f"{type(e).__name__}: {e}"]}
+            continue
+
+        item: dict[str, Any] = {"index": index, "ok": True, "xml": cii.text(), "errors": []}
+        if validate:
+            xsd = validate_xml_xsd_inprocess(cii.tree, profile)
+            item["ok"] = xsd["status"] == "ok"
+            item["errors"] = xsd["errors"]
+        if out_dir:
+            path = Path(out_dir) / f"invoice-{index:06d}.xml"
+            path.write_bytes(cii.data)
+            item["path"] = str(path)
+        yield item
+
+
+@dataclass
+class CiiXml:
+    """In-memory CII XML: UTF-8 bytes plus a tree parsed on first access."""
+
+    profile: str
+    data: bytes
+    _tree: Any = field(default=None, repr=False)
+    _sha256: str | None = field(default=None, repr=False)
+
+    @property
+    def sha256(self) -> str:
+        """SHA-256 of the canonical form (independent of the output mode)."""
+        if self._sha256 is None:
+            from app.pipeline.xml_canon import canonical_sha256
+
+            self._sha256 = canonical_sha256(self.data)
+        return self._sha256
+
+    @property
+    def tree(self) -> Any:
+        if self._tree is None:
+            from lxml import etree
+
+            self._tree = etree.fromstring(self.data)
+        return self._tree
+
+    def text(self) -> str:
+        return self.data.decode("utf-8")
+
+
+def _apply_output_mode(cii: CiiXml, mode: str) -> CiiXml:
+    from app.pipeline.xml_canon import canonicalize, minify
+
+    mode = (mode or "pretty").strip().lower()
+    if mode == "minified":
+        data, tree = minify(cii.data)
+        return CiiXml(profile=cii.profile, data=data, _tree=tree)
+    if mode == "c14n":
+        data = canonicalize(cii.data)
+        # The canonical form is what we hash: no need to canonicalize twice.
+        return CiiXml(profile=cii.profile, data=data, _sha256=hashlib.sha256(data).hexdigest())
+    if mode != "pretty":
+        raise ValueError(f"Unknown CII output mode: {mode}")
+    return cii
+
+
+def render_cii(profile: str, invoice: dict[str, Any], output_mode: str | None = None) -> CiiXml:
+    """Render the CII XML for a Factur-X profile in memory (no disk I/O).
+
+    `output_mode` defaults to settings.cii_output_mode (pretty | minified | c14n).
+    """
+    if settings.cii_builder_engine == "lxml":
+        from app.pipeline.cii_tree import render_cii_xml_lxml
+
+        data, tree = render_cii_xml_lxml(profile, invoice)
+        cii = CiiXml(profile=profile, data=data, _tree=tree)
     else:
-        raise NotImplementedError(f"Profile '{profile}' not implemented. Supported: MINIMUM, BASIC_WL, EN16931.")
+        cii = CiiXml(profile=profile, data=render_cii_xml(profile, invoice).encode("utf-8"))
+    return _apply_output_mode(cii, output_mode or settings.cii_output_mode)
+
+
+def persist_cii(job_id: str, cii: CiiXml) -> str:
+    """Write the XML once, through the storage layer. Returns the file path."""
+    return save_job_file(job_id, CII_FILENAME, cii.data)
+
 
-    out_dir = Path("/data") / job_id
-    out_dir.mkdir(parents=True, exist_ok=True)
-    xml_path = out_dir / "factur-x.xml"
-    xml_path.write_text(xml_str, encoding="utf-8")
-    return str(xml_path)
+def should_stream_cii(profile: str, invoice: dict[str, Any]) -> bool:
+    """EN16931 invoices with many (or lazily produced) lines are written incrementally.
+
+    The stream writer is the lxml builder emitting minified XML, so it is only used when
+    that is the configured output (engine lxml, mode minified): the file then matches
+    render_cii() up to serialization details and has the same canonical hash.
+    """
+    if settings.cii_builder_engine != "lxml" or settings.cii_output_mode != "minified":
+        return False
+    if (profile or "").strip().upper() not in ("EN16931", "COMFORT"):
+        return False
+    lines = (invoice or {}).get("lines")
+    if lines is None:
+        return False
+    if not isinstance(lines, (list, tuple)):
+        return True
+    return len(lines) >= settings.cii_stream_min_lines
+
+
+def build_cii_xml(job_id: str, profile: str, invoice: dict[str, Any]) -> str:
+    """Build a CII XML file for a given Factur-X profile.
+
+    Supports: MINIMUM, BASIC_WL, EN16931
+    """
+    if should_stream_cii(profile, invoice):
+        from app.pipeline.cii_tree import write_cii_en16931_stream
+
+        return write_cii_en16931_stream(str(job_file_path(job_id, CII_FILENAME)), invoice)
+    return persist_cii(job_id, render_cii(profile, invoice))
 
 
 # Backward-compatible wrapper
 def build_cii_basic_wl_xml(job_id: str, invoice: dict[str, Any]) -> str:
     return build_cii_xml(job_id, "BASIC_WL", invoice)
+
+
+if __name__ == "__main__":
+    # python -m app.pipeline.cii_builder compile <dir> | check | bench
+    import json
+    import sys
+
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "check"
+    if cmd == "compile":
+        target = sys.argv[2] if len(sys.argv) > 2 else settings.jinja_compiled_templates_dir
+        print("\n".join(compile_cii_templates(target)))
+    elif cmd == "bench":
+        print(json.dumps(benchmark_cii_templates(), indent=2))
+    else:
+        print(json.dumps(check_cii_templates(), indent=2))
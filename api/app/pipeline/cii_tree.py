@@ -0,0 +1,349 @@
+from __future__ import annotations
+
+import time
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Any
+
+from lxml import etree
+
+from app.pipeline.cii_builder import (
+    _date_to_102,
+    _normalize_invoice_for_basic_wl,
+    _normalize_invoice_for_en16931,
+    _normalize_invoice_for_en16931_lazy,
+    render_cii_xml,
+)
+from app.pipeline.xml_canon import strip_whitespace
+
+NS_RSM = "urn:un:unece:uncefact:data:standard:CrossIndustryInvoice:100"
+NS_RAM = "urn:un:unece:uncefact:data:standard:ReusableAggregateBusinessInformationEntity:100"
+NS_UDT = "urn:un:unece:uncefact:data:standard:UnqualifiedDataType:100"
+NSMAP = {"rsm": NS_RSM, "ram": NS_RAM, "udt": NS_UDT}
+
+GUIDELINE_BASIC_WL = "urn:factur-x.eu:1p0:basicwl"
+GUIDELINE_EN16931 = "urn:cen.eu:en16931:2017"
+
+
+def _rsm(name: str) -> str:
+    return f"{{{NS_RSM}}}{name}"
+
+
+def _ram(name: str) -> str:
+    return f"{{{NS_RAM}}}{name}"
+
+
+_SubElement = etree.SubElement
+
+
+def _sub(parent: etree._Element, tag: str, text: Any = None, **attrib: str) -> etree._Element:
+    el = _SubElement(parent, tag, attrib)
+    if text is not None:
+        el.text = str(text)
+    return el
+
+
+def _amount(value: Any) -> str:
+    try:
+        return f"{float(value):.2f}"
+    except (TypeError, ValueError):
+        return "0.00"
+
+
+def _date(parent: etree._Element, tag: str, value: Any) -> None:
+    wrapper = _sub(parent, _ram(tag))
+    _sub(wrapper, f"{{{NS_UDT}}}DateTimeString", _date_to_102(value), format="102")
+
+
+def _party(parent: etree._Element, tag: str, party: dict[str, Any], postcode_tag: str) -> None:
+    node = _sub(parent, _ram(tag))
+    if party.get("id"):
+        _sub(node, _ram("ID"), party.get("id"))
+    _sub(node, _ram("Name"), party.get("name") or "UNKNOWN")
+
+    addr = party.get("address", {})
+    postal = _sub(node, _ram("PostalTradeAddress"))
+    if addr.get("line1"):
+        _sub(postal, _ram("LineOne"), addr.get("line1"))
+    if addr.get("line2"):
+        _sub(postal, _ram("LineTwo"), addr.get("line2"))
+    if addr.get("postcode"):
+        _sub(postal, _ram(postcode_tag), addr.get("postcode"))
+    if addr.get("city"):
+        _sub(postal, _ram("CityName"), addr.get("city"))
+    _sub(postal, _ram("CountryID"), addr.get("country") or "FR")
+
+    if party.get("vat_id"):
+        reg = _sub(node, _ram("SpecifiedTaxRegistration"))
+        _sub(reg, _ram("ID"), party.get("vat_id"), schemeID="VA")
+
+
+def _line_item(parent: etree._Element, line: dict[str, Any], index: int, vat_category: str) -> None:
+    item = _sub(parent, _ram("IncludedSupplyChainTradeLineItem"))
+    doc = _sub(item, _ram("AssociatedDocumentLineDocument"))
+    _sub(doc, _ram("LineID"), line.get("line_id") or index)
+
+    product = _sub(item, _ram("SpecifiedTradeProduct"))
+    _sub(product, _ram("Name"), line.get("description") or "Prestation")
+
+    agreement = _sub(item, _ram("SpecifiedLineTradeAgreement"))
+    unit_price = _amount(line.get("unit_price"))
+    _sub(_sub(agreement, _ram("GrossPriceProductTradePrice")), _ram("ChargeAmount"), unit_price)
+    _sub(_sub(agreement, _ram("NetPriceProductTradePrice")), _ram("ChargeAmount"), unit_price)
+
+    delivery = _sub(item, _ram("SpecifiedLineTradeDelivery"))
+    _sub(delivery, _ram("BilledQuantity"), _amount(line.get("quantity")), unitCode="C62")
+
+    settlement = _sub(item, _ram("SpecifiedLineTradeSettlement"))
+    tax = _sub(settlement, _ram("ApplicableTradeTax"))
+    _sub(tax, _ram("TypeCode"), "VAT")
+    _sub(tax, _ram("CategoryCode"), line.get("vat_category") or vat_category)
+    _sub(tax, _ram("RateApplicablePercent"), _amount(line.get("vat_rate")))
+    summation = _sub(settlement, _ram("SpecifiedTradeSettlementLineMonetarySummation"))
+    _sub(summation, _ram("LineTotalAmount"), _amount(line.get("total")))
+
+
+def _header_values(invoice: dict[str, Any]) -> dict[str, Any]:
+    """Header fallbacks of the templates (`{% set ... %}` block) on a normalized invoice."""
+    totals = invoice.get("totals", {})
+    total_ht = totals.get("total_ht") or 0
+    total_vat = totals.get("total_vat") or 0
+    total_ttc = totals.get("total_ttc")
+    if total_ttc is None:
+        total_ttc = float(total_ht) + float(total_vat)
+    vat_rate = invoice.get("vat_rate") or 0
+    return {
+        "currency": invoice.get("currency") or "EUR",
+        "issue_date": invoice.get("issue_date") or "1970-01-01",
+        "total_ht": total_ht,
+        "total_vat": total_vat,
+        "total_ttc": total_ttc,
+        "vat_rate": vat_rate,
+        "vat_category": invoice.get("vat_category") or ("Z" if float(vat_rate) == 0 else "S"),
+    }
+
+
+def _build_head(root: etree._Element, invoice: dict[str, Any], h: dict[str, Any], *, en16931: bool) -> None:
+    context = _sub(root, _rsm("ExchangedDocumentContext"))
+    guideline = _sub(context, _ram("GuidelineSpecifiedDocumentContextParameter"))
+    _sub(guideline, _ram("ID"), GUIDELINE_EN16931 if en16931 else GUIDELINE_BASIC_WL)
+
+    document = _sub(root, _rsm("ExchangedDocument"))
+    _sub(document, _ram("ID"), invoice.get("invoice_number") or invoice.get("id") or "INV-UNKNOWN")
+    _sub(document, _ram("TypeCode"), "380")
+    _date(document, "IssueDateTime", h["issue_date"])
+
+
+def _build_trailer(
+    transaction: etree._Element, invoice: dict[str, Any], h: dict[str, Any], *, en16931: bool
+) -> None:
+    """Agreement, delivery and settlement: everything after the invoice lines."""
+    postcode_tag = "PostalCodeCode" if en16931 else "LineThree"
+    agreement = _sub(transaction, _ram("ApplicableHeaderTradeAgreement"))
+    _party(agreement, "SellerTradeParty", invoice.get("seller", {}), postcode_tag)
+    _party(agreement, "BuyerTradeParty", invoice.get("buyer", {}), postcode_tag)
+
+    delivery = _sub(transaction, _ram("ApplicableHeaderTradeDelivery"))
+    if en16931:
+        event = _sub(delivery, _ram("ActualDeliverySupplyChainEvent"))
+        _date(event, "OccurrenceDateTime", invoice.get("delivery_date") or h["issue_date"])
+
+    settlement = _sub(transaction, _ram("ApplicableHeaderTradeSettlement"))
+    _sub(settlement, _ram("InvoiceCurrencyCode"), h["currency"])
+
+    tax = _sub(settlement, _ram("ApplicableTradeTax"))
+    _sub(tax, _ram("CalculatedAmount"), _amount(h["total_vat"]))
+    _sub(tax, _ram("TypeCode"), "VAT")
+    _sub(tax, _ram("BasisAmount"), _amount(h["total_ht"]))
+    _sub(tax, _ram("CategoryCode"), h["vat_category"])
+    _sub(tax, _ram("RateApplicablePercent"), _amount(h["vat_rate"]))
+
+    terms = _sub(settlement, _ram("SpecifiedTradePaymentTerms"))
+    if invoice.get("payment_terms"):
+        _sub(terms, _ram("Description"), invoice.get("payment_terms"))
+    if invoice.get("due_date"):
+        _date(terms, "DueDateDateTime", invoice.get("due_date"))
+
+    summation = _sub(settlement, _ram("SpecifiedTradeSettlementHeaderMonetarySummation"))
+    _sub(summation, _ram("LineTotalAmount"), _amount(h["total_ht"]))
+    _sub(summation, _ram("TaxBasisTotalAmount"), _amount(h["total_ht"]))
+    if en16931:
+        _sub(summation, _ram("TaxTotalAmount"), _amount(h["total_vat"]), currencyID=str(h["currency"]))
+    else:
+        _sub(summation, _ram("TaxTotalAmount"), _amount(h["total_vat"]))
+    _sub(summation, _ram("GrandTotalAmount"), _amount(h["total_ttc"]))
+    _sub(summation, _ram("DuePayableAmount"), _amount(h["total_ttc"]))
+
+
+def _build_tree(invoice: dict[str, Any], *, en16931: bool) -> etree._Element:
+    """Mirror of cii_basic_wl.xml.j2 / cii_en16931.xml.j2 on a normalized invoice."""
+    h = _header_values(invoice)
+    root = etree.Element(_rsm("CrossIndustryInvoice"), nsmap=NSMAP)
+    _build_head(root, invoice, h, en16931=en16931)
+
+    transaction = _sub(root, _rsm("SupplyChainTradeTransaction"))
+    if en16931:
+        for index, line in enumerate(invoice.get("lines", []), 1):
+            _line_item(transaction, line, index, h["vat_category"])
+
+    _build_trailer(transaction, invoice, h, en16931=en16931)
+    return root
+
+
+def _write_children(xf: Any, parent: etree._Element) -> None:
+    """Serialize the children of a scratch element through `xf` using its in-scope prefixes."""
+    for el in parent:
+        with xf.element(el.tag, el.attrib):
+            if el.text is not None:
+                xf.write(el.text)
+            _write_children(xf, el)
+
+
+def write_cii_en16931_stream(out_path: str, invoice: dict[str, Any]) -> str:
+    """Stream an EN16931 CII file line by line with `etree.xmlfile`.
+
+    Lines are normalized lazily and each line item is written then dropped, so memory
+    stays flat whatever the line count. `invoice["lines"]` may be any iterable.
+    """
+    inv = _normalize_invoice_for_en16931_lazy(invoice)
+    h = _header_values(inv)
+
+    with etree.xmlfile(out_path, encoding="UTF-8") as xf:
+        xf.write_declaration()
+        with xf.element(_rsm("CrossIndustryInvoice"), nsmap=NSMAP):
+            scratch = etree.Element(_rsm("CrossIndustryInvoice"), nsmap=NSMAP)
+            _build_head(scratch, inv, h, en16931=True)
+            _write_children(xf, scratch)
+
+            with xf.element(_rsm("SupplyChainTradeTransaction")):
+                for index, line in enumerate(inv["lines"], 1):
+                    scratch = etree.Element(_rsm("SupplyChainTradeTransaction"), nsmap=NSMAP)
+                    _line_item(scratch, line, index, h["vat_category"])
+                    _write_children(xf, scratch)
+
+                scratch = etree.Element(_rsm("SupplyChainTradeTransaction"), nsmap=NSMAP)
+                _build_trailer(scratch, inv, h, en16931=True)
+                _write_children(xf, scratch)
+    return out_path
+
+
+def build_cii_tree(profile: str, invoice: dict[str, Any]) -> etree._Element:
+    """Build the CII tree directly with lxml (no template rendering, no reparse)."""
+    profile_norm = (profile or "BASIC_WL").strip().upper()
+
+    if profile_norm in ("MINIMUM", "MIN", "BASIC_WL", "BASICWL", "BASIC-WL"):
+        return _build_tree(_normalize_invoice_for_basic_wl(invoice), en16931=False)
+    if profile_norm in ("EN16931", "COMFORT"):
+        return _build_tree(_normalize_invoice_for_en16931(invoice), en16931=True)
+    raise NotImplementedError(f"Profile '{profile}' not implemented. Supported: MINIMUM, BASIC_WL, EN16931.")
+
+
+def render_cii_xml_lxml(profile: str, invoice: dict[str, Any]) -> tuple[bytes, etree._Element]:
+    """Return (UTF-8 XML bytes, tree) so validators can reuse the tree as is."""
+    root = build_cii_tree(profile, invoice)
+    xml_bytes = etree.tostring(root, xml_declaration=True, encoding="UTF-8")
+    return xml_bytes, root
+
+
+def c14n(xml: bytes | str) -> bytes:
+    """C14N form ignoring whitespace-only text nodes (template indentation) and comments."""
+    if isinstance(xml, str):
+        xml = xml.encode("utf-8")
+    root = etree.fromstring(xml, etree.XMLParser(remove_comments=True))
+    return etree.tostring(strip_whitespace(root), method="c14n")
+
+
+def compare_engines(corpus: list[dict[str, Any]], profiles: tuple[str, ...] = ("MINIMUM", "BASIC_WL", "EN16931")) -> list[dict[str, Any]]:
+    """Return the (profile, index) pairs whose Jinja and lxml outputs differ after C14N."""
+    mismatches = []
+    for profile in profiles:
+        for index, invoice in enumerate(corpus):
+            jinja_c14n = c14n(render_cii_xml(profile, invoice))
+            lxml_c14n = c14n(render_cii_xml_lxml(profile, invoice)[0])
+            if jinja_c14n != lxml_c14n:
+                mismatches.append({"profile": profile, "index": index})
+    return mismatches
+
+
+def benchmark_engines(invoice: dict[str, Any], iterations: int = 500) -> dict[str, dict[str, float]]:
+    """Per-render time in ms: Jinja (+ parse, as validators need a tree) vs lxml builder."""
+    results: dict[str, dict[str, float]] = {}
+    for profile in ("BASIC_WL", "EN16931"):
+        t0 = time.perf_counter()
+        for _ in range(iterations):
+            etree.fromstring(render_cii_xml(profile, invoice).encode("utf-8"))
+        jinja_ms = (time.perf_counter() - t0) * 1000 / iterations
+
+        t0 = time.perf_counter()
+        for _ in range(iterations):
+            render_cii_xml_lxml(profile, invoice)
+        lxml_ms = (time.perf_counter() - t0) * 1000 / iterations
+        results[profile] = {"jinja_parse_ms": round(jinja_ms, 4), "lxml_ms": round(lxml_ms, 4)}
+    return results
+
+
+def benchmark_streaming(line_counts: tuple[int, ...] = (10_000, 100_000)) -> dict[str, dict[str, float]]:
+    """Time and Python peak memory (tracemalloc) of Jinja render+write vs streamed EN16931."""
+    import tempfile
+    import tracemalloc
+
+    def _lines(n: int) -> Iterator[dict[str, Any]]:
+        for i in range(n):
+            yield {"description": f"Article {i}", "quantity": 2, "unit_price": 1.5, "total": 3.0, "vat_rate": 20}
+
+    results: dict[str, dict[str, float]] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        out = str(Path(tmp) / "factur-x.xml")
+        for n in line_counts:
+            header = {"invoice_number": f"BENCH-{n}", "totals": {"total_ht": 3.0 * n, "total_vat": 0.6 * n}}
+
+            tracemalloc.start()
+            t0 = time.perf_counter()
+            Path(out).write_text(render_cii_xml("EN16931", dict(header, lines=list(_lines(n)))), encoding="utf-8")
+            jinja_s = time.perf_counter() - t0
+            jinja_peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            tracemalloc.start()
+            t0 = time.perf_counter()
+            write_cii_en16931_stream(out, dict(header, lines=_lines(n)))
+            stream_s = time.perf_counter() - t0
+            stream_peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            results[f"{n}_lines"] = {
+                "jinja_s": round(jinja_s, 3),
+                "jinja_peak_mb": round(jinja_peak / 2**20, 1),
+                "stream_s": round(stream_s, 3),
+                "stream_peak_mb": round(stream_peak / 2**20, 1),
+            }
+    return results
+
+
+if __name__ == "__main__":
+    # python -m app.pipeline.cii_tree [compare|bench|stream-bench]
+    import json
+    import sys
+
+    from app.pipeline.cii_builder import SAMPLE_INVOICE
+
+    corpus = [
+        SAMPLE_INVOICE,
+        {},
+        {"invoice_number": 42, "issue_date": "31/12/2023", "currency": "USD", "vat_rate": 5.5,
+         "payment_terms": "30 jours", "due_date": "2024-01-30", "delivery_date": "2023-12-15",
+         "seller": {"id": "12345678900011", "name": "A", "vat_id": "FR00123456789",
+                    "address": {"line1": "l1", "line2": "l2", "postcode": "69000", "city": "Lyon", "country": "FR"}},
+         "buyer": {"name": "B", "vat_id": "DE123", "address": "invalid"},
+         "totals": {"total_ht": "1000", "total_vat": None},
+         "lines": [{"description": "x", "quantity": "3", "unit_price": 10, "total": 30, "vat_category": "E"}, None]},
+        {"totals": {"total_ht": 50, "total_vat": 10}, "vat_category": "S"},
+    ]
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "compare"
+    if cmd == "stream-bench":
+        print(json.dumps(benchmark_streaming(), indent=2))
+    elif cmd == "bench":
+        big = dict(SAMPLE_INVOICE, lines=SAMPLE_INVOICE["lines"] * 200)
+        print(json.dumps({"sample": benchmark_engines(SAMPLE_INVOICE), "200_lines": benchmark_engines(big, 20)}, indent=2))
+    else:
+        print(json.dumps({"mismatches": compare_engines(corpus)}, indent=2))
@@ -0,0 +1,224 @@
+from __future__ import annotations
+
+import logging
+from typing import Any
+
+from lxml import etree
+
+from app.pipeline.validate import _facturx_xsd
+
+logger = logging.getLogger(__name__)
+
+# Attachment names used by Factur-X 1.0 and ZUGFeRD 2.x producers. ZUGFeRD 1.x also
+# used zugferd-invoice.xml, but its CrossIndustryDocument root is not parsed here:
+# such files fall back to the regular extraction path.
+EMBEDDED_XML_NAMES = ("factur-x.xml", "zugferd-invoice.xml", "xrechnung.xml")
+
+CII_NS = {
+    "rsm": "urn:un:unece:uncefact:data:standard:CrossIndustryInvoice:100",
+    "ram": "urn:un:unece:uncefact:data:standard:ReusableAggregateBusinessInformationEntity:100",
+    "udt": "urn:un:unece:uncefact:data:standard:UnqualifiedDataType:100",
+}
+
+# GuidelineSpecifiedDocumentContextParameter/ID -> our profile names
+GUIDELINE_TO_PROFILE = {
+    "urn:factur-x.eu:1p0:minimum": "MINIMUM",
+    "urn:factur-x.eu:1p0:basicwl": "BASIC_WL",
+    "urn:cen.eu:en16931:2017#compliant#urn:factur-x.eu:1p0:basic": "BASIC",
+    "urn:cen.eu:en16931:2017": "EN16931",
+    "urn:cen.eu:en16931:2017#conformant#urn:factur-x.eu:1p0:extended": "EXTENDED",
+}
+
+# Profile of an embedded XML -> factur-x library XSD level it is checked against
+PROFILE_TO_XSD_LEVEL = {
+    "MINIMUM": "minimum",
+    "BASIC_WL": "basicwl",
+    "BASIC": "basic",
+    "EN16931": "en16931",
+    "EXTENDED": "extended",
+}
+
+GUIDELINE_PATH = "rsm:ExchangedDocumentContext/ram:GuidelineSpecifiedDocumentContextParameter/ram:ID"
+
+
+def find_embedded_invoice_xml(pdf_path: str) -> tuple[str, bytes] | None:
+    """Return (attachment name, XML bytes) if the PDF already embeds Factur-X/ZUGFeRD XML.
+
+    Best-effort: any pikepdf error means "not a Factur-X PDF" and the caller
+    falls back to the regular extraction path.
+    """
+    try:
+        import pikepdf
+
+        with pikepdf.open(pdf_path) as pdf:
+            for name, spec in pdf.attachments.items():
+                candidates = {(name or "").lower(), (spec.filename or "").lower()}
+                if not candidates.intersection(EMBEDDED_XML_NAMES):
+                    continue
+                return name, spec.get_file().read_bytes()
+    except Exception as e:
+        logger.info("embedded XML lookup failed for %s: %s", pdf_path, e)
+    return None
+
+
+def is_pdfa3(pdf_path: str) -> bool:
+    """True if the XMP metadata declares PDF/A-3 (any conformance level)."""
+    try:
+        import pikepdf
+
+        with pikepdf.open(pdf_path) as pdf:
+            meta = pdf.open_metadata(set_pikepdf_as_editor=False, update_docinfo=False)
+            return (meta.pdfa_status or "").startswith("3")
+    except Exception:
+        return False
+
+
+def embedded_xml_is_valid(xml_bytes: bytes) -> bool:
+    """True if the XML is a CII invoice whose guideline ID we know and it passes that XSD."""
+    try:
+        root = etree.fromstring(xml_bytes, parser=etree.XMLParser(resolve_entities=False))
+    except etree.XMLSyntaxError:
+        return False
+    if etree.QName(root).localname != "CrossIndustryInvoice":
+        return False
+    level = PROFILE_TO_XSD_LEVEL.get(GUIDELINE_TO_PROFILE.get(_text(root, GUIDELINE_PATH) or ""))
+    return level is not None and _facturx_xsd(level).validate(root)
+
+
+def can_skip_pdfa(pdf_path: str, embedded: tuple[str, bytes] | None = None) -> bool:
+    """True if the PDF/A-3 pass can be skipped: the PDF embeds a Factur-X/ZUGFeRD XML
+    that passes its XSD and its XMP declares PDF/A-3.
+
+    `embedded` is the find_embedded_invoice_xml() result when the caller already has it.
+    The XMP claim alone is not enough: a plain PDF/A-3 still needs the OCR pass.
+    """
+    if embedded is None:
+        embedded = find_embedded_invoice_xml(pdf_path)
+    return bool(embedded) and embedded_xml_is_valid(embedded[1]) and is_pdfa3(pdf_path)
+
+
+def _text(node: Any, path: str) -> str | None:
+    found = node.xpath(f"string({path})", namespaces=CII_NS)
+    s = (found or "").strip()
+    return s or None
+
+
+def _amount(node: Any, path: str) -> float | None:
+    raw = _text(node, path)
+    if raw is None:
+        return None
+    try:
+        return float(raw)
+    except ValueError:
+        return None
+
+
+def _date_102_to_iso(raw: str | None) -> str | None:
+    if raw and len(raw) == 8 and raw.isdigit():
+        return f"{raw[0:4]}-{raw[4:6]}-{raw[6:8]}"
+    return raw
+
+
+def _party(node: Any) -> dict[str, Any]:
+    return {
+        "id": _text(node, "ram:ID"),
+        "name": _text(node, "ram:Name") or "UNKNOWN",
+        "siret": _text(node, "ram:SpecifiedLegalOrganization/ram:ID"),
+        "scheme_id": _text(node, "ram:SpecifiedLegalOrganization/ram:ID/@schemeID") or "0002",
+        "vat_id": _text(node, "ram:SpecifiedTaxRegistration/ram:ID[@schemeID='VA']"),
+        "address": {
+            "line1": _text(node, "ram:PostalTradeAddress/ram:LineOne"),
+            "line2": _text(node, "ram:PostalTradeAddress/ram:LineTwo"),
+            "postcode": _text(node, "ram:PostalTradeAddress/ram:PostcodeCode")
+            or _text(node, "ram:PostalTradeAddress/ram:PostalCodeCode")
+            or _text(node, "ram:PostalTradeAddress/ram:LineThree"),
+            "city": _text(node, "ram:PostalTradeAddress/ram:CityName"),
+            "country": _text(node, "ram:PostalTradeAddress/ram:CountryID") or "FR",
+        },
+    }
+
+
+def cii_xml_to_final_json(job_id: str, xml_bytes: bytes) -> dict[str, Any]:
+    """Map an embedded CII XML into the canonical invoice JSON (same shape as extract)."""
+    root = etree.fromstring(xml_bytes, parser=etree.XMLParser(resolve_entities=False))
+    if etree.QName(root).localname != "CrossIndustryInvoice":
+        raise ValueError(f"Unsupported embedded XML root: {etree.QName(root).localname}")
+
+    agreement = "rsm:SupplyChainTradeTransaction/ram:ApplicableHeaderTradeAgreement"
+    settlement = "rsm:SupplyChainTradeTransaction/ram:ApplicableHeaderTradeSettlement"
+    summation = f"{settlement}/ram:SpecifiedTradeSettlementHeaderMonetarySummation"
+
+    seller_nodes = root.xpath(f"{agreement}/ram:SellerTradeParty", namespaces=CII_NS)
+    buyer_nodes = root.xpath(f"{agreement}/ram:BuyerTradeParty", namespaces=CII_NS)
+
+    total_ht = _amount(root, f"{summation}/ram:TaxBasisTotalAmount") or 0.0
+    total_vat = _amount(root, f"{summation}/ram:TaxTotalAmount") or 0.0
+    total_ttc = _amount(root, f"{summation}/ram:GrandTotalAmount")
+    if total_ttc is None:
+        total_ttc = total_ht + total_vat
+
+    lines = []
+    for item in root.xpath(
+        "rsm:SupplyChainTradeTransaction/ram:IncludedSupplyChainTradeLineItem", namespaces=CII_NS
+    ):
+        lines.append(
+            {
+                "line_id": _text(item, "ram:AssociatedDocumentLineDocument/ram:LineID"),
+                "description": _text(item, "ram:SpecifiedTradeProduct/ram:Name"),
+                "quantity": _amount(item, "ram:SpecifiedLineTradeDelivery/ram:BilledQuantity"),
+                "unit_price": _amount(
+                    item, "ram:SpecifiedLineTradeAgreement/ram:NetPriceProductTradePrice/ram:ChargeAmount"
+                ),
+                "total": _amount(
+                    item,
+                    "ram:SpecifiedLineTradeSettlement/ram:SpecifiedTradeSettlementLineMonetarySummation/ram:LineTotalAmount",
+                ),
+                "vat_rate": _amount(
+                    item, "ram:SpecifiedLineTradeSettlement/ram:ApplicableTradeTax/ram:RateApplicablePercent"
+                ),
+                "vat_category": _text(
+                    item, "ram:SpecifiedLineTradeSettlement/ram:ApplicableTradeTax/ram:CategoryCode"
+                ),
+            }
+        )
+
+    guideline = _text(root, GUIDELINE_PATH)
+
+    invoice: dict[str, Any] = {
+        "job_id": job_id,
+        "invoice_number": _text(root, "rsm:ExchangedDocument/ram:ID") or "INV-UNKNOWN",
+        "issue_date": _date_102_to_iso(
+            _text(root, "rsm:ExchangedDocument/ram:IssueDateTime/udt:DateTimeString")
+        )
+        or "1970-01-01",
+        "currency": _text(root, f"{settlement}/ram:InvoiceCurrencyCode") or "EUR",
+        "seller": _party(seller_nodes[0]) if seller_nodes else _party(etree.Element("empty")),
+        "buyer": _party(buyer_nodes[0]) if buyer_nodes else _party(etree.Element("empty")),
+        "totals": {
+            "total_ht": total_ht,
+            "total_vat": total_vat,
+            "total_ttc": total_ttc,
+            "vat_rate": _amount(root, f"{settlement}/ram:ApplicableTradeTax/ram:RateApplicablePercent"),
+        },
+        "vat_category": _text(root, f"{settlement}/ram:ApplicableTradeTax/ram:CategoryCode"),
+        "iban": _text(
+            root,
+            f"{settlement}/ram:SpecifiedTradeSettlementPaymentMeans/ram:PayeePartyCreditorFinancialAccount/ram:IBANID",
+        ),
+        "bic": _text(
+            root,
+            f"{settlement}/ram:SpecifiedTradeSettlementPaymentMeans/ram:PayeeSpecifiedCreditorFinancialInstitution/ram:BICID",
+        ),
+        "due_date": _date_102_to_iso(
+            _text(root, f"{settlement}/ram:SpecifiedTradePaymentTerms/ram:DueDateDateTime/udt:DateTimeString")
+        ),
+        "payment_terms": _text(root, f"{settlement}/ram:SpecifiedTradePaymentTerms/ram:Description"),
+        "_debug": {
+            "source": "embedded_xml",
+            "guideline": guideline,
+            "profile": GUIDELINE_TO_PROFILE.get(guideline or ""),
+        },
+    }
+    if lines:
+        invoice["lines"] = lines
+    return invoice
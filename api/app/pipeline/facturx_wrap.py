@@ -1,14 +1,14 @@
 from pathlib import Path
 
 
-def wrap_facturx(job_id: str, input_pdf_path: str, xml_path: str, profile: str = "basic") -> str:
+def wrap_facturx(job_id: str, input_pdf_path: str, xml: str | bytes, profile: str = "basic") -> str:
     """Create a Factur-X PDF from input PDF + XML.
 
     This uses the `factur-x` Python library.
     Args:
         job_id: Unique job identifier
         input_pdf_path: Path to input PDF (should be PDF/A-3 compliant)
-        xml_path: Path to Factur-X XML file
+        xml: Path to Factur-X XML file, or the XML bytes themselves (no disk round-trip)
         profile: Factur-X profile level (minimum, basic, basicwl, en16931, comfort, extended)
     
     Returns:
@@ -37,7 +37,7 @@ def wrap_facturx(job_id: str, input_pdf_path: str, xml_path: str, profile: str =
 
         generate_facturx_from_file(
             input_pdf_path, 
-            xml_path, 
+            xml,
             facturx_level=facturx_level,
             output_pdf_file=str(output_pdf)
         )
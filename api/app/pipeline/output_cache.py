@@ -0,0 +1,173 @@
+"""Output cache of convert-direct.
+
+The same PDF, mapped invoice data and profile always give the same Factur-X, so the
+result is stored under <storage root>/cache/convert/<key[:2]>/<key>/:
+
+    facturx.pdf     the output PDF
+    result.json     {profile, xml, xml_sha256, validation, metrics, created_at}
+
+The key covers the input PDF hash, the canonical mapped invoice JSON, the profile and
+every setting that changes the output (PIPELINE_VERSION: bump it when the pipeline
+output changes). Entries are published with a rename, so the API replicas sharing the
+volume can read and fill the cache concurrently. Lookups touch result.json; past
+settings.convert_cache_max_mb the least recently used entries are evicted.
+
+PDFs are hard-linked (copied only across filesystems) both ways: a request serves its
+own link, which eviction by any replica cannot pull from under it, and storing an
+entry does not duplicate the job's output on disk.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any
+
+from app.config import settings
+from app.metrics import cache_event
+from app.pipeline.checkpoint import inputs_hash, json_sha256
+
+logger = logging.getLogger(__name__)
+
+# Bump when the XML builder, PDF/A conversion or wrapping output changes
+PIPELINE_VERSION = "1"
+
+PDF_NAME = "facturx.pdf"
+RESULT_NAME = "result.json"
+
+_last_prune = 0.0
+
+
+def cache_root() -> Path:
+    return Path(settings.storage_local_root) / "cache" / "convert"
+
+
+def cache_key(pdf_sha256: str, mapped: dict[str, Any], profile: str) -> str:
+    return inputs_hash(
+        PIPELINE_VERSION,
+        pdf_sha256,
+        json_sha256(mapped),
+        profile,
+        settings.cii_builder_engine,
+        settings.cii_output_mode,
+        str(settings.enable_pdfa_convert),
+    )
+
+
+def _entry_dir(key: str) -> Path:
+    return cache_root() / key[:2] / key
+
+
+def _link_or_copy(src: Path | str, dst: Path | str) -> None:
+    try:
+        os.link(src, dst)
+    except OSError as e:
+        if isinstance(e, FileNotFoundError):
+            raise
+        shutil.copyfile(src, dst)  # other filesystem, or no hard links there
+
+
+def lookup(key: str, out_pdf_path: str) -> dict[str, Any] | None:
+    """Stored result, its PDF linked at `out_pdf_path` (owned by the caller), or None.
+
+    A hit refreshes the entry (LRU).
+    """
+    if not settings.enable_convert_cache:
+        return None
+    entry = _entry_dir(key)
+    try:
+        result = json.loads((entry / RESULT_NAME).read_text(encoding="utf-8"))
+        Path(out_pdf_path).parent.mkdir(parents=True, exist_ok=True)
+        _link_or_copy(entry / PDF_NAME, out_pdf_path)  # FileNotFoundError: evicted meanwhile
+        os.utime(entry / RESULT_NAME)
+    except FileNotFoundError:
+        cache_event("convert_output", hit=False)
+        return None
+    except Exception as e:
+        logger.warning(f"⚠️ convert cache entry {key} is unreadable, ignoring it: {e}")
+        cache_event("convert_output", hit=False)
+        return None
+    cache_event("convert_output", hit=True)
+    return {**result, "out_pdf_path": str(out_pdf_path)}
+
+
+def store(key: str, pdf_path: str, result: dict[str, Any]) -> None:
+    """Add the output to the cache (hard link to `pdf_path`); failures are only logged."""
+    if not settings.enable_convert_cache:
+        return
+    entry = _entry_dir(key)
+    tmp = entry.parent / f".{key}.{uuid.uuid4().hex}.tmp"
+    try:
+        tmp.mkdir(parents=True)
+        _link_or_copy(pdf_path, tmp / PDF_NAME)
+        payload = {**result, "created_at": datetime.now(UTC).isoformat()}
+        (tmp / RESULT_NAME).write_text(json.dumps(payload), encoding="utf-8")
+        try:
+            os.rename(tmp, entry)
+        except OSError:
+            # Another request (or replica) stored the same key first: keep theirs
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+    except Exception as e:
+        shutil.rmtree(tmp, ignore_errors=True)
+        logger.warning(f"⚠️ convert cache: entry {key} not stored: {e}")
+        return
+    maybe_prune()
+
+
+def maybe_prune() -> None:
+    """prune(), at most once per settings.convert_cache_prune_interval_s in this process."""
+    global _last_prune
+    now = time.monotonic()
+    if _last_prune and now - _last_prune < settings.convert_cache_prune_interval_s:
+        return
+    _last_prune = now
+    try:
+        prune()
+    except Exception as e:
+        logger.warning(f"⚠️ convert cache prune failed: {e}")
+
+
+def _entry_size(entry: Path) -> int:
+    return sum(f.stat().st_size for f in entry.iterdir() if f.is_file())
+
+
+def prune(max_bytes: int | None = None) -> int:
+    """Evict least recently used entries until the cache fits in `max_bytes`; returns the count."""
+    limit = settings.convert_cache_max_mb * 1024 * 1024 if max_bytes is None else max_bytes
+    root = cache_root()
+    if not root.is_dir():
+        return 0
+
+    entries = []
+    total = 0
+    for shard in root.iterdir():
+        if not shard.is_dir():
+            continue
+        for entry in shard.iterdir():
+            if entry.name.startswith("."):
+                continue  # being written
+            try:
+                used = (entry / RESULT_NAME).stat().st_mtime
+                size = _entry_size(entry)
+            except FileNotFoundError:
+                continue  # evicted concurrently
+            entries.append((used, size, entry))
+            total += size
+
+    evicted = 0
+    for _used, size, entry in sorted(entries, key=lambda e: e[0]):
+        if total <= limit:
+            break
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= size
+        evicted += 1
+    if evicted:
+        logger.info("convert cache: evicted %d entries, %d bytes left", evicted, total)
+    return evicted
@@ -4,6 +4,9 @@ import logging
 import subprocess
 from pathlib import Path
 
+from app.metrics import subprocess_failure
+from app.tracing import tool_span
+
 logger = logging.getLogger(__name__)
 
 
@@ -34,22 +37,26 @@ def ensure_pdfa3(input_pdf: str, output_pdf: str) -> str:
     
     try:
         logger.info(f"Running ocrmypdf: {' '.join(cmd)}")
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            check=True,
-            timeout=600,  # 10 minutes max
-        )
+        with tool_span("ocrmypdf", cmd) as current:
+            result = subprocess.run(
+                cmd,
+                capture_output=True,
+                text=True,
+                check=True,
+                timeout=600,  # 10 minutes max
+            )
+            current.set_attribute("process.exit_code", result.returncode)
         logger.info(f"ocrmypdf stdout: {result.stdout}")
         if result.stderr:
             logger.warning(f"ocrmypdf stderr: {result.stderr}")
     except subprocess.CalledProcessError as e:
+        subprocess_failure("ocrmypdf")
         logger.error(f"ocrmypdf failed with exit code {e.returncode}")
         logger.error(f"stdout: {e.stdout}")
         logger.error(f"stderr: {e.stderr}")
         raise RuntimeError(f"ocrmypdf PDF/A-3 conversion failed: {e.stderr}")
     except subprocess.TimeoutExpired:
+        subprocess_failure("ocrmypdf", "timeout")
         raise RuntimeError("ocrmypdf timed out after 10 minutes")
     except Exception as e:
         raise RuntimeError(f"ocrmypdf PDF/A-3 conversion failed: {e}")
@@ -5,11 +5,15 @@ import os
 import subprocess
 import tempfile
 from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
 from typing import Any
 
 from lxml import etree
 
+from app.metrics import subprocess_failure
+from app.tracing import tool_span
+
 SVRL_NS = "http://purl.oclc.org/dsdl/svrl"
 NSMAP = {"svrl": SVRL_NS}
 
@@ -22,6 +26,12 @@ class SchematronIssue:
     text: str
 
 
+@lru_cache(maxsize=4)
+def _compiled_xslt(xslt_path: str) -> etree.XSLT:
+    """Compile a stylesheet once per worker process (EN16931 XSLTs are large)."""
+    return etree.XSLT(etree.parse(xslt_path))
+
+
 def _find_cii_xslt(validators_root: str) -> str | None:
     root = Path(validators_root)
     # Prefer preprocessed compiled XSLT if present; fall back to any EN16931 CII xslt/xsl
@@ -40,10 +50,13 @@ def _find_cii_xslt(validators_root: str) -> str | None:
     return None
 
 
-def run_en16931_cii_schematron(xml_path: str, validators_root: str) -> dict[str, Any]:
+def run_en16931_cii_schematron(
+    xml_path: str, validators_root: str, xml_doc: Any | None = None
+) -> dict[str, Any]:
     """Validate a CII XML with EN16931 Schematron (ConnectingEurope artefacts).
 
     This runs the pre-compiled XSLT that outputs an SVRL report, then extracts failed assertions.
+    `xml_doc` is an already parsed tree (e.g. from the lxml builder) to skip re-parsing the file.
     """
     xslt_path = _find_cii_xslt(validators_root)
     if not xslt_path:
@@ -79,10 +92,9 @@ def run_en16931_cii_schematron(xml_path: str, validators_root: str) -> dict[str,
         }
 
     def _run_with_lxml() -> dict[str, Any]:
-        xml_doc = etree.parse(str(xml_path))
-        xslt_doc = etree.parse(str(xslt_path))
-        transform = etree.XSLT(xslt_doc)
-        svrl = transform(xml_doc)
+        doc = xml_doc if xml_doc is not None else etree.parse(str(xml_path))
+        transform = _compiled_xslt(str(xslt_path))
+        svrl = transform(doc)
         return _extract_issues(svrl)
 
     def _run_with_saxon() -> dict[str, Any]:
@@ -115,8 +127,11 @@ def run_en16931_cii_schematron(xml_path: str, validators_root: str) -> dict[str,
                 f"-xsl:{xslt_path}",
                 f"-o:{str(out_path)}",
             ]
-            proc = subprocess.run(cmd, capture_output=True, text=True)
+            with tool_span("saxon", cmd) as current:
+                proc = subprocess.run(cmd, capture_output=True, text=True)
+                current.set_attribute("process.exit_code", proc.returncode)
             if proc.returncode != 0 or not out_path.exists():
+                subprocess_failure("saxon")
                 return {
                     "status": "error",
                     "reason": "saxon_failed",
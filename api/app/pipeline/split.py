@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import logging
+import re
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# "Page 1/3", "Page 1 sur 3", "p. 1 / 3", "page 1 of 3" (bare "1/3" is too common: quantities, dates)
+PAGE_MARKER_RE = re.compile(
+    r"\b(?:page|p\.)\s*(\d{1,3})\s*(?:/|sur|of)\s*(\d{1,3})\b",
+    re.IGNORECASE,
+)
+# "Facture N° F-2024-001", "Invoice #123", "Invoice number: 42", "Facture : A12": the label
+# is required, so "facture du 12/03/2024" or a bare "N° 123" reference do not count.
+INVOICE_NUMBER_RE = re.compile(
+    r"\b(?:facture|invoice)\s*(?:n[°o]\.?|num[ée]ro|number|#|:)\s*[:\-]?\s*"
+    r"([A-Z0-9][A-Z0-9\-_/]*\d[A-Z0-9\-_/]*)",
+    re.IGNORECASE,
+)
+
+
+def _pages_text(pdf_path: str) -> list[str]:
+    """Per-page text (pdfminer). Empty strings for pages without a text layer."""
+    try:
+        from pdfminer.high_level import extract_pages
+        from pdfminer.layout import LTTextContainer
+    except Exception:
+        return []
+
+    pages: list[str] = []
+    try:
+        for layout in extract_pages(pdf_path):
+            pages.append(
+                "".join(el.get_text() for el in layout if isinstance(el, LTTextContainer))
+            )
+    except Exception as e:
+        logger.info("split: text extraction failed for %s: %s", pdf_path, e)
+        return []
+    return pages
+
+
+def _page_marker(text: str) -> tuple[int, int] | None:
+    for m in PAGE_MARKER_RE.finditer(text):
+        cur, total = int(m.group(1)), int(m.group(2))
+        if 1 <= cur <= total:
+            return cur, total
+    return None
+
+
+def _invoice_number(text: str) -> str | None:
+    m = INVOICE_NUMBER_RE.search(text)
+    return m.group(1).strip().upper() if m else None
+
+
+def detect_invoice_boundaries(pdf_path: str) -> list[tuple[int, int]]:
+    """Return 0-based inclusive page ranges, one per invoice found in the PDF.
+
+    A new invoice starts only on a page that both says "page 1/n" and carries an
+    invoice number different from the one of the invoice in progress: either signal
+    alone shows up in ordinary single invoices (repeated "Page 1" headers, references
+    to other invoices). Other pages stay with the previous invoice. A single range
+    means "do not split".
+    """
+    pages = _pages_text(pdf_path)
+    if len(pages) <= 1:
+        return [(0, max(len(pages) - 1, 0))]
+
+    starts = [0]
+    current_number = _invoice_number(pages[0])
+    for idx in range(1, len(pages)):
+        text = pages[idx]
+        marker = _page_marker(text)
+        number = _invoice_number(text)
+
+        first_page = marker is not None and marker[0] == 1
+        if first_page and number and current_number and number != current_number:
+            starts.append(idx)
+            current_number = number
+        elif number and not current_number:
+            current_number = number
+
+    ends = [s - 1 for s in starts[1:]] + [len(pages) - 1]
+    return list(zip(starts, ends))
+
+
+def split_pdf(pdf_path: str, ranges: list[tuple[int, int]], out_paths: list[str]) -> list[str]:
+    """Write each page range of `pdf_path` to the matching path in `out_paths`."""
+    import pikepdf
+
+    if len(ranges) != len(out_paths):
+        raise ValueError("ranges and out_paths must have the same length")
+
+    with pikepdf.open(pdf_path) as src:
+        for (start, end), out in zip(ranges, out_paths):
+            dst = pikepdf.new()
+            dst.pages.extend(src.pages[start : end + 1])
+            Path(out).parent.mkdir(parents=True, exist_ok=True)
+            dst.save(out)
+    return out_paths
@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import resource
+import sys
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import Any
+
+from app.metrics import observe_stage
+from app.tracing import set_attributes, span
+
+# ru_maxrss is in KiB on Linux, bytes on macOS
+_MAXRSS_TO_MB = 1 / (1024 * 1024) if sys.platform == "darwin" else 1 / 1024
+
+
+@contextmanager
+def measure_stage(metrics: dict[str, Any], stage: str, **attributes: Any) -> Iterator[None]:
+    """Record wall time, CPU time and peak RSS of a pipeline stage into `metrics[stage]`.
+
+    - cpu_s: CPU of the current thread (stages run on one thread; the API shares its process).
+    - children_cpu_s: RUSAGE_CHILDREN delta, i.e. ocrmypdf/ghostscript, java (Saxon), veraPDF
+      subprocesses waited for during the stage. In the API process, concurrent requests'
+      subprocesses can leak into this figure.
+    - peak_rss_mb / children_peak_rss_mb: high-water marks at the end of the stage (the
+      kernel keeps no per-stage peak); children_peak_rss_mb is the largest child so far.
+
+    Failed stages are recorded too, with `failed: true`. The stage is also a trace span
+    (`stage.<name>`, with `attributes` and the figures above).
+    """
+    with span(f"stage.{stage}", **attributes) as current:
+        children0 = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu0 = time.thread_time()
+        wall0 = time.perf_counter()
+        failed = False
+        try:
+            yield
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            wall = time.perf_counter() - wall0
+            cpu = time.thread_time() - cpu0
+            children = resource.getrusage(resource.RUSAGE_CHILDREN)
+            own = resource.getrusage(resource.RUSAGE_SELF)
+            entry: dict[str, Any] = {
+                "wall_s": round(wall, 4),
+                "cpu_s": round(cpu, 4),
+                "children_cpu_s": round(
+                    (children.ru_utime - children0.ru_utime) + (children.ru_stime - children0.ru_stime),
+                    4,
+                ),
+                "peak_rss_mb": round(own.ru_maxrss * _MAXRSS_TO_MB, 1),
+                "children_peak_rss_mb": round(children.ru_maxrss * _MAXRSS_TO_MB, 1),
+            }
+            if failed:
+                entry["failed"] = True
+            metrics[stage] = entry
+            observe_stage(stage, wall, failed)
+            set_attributes(current, entry)
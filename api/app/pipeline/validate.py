@@ -2,11 +2,48 @@ from __future__ import annotations
 
 import shutil
 import subprocess
+from functools import cache
 from pathlib import Path
 from typing import Any
 
+from lxml import etree
+
 from app.config import settings
+from app.metrics import subprocess_failure
 from app.pipeline.schematron import run_en16931_cii_schematron
+from app.tracing import tool_span
+
+# Our profile names -> factur-x library XSD levels.
+# MINIMUM is rendered with the BASIC WL template (and guideline ID), so it follows that XSD.
+PROFILE_TO_XSD_LEVEL = {
+    "MINIMUM": "basicwl",
+    "BASIC_WL": "basicwl",
+    "EN16931": "en16931",
+    "COMFORT": "en16931",
+    "EXTENDED": "extended",
+}
+
+
+@cache
+def _facturx_xsd(level: str) -> etree.XMLSchema:
+    """Compile (once per process) the official XSD shipped with the factur-x library."""
+    import facturx
+    from facturx.facturx import FACTURX_LEVEL2xsd
+
+    xsd_path = Path(facturx.__file__).parent / "xsd_and_schematron" / FACTURX_LEVEL2xsd[level]
+    return etree.XMLSchema(etree.parse(str(xsd_path)))
+
+
+def validate_xml_xsd_inprocess(xml: bytes | Any, profile: str = "BASIC_WL") -> dict[str, Any]:
+    """Validate XML bytes (or a parsed tree) against the cached Factur-X XSD, without a subprocess."""
+    level = PROFILE_TO_XSD_LEVEL.get((profile or "BASIC_WL").strip().upper(), "basicwl")
+    schema = _facturx_xsd(level)
+    doc = etree.fromstring(xml) if isinstance(xml, bytes) else xml
+    ok = schema.validate(doc)
+    return {
+        "status": "ok" if ok else "failed",
+        "errors": [f"line {e.line}: {e.message}" for e in schema.error_log] if not ok else [],
+    }
 
 
 def validate_xml_xsd(xml_path: str) -> dict[str, Any]:
@@ -22,7 +59,9 @@ def validate_xml_xsd(xml_path: str) -> dict[str, Any]:
             "hint": "Ensure factur-x is installed in the worker image",
         }
 
-    proc = subprocess.run([bin_path, xml_path], capture_output=True, text=True)
+    with tool_span("facturx-xmlcheck", [bin_path, xml_path]) as current:
+        proc = subprocess.run([bin_path, xml_path], capture_output=True, text=True)
+        current.set_attribute("process.exit_code", proc.returncode)
     ok = proc.returncode == 0
     return {
         "status": "ok" if ok else "failed",
@@ -32,7 +71,9 @@ def validate_xml_xsd(xml_path: str) -> dict[str, Any]:
     }
 
 
-def validate_xml_schematron(xml_path: str, profile: str = "BASIC_WL") -> dict[str, Any]:
+def validate_xml_schematron(
+    xml_path: str, profile: str = "BASIC_WL", xml_doc: Any | None = None
+) -> dict[str, Any]:
     """Validate XML with EN16931 Schematron.
     
     For MINIMUM/BASIC_WL: validation is informational (errors expected and tolerated).
@@ -44,7 +85,7 @@ def validate_xml_schematron(xml_path: str, profile: str = "BASIC_WL") -> dict[st
     profile_norm = (profile or "BASIC_WL").strip().upper()
     is_strict = profile_norm in ("EN16931", "COMFORT", "EXTENDED")
     
-    result = run_en16931_cii_schematron(xml_path, settings.en16931_validators_root)
+    result = run_en16931_cii_schematron(xml_path, settings.en16931_validators_root, xml_doc)
     
     # For non-strict profiles, mark as "info" even if errors exist
     if not is_strict and result.get("status") == "failed":
@@ -63,7 +104,9 @@ def validate_pdfa_verapdf(pdf_path: str) -> dict[str, Any]:
 
     # Try JSON output first; fall back to default if the option is unsupported.
     for args in ([bin_path, "--format", "json", pdf_path], [bin_path, pdf_path]):
-        proc = subprocess.run(args, capture_output=True, text=True)
+        with tool_span("verapdf", args) as current:
+            proc = subprocess.run(args, capture_output=True, text=True)
+            current.set_attribute("process.exit_code", proc.returncode)
         if proc.returncode in (0, 1):  # 1 often means "not compliant"
             return {
                 "status": "ok" if proc.returncode == 0 else "failed",
@@ -72,24 +115,38 @@ def validate_pdfa_verapdf(pdf_path: str) -> dict[str, Any]:
                 "stderr_tail": (proc.stderr or "")[-2000:],
                 "cmd": " ".join(args),
             }
+    subprocess_failure("verapdf")
     return {"status": "error", "reason": "verapdf_invocation_failed"}
 
 
-def validate_bundle(xml_path: str, pdf_path: str, profile: str = "BASIC_WL") -> dict[str, Any]:
+def validate_bundle(
+    xml_path: str, pdf_path: str, profile: str = "BASIC_WL", xml_doc: Any | None = None
+) -> dict[str, Any]:
     """Validate Factur-X bundle (XML + PDF).
     
     Profile determines validation strictness:
     - MINIMUM/BASIC_WL: PDF/A-3 strict, EN16931 informational
     - EN16931: all validations strict
+
+    The XML is parsed once (or `xml_doc`, the in-memory tree of `xml_path`, is reused)
+    and that tree feeds both the cached in-process XSD and the Schematron.
     """
     # Basic existence checks
     p = Path(pdf_path)
     if not p.exists() or p.stat().st_size < 1000:
         raise RuntimeError("PDF output missing or too small")
 
+    if xml_doc is None:
+        xml_doc = etree.parse(xml_path)
+
+    try:
+        xsd = validate_xml_xsd_inprocess(xml_doc, profile)
+    except ImportError:
+        xsd = validate_xml_xsd(xml_path)  # no factur-x XSDs importable: try the CLI
+
     return {
-        "xml_xsd": validate_xml_xsd(xml_path),
-        "xml_schematron": validate_xml_schematron(xml_path, profile),
+        "xml_xsd": xsd,
+        "xml_schematron": validate_xml_schematron(xml_path, profile, xml_doc),
         "pdf_verapdf": validate_pdfa_verapdf(pdf_path),
         "profile": profile,
     }
@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import hashlib
+import xml.etree.ElementTree as ET
+from typing import Any
+
+from lxml import etree
+
+
+class _HashWriter:
+    def __init__(self) -> None:
+        self.sha = hashlib.sha256()
+
+    def write(self, text: str) -> None:
+        self.sha.update(text.encode("utf-8"))
+
+
+class _DropBlankText:
+    """Parser target filter: whitespace-only text nodes are dropped, real text is kept as is."""
+
+    def __init__(self, target: ET.C14NWriterTarget) -> None:
+        self._target = target
+        self._text: list[str] = []
+
+    def _flush(self) -> None:
+        text = "".join(self._text)
+        self._text = []
+        if text.strip():
+            self._target.data(text)
+
+    def data(self, data: str) -> None:
+        self._text.append(data)
+
+    def start_ns(self, prefix: str, uri: str) -> None:
+        self._flush()
+        self._target.start_ns(prefix, uri)
+
+    def start(self, tag: str, attrs: dict[str, str]) -> None:
+        self._flush()
+        self._target.start(tag, attrs)
+
+    def end(self, tag: str) -> None:
+        self._flush()
+        self._target.end(tag)
+
+    def comment(self, text: str) -> None:
+        self._target.comment(text)  # dropped (no comments in the canonical form)
+
+    def pi(self, target: str, data: str) -> None:
+        self._flush()
+        self._target.pi(target, data)
+
+    def close(self) -> None:
+        self._flush()
+
+
+def _c14n(write: Any, xml_data: str | None = None, from_file: str | None = None) -> None:
+    parser = ET.XMLParser(target=_DropBlankText(ET.C14NWriterTarget(write)))
+    if xml_data is not None:
+        parser.feed(xml_data)
+        parser.close()
+    else:
+        ET.parse(from_file, parser=parser)
+
+
+def canonicalize(xml: bytes | str) -> bytes:
+    """C14N 2.0 form without comments and whitespace-only text nodes (template indentation).
+
+    Text with content is kept verbatim, leading/trailing spaces included.
+    """
+    if isinstance(xml, bytes):
+        xml = xml.decode("utf-8")
+    out: list[str] = []
+    _c14n(out.append, xml_data=xml)
+    return "".join(out).encode("utf-8")
+
+
+def canonical_sha256(xml: bytes | str) -> str:
+    """Stable content hash: identical for pretty, minified and C14N renderings."""
+    return hashlib.sha256(canonicalize(xml)).hexdigest()
+
+
+def canonical_sha256_file(path: str) -> str:
+    """Same as `canonical_sha256`, streamed from a file (constant memory)."""
+    out = _HashWriter()
+    _c14n(out.write, from_file=path)
+    return out.sha.hexdigest()
+
+
+def strip_whitespace(root: Any) -> Any:
+    """Drop whitespace-only text/tail nodes (template indentation) from an lxml tree in place."""
+    for el in root.iter():
+        if el.text is not None and not el.text.strip():
+            el.text = None
+        if el.tail is not None and not el.tail.strip():
+            el.tail = None
+    return root
+
+
+def minify(xml: bytes) -> tuple[bytes, Any]:
+    """Whitespace-minimized XML (with declaration) and its parsed tree."""
+    root = etree.fromstring(xml, etree.XMLParser(remove_blank_text=True, remove_comments=True))
+    strip_whitespace(root)
+    return etree.tostring(root, xml_declaration=True, encoding="UTF-8"), root
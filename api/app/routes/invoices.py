@@ -1,26 +1,64 @@
+import asyncio
 import base64
+import hashlib
 import json
 import os
 import shutil
+import tempfile
 import uuid
 import logging
+import zipfile
 from datetime import UTC, datetime, timedelta
 from pathlib import Path
+from typing import Any
 from urllib.parse import urlparse
 
-from fastapi import APIRouter, Depends, File, Form, HTTPException, Request, UploadFile
-from fastapi.responses import FileResponse
+from fastapi import (
+    APIRouter,
+    Depends,
+    File,
+    Form,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    UploadFile,
+)
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from google.auth.transport import requests as google_requests
 from google.oauth2 import id_token
 from slowapi import Limiter
 from slowapi.util import get_remote_address
-from sqlalchemy.orm import Session
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session, load_only
+from starlette.background import BackgroundTask
 
 import stripe
 
 from app.config import settings
 from app.db import get_db
-from app.models import BillingAccount, BillingEvent, ConversionRecord, InvoiceJob, JobStatus, User
+from app.events import job_updates, read_status
+from app.executor import PoolSaturated, conversion_pool
+from app.http_cache import etag_matches, file_download, not_modified
+from app.idempotency import REPLAY_HEADER, idempotency_key
+from app.idempotency import Claim as IdemClaim
+from app.idempotency import claim as idem_claim
+from app.idempotency import claim_blocking as idem_claim_blocking
+from app.idempotency import complete as idem_complete
+from app.idempotency import fingerprint as idem_fingerprint
+from app.idempotency import reclaim as idem_reclaim
+from app.idempotency import release as idem_release
+from app.models import (
+    BillingAccount,
+    BillingEvent,
+    ConversionRecord,
+    InvoiceJob,
+    JobStatus,
+    User,
+    WebhookEndpoint,
+)
+from app.pipeline import output_cache
+from app.pipeline.checkpoint import file_sha256, json_sha256
 from app.pipeline.final_json_validate import validate_final_json
 from app.schemas import (
     AuthGoogleRequest,
@@ -28,12 +66,19 @@ from app.schemas import (
     AuthResponse,
     AuthSignupRequest,
     AuthUserOut,
+    BulkConvertItem,
+    BulkConvertResponse,
+    InvoiceBulkCreateResponse,
+    InvoiceChildSummary,
     InvoiceConfirmRequest,
     InvoiceConfirmResponse,
     InvoiceCreateResponse,
     InvoiceGetResponse,
     InvoiceValidateRequest,
     InvoiceValidateResponse,
+    WebhookEndpointCreateRequest,
+    WebhookEndpointCreateResponse,
+    WebhookEndpointOut,
     BillingCheckoutRequest,
     BillingCheckoutResponse,
     BillingSyncSessionRequest,
@@ -49,14 +94,35 @@ from app.schemas import (
     ConversionListResponse,
     ConversionSummary,
 )
-from app.security import create_access_token, get_current_user, hash_password, verify_password
+from app.security import (
+    create_access_token,
+    get_current_user,
+    get_current_user_optional,
+    hash_password,
+    verify_password,
+)
 from app.email_service import (
     generate_verification_code,
     send_verification_code_email,
     send_purchase_confirmation_email,
 )
-from app.storage import path_to_url, save_input_pdf
-from app.workers.tasks import finalize_invoice, process_invoice
+from app.storage import (
+    UploadTooLarge,
+    job_dir,
+    path_to_url,
+    save_input_upload,
+    store_base64,
+    store_fileobj,
+    store_upload,
+    upload_sha256,
+)
+from app.streaming import iter_file, iter_multipart, iter_ndjson, iter_zip, negotiate, parse_ndjson
+from app.workers.tasks import (
+    finalize_invoice,
+    finalize_pipeline,
+    process_invoice,
+    process_invoice_batch,
+)
 
 router = APIRouter(tags=["invoices"])
 limiter = Limiter(key_func=get_remote_address)
@@ -393,25 +459,8 @@ def _map_webapp_invoice_to_basic_wl(invoice_data: dict) -> dict:
     }
 
 
-@router.post("/invoices/convert-direct")
-async def convert_direct(
-    file: UploadFile = File(...),
-    invoice_data: str = Form(...),
-    profile: str = Form("BASIC_WL"),
-):
-    """Synchronous conversion: PDF + invoice JSON -> PDF/A-3 Factur-X.
-
-    This is designed for the Next.js webapp, which already performs OCR + user validation.
-    We only need to:
-    - build CII XML (currently BASIC_WL only)
-    - convert input PDF to PDF/A-3 (best-effort, Ghostscript)
-    - embed XML as an associated file (factur-x library)
-    """
-    logger = logging.getLogger(__name__)
-
-    if file.content_type not in ("application/pdf", "application/octet-stream"):
-        raise HTTPException(status_code=400, detail="Please upload a PDF")
-
+def _normalize_direct_profile(profile: str | None) -> str:
+    """Profile of convert-direct / convert-bulk: aliases resolved, 400 if unsupported."""
     profile_norm = (profile or "BASIC_WL").strip().upper()
     if profile_norm not in ALLOWED_FACTURX_PROFILES:
         raise HTTPException(
@@ -431,6 +480,44 @@ async def convert_direct(
             status_code=400,
             detail=f"Profile '{profile_norm}' not fully implemented. Supported: MINIMUM, BASIC_WL, EN16931.",
         )
+    return profile_norm
+
+
+# convert-direct response formats, by Accept header (first one is the default)
+CONVERT_MEDIA_TYPES = ("application/json", "application/pdf", "multipart/mixed")
+
+
+@router.post("/invoices/convert-direct")
+async def convert_direct(
+    request: Request,
+    file: UploadFile = File(...),
+    invoice_data: str = Form(...),
+    profile: str = Form("BASIC_WL"),
+    db: Session = Depends(get_db),
+    user: User | None = Depends(get_current_user_optional),
+):
+    """Synchronous conversion: PDF + invoice JSON -> PDF/A-3 Factur-X.
+
+    This is designed for the Next.js webapp, which already performs OCR + user validation.
+    We only need to:
+    - build CII XML (currently BASIC_WL only)
+    - convert input PDF to PDF/A-3 (best-effort, Ghostscript)
+    - embed XML as an associated file (factur-x library)
+
+    The response format follows the Accept header:
+    - application/json (default): PDF as base64 + XML + validation, in one JSON object
+    - application/pdf: the PDF streamed from disk; XML hash, validation and metrics in
+      X-Facturx-* headers (the XML itself is embedded in the PDF)
+    - multipart/mixed: a JSON part (profile, validation, metrics), the XML, then the PDF
+
+    With an Idempotency-Key header a retry gets the first result (in any format) back.
+    """
+    media_type = negotiate(request.headers.get("accept"), CONVERT_MEDIA_TYPES)
+
+    if file.content_type not in ("application/pdf", "application/octet-stream"):
+        raise HTTPException(status_code=400, detail="Please upload a PDF")
+
+    profile_norm = _normalize_direct_profile(profile)
 
     try:
         invoice_obj = json.loads(invoice_data or "{}")
@@ -439,39 +526,118 @@ async def convert_direct(
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Invalid invoice_data JSON: {e}")
 
+    key = idempotency_key(request)
+    if not key:
+        outcome = await _convert_direct_outcome(file, invoice_obj, profile_norm)
+        return await _convert_direct_response(outcome, media_type)
+
+    request_fp = idem_fingerprint(await upload_sha256(file), json_sha256(invoice_obj), profile_norm)
+    user_id = user.id if user else None
+    claim_ = await idem_claim(db, "convert_direct", user_id, key, request_fp)
+    if claim_.replay is not None:
+        if os.path.exists(claim_.replay["out_pdf_path"]):
+            replayed = await _convert_direct_response(claim_.replay, media_type)
+            replayed.headers[REPLAY_HEADER] = "true"
+            return replayed
+        # Output purged from disk: convert again under the same key
+        claim_ = await asyncio.to_thread(idem_reclaim, db, claim_)
     try:
-        # Store inputs under /data/<job_id>/
-        job_id = str(uuid.uuid4())
-        out_dir = Path("/data") / job_id
-        out_dir.mkdir(parents=True, exist_ok=True)
+        outcome = await _convert_direct_outcome(file, invoice_obj, profile_norm)
+    except BaseException:
+        await asyncio.to_thread(idem_release, db, claim_)
+        raise
+    await asyncio.to_thread(idem_complete, db, claim_, outcome)
+    return await _convert_direct_response(outcome, media_type)
 
-        pdf_bytes = await file.read()
-        if not pdf_bytes or len(pdf_bytes) < 100:
-            raise HTTPException(status_code=400, detail="Empty PDF")
 
-        input_pdf_path = out_dir / (file.filename or "input.pdf")
-        input_pdf_path.write_bytes(pdf_bytes)
+async def _convert_direct_outcome(
+    file: UploadFile, invoice_obj: dict[str, Any], profile_norm: str
+) -> dict[str, Any]:
+    """Run the conversion on the pool; returns a JSON-serializable outcome."""
+    logger = logging.getLogger(__name__)
+    metrics: dict[str, Any] = {}
+    # Store inputs under /data/<job_id>/
+    job_id = str(uuid.uuid4())
+    out_dir = Path("/data") / job_id
+    try:
+        stored = await store_upload(file, out_dir / Path(file.filename or "input.pdf").name)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    if stored.size < 100:
+        raise HTTPException(status_code=400, detail="Empty PDF")
+    input_pdf_path = Path(stored.path)
+
+    try:
+        mapped = _map_webapp_invoice_to_basic_wl(invoice_obj)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"convert-direct failed: {type(e).__name__}: {e}"
+        )
 
-        # Build XML
-        from app.pipeline.cii_builder import build_cii_xml
+    # Same PDF + mapped data + profile: serve the stored output ("regenerate", retries)
+    cache_key = output_cache.cache_key(stored.sha256, mapped, profile_norm)
+    cached = await asyncio.to_thread(
+        output_cache.lookup, cache_key, str(out_dir / output_cache.PDF_NAME)
+    )
+    if cached is not None:
+        input_pdf_path.unlink(missing_ok=True)
+        return {
+            "job_id": job_id,
+            "profile": cached["profile"],
+            "out_pdf_path": cached["out_pdf_path"],
+            "xml": cached["xml"],
+            "xml_sha256": cached["xml_sha256"],
+            "validation": cached["validation"],
+            "metrics": {"output_cache": "hit"},
+        }
+
+    def _convert() -> dict[str, Any]:
+        # Blocking part (OCR subprocess, pikepdf, lxml): runs on the conversion pool.
+        # Build XML (in memory: embedded as bytes, returned as text, never re-read from disk)
+        from app.pipeline.cii_builder import render_cii
+        from app.pipeline.embedded import can_skip_pdfa, find_embedded_invoice_xml
         from app.pipeline.facturx_wrap import wrap_facturx
         from app.pipeline.pdfa import ensure_pdfa3
+        from app.pipeline.stage_metrics import measure_stage
 
-        mapped = _map_webapp_invoice_to_basic_wl(invoice_obj)
-        xml_path = build_cii_xml(job_id, profile_norm, mapped)
+        with measure_stage(metrics, "build_xml", job_id=job_id, profile=profile_norm):
+            cii = render_cii(profile_norm, mapped)
 
-        # Convert to PDF/A-3 (if enabled in settings)
+        # Convert to PDF/A-3 (if enabled in settings). Files that already are
+        # Factur-X/ZUGFeRD PDF/A-3 (valid embedded XML) skip the OCR pass: we only replace the XML.
         pdf_for_wrap = str(input_pdf_path)
-        if settings.enable_pdfa_convert:
+        embedded = find_embedded_invoice_xml(str(input_pdf_path))
+        already_pdfa3 = can_skip_pdfa(str(input_pdf_path), embedded)
+        if already_pdfa3:
+            logger.warning(f"⏩ convert-direct: input already Factur-X PDF/A-3 for {job_id}")
+        elif settings.enable_pdfa_convert:
             logger.warning(f"🔍 convert-direct: PDF/A conversion ENABLED for {job_id}")
             pdfa_path = out_dir / "input_pdfa3.pdf"
-            pdf_for_wrap = ensure_pdfa3(str(input_pdf_path), str(pdfa_path))
+            with measure_stage(metrics, "pdfa", job_id=job_id, profile=profile_norm):
+                pdf_for_wrap = ensure_pdfa3(str(input_pdf_path), str(pdfa_path))
             logger.warning(f"✅ convert-direct: PDF/A conversion COMPLETE - {pdf_for_wrap}")
         else:
             logger.warning(f"❌ convert-direct: PDF/A conversion DISABLED for {job_id}")
 
         # Wrap (pass profile for correct Factur-X metadata)
-        output_pdf_path = wrap_facturx(job_id, pdf_for_wrap, xml_path, profile_norm)
+        with measure_stage(metrics, "wrap", job_id=job_id, profile=profile_norm):
+            output_pdf_path = wrap_facturx(job_id, pdf_for_wrap, cii.data, profile_norm)
+
+        return {
+            "cii": cii,
+            "out_pdf_path": output_pdf_path,
+            "embedded": embedded,
+            "already_pdfa3": already_pdfa3,
+        }
+
+    try:
+        result = await conversion_pool.run(_convert)
+    except PoolSaturated as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"convert-direct is busy ({e.reason}), retry later",
+            headers={"Retry-After": str(e.retry_after_s)},
+        )
     except HTTPException:
         raise
     except Exception as e:
@@ -480,25 +646,505 @@ async def convert_direct(
             status_code=500, detail=f"convert-direct failed: {type(e).__name__}: {e}"
         )
 
+    cii = result["cii"]
+    embedded = result["embedded"]
+    outcome = {
+        "job_id": job_id,
+        "profile": profile_norm,
+        "out_pdf_path": result["out_pdf_path"],
+        "xml": cii.text(),
+        "xml_sha256": cii.sha256,
+        "validation": {
+            "pdfa3_converted": settings.enable_pdfa_convert and not result["already_pdfa3"],
+            "embedded_xml": embedded[0] if embedded else None,
+        },
+        "metrics": metrics,
+    }
+    if settings.enable_convert_cache:
+        entry = {k: v for k, v in outcome.items() if k not in ("job_id", "out_pdf_path")}
+        await asyncio.to_thread(output_cache.store, cache_key, outcome["out_pdf_path"], entry)
+        metrics["output_cache"] = "miss"
+    return outcome
+
+
+async def _convert_direct_response(outcome: dict[str, Any], media_type: str) -> Response:
+    """Render a convert-direct outcome (JSON-serializable, see convert_direct) as `media_type`."""
+    profile_norm = outcome["profile"]
+    validation = outcome["validation"]
+    metrics = outcome["metrics"]
+    out_pdf_path = outcome["out_pdf_path"]
+
+    if media_type == "application/json":
+        # Only the JSON shape needs the PDF in memory; the others stream it from disk.
+        try:
+            out_pdf = await asyncio.to_thread(Path(out_pdf_path).read_bytes)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to read output PDF: {e}")
+        return JSONResponse(
+            content={
+                "profile": profile_norm,
+                "pdf_base64": base64.b64encode(out_pdf).decode("ascii"),
+                "xml": outcome["xml"],
+                "xml_sha256": outcome["xml_sha256"],
+                "validation": validation,
+                "metrics": metrics,
+            },
+            headers={"Vary": "Accept"},
+        )
+
+    pdf_name = f"factur-x-{outcome['job_id']}.pdf"
+    if media_type == "application/pdf":
+        return FileResponse(
+            path=out_pdf_path,
+            media_type="application/pdf",
+            filename=pdf_name,
+            headers={
+                "Vary": "Accept",
+                "X-Facturx-Profile": profile_norm,
+                "X-Facturx-Xml-Sha256": outcome["xml_sha256"],
+                "X-Facturx-Validation": _compact_json(validation),
+                "X-Facturx-Metrics": _compact_json(metrics),
+            },
+        )
+
+    boundary = f"facturx-{uuid.uuid4().hex}"
+    parts = [
+        (
+            {"Content-Type": "application/json"},
+            json.dumps(
+                {
+                    "profile": profile_norm,
+                    "xml_sha256": outcome["xml_sha256"],
+                    "validation": validation,
+                    "metrics": metrics,
+                }
+            ).encode("utf-8"),
+        ),
+        (
+            {
+                "Content-Type": "application/xml; charset=utf-8",
+                "Content-Disposition": 'attachment; filename="factur-x.xml"',
+            },
+            outcome["xml"].encode("utf-8"),
+        ),
+        (
+            {
+                "Content-Type": "application/pdf",
+                "Content-Disposition": f'attachment; filename="{pdf_name}"',
+            },
+            iter_file(out_pdf_path),
+        ),
+    ]
+    return StreamingResponse(
+        iter_multipart(parts, boundary),
+        media_type=f'multipart/mixed; boundary="{boundary}"',
+        headers={"Vary": "Accept"},
+    )
+
+
+def _compact_json(obj: Any) -> str:
+    # Header-safe: no newlines, ASCII only
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=True, default=str)
+
+
+# convert-bulk: /data/<group_id>/bulk.json lists the items in upload order
+BULK_MANIFEST_NAME = "bulk.json"
+
+
+def _bulk_invoice_data(lines: list[Any], names: list[str | None]) -> list[Any]:
+    """Pair NDJSON lines with PDFs (a None name is a rejected file and gets no line).
+
+    A line is either `{"file": "<name>", "invoice_data": {...}}` (matched by file name,
+    with or without its folder in the ZIP) or the invoice object itself, given to the
+    unmatched PDFs in order. Missing entries are None.
+    """
+    by_name = {
+        line["file"]: line["invoice_data"]
+        for line in lines
+        if isinstance(line, dict) and "invoice_data" in line and "file" in line
+    }
+    positional = iter([line for line in lines if not (isinstance(line, dict) and "invoice_data" in line)])
+    paired = []
+    for name in names:
+        if name is None:
+            paired.append(None)
+        elif name in by_name or name.rsplit("/", 1)[-1] in by_name:
+            paired.append(by_name.get(name, by_name.get(name.rsplit("/", 1)[-1])))
+        else:
+            paired.append(next(positional, None))
+    return paired
+
+
+def _read_bulk_lines(raw: str) -> list[Any]:
     try:
-        out_pdf = Path(output_pdf_path).read_bytes()
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to read output PDF: {e}")
+        return list(parse_ndjson(raw.encode("utf-8")))
+    except json.JSONDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid invoice_data NDJSON: {e}")
+
+
+def _store_bulk_inputs(
+    group_id: str, archive: UploadFile | None, files: list[UploadFile]
+) -> tuple[list[tuple[str, str | None, str | None]], str | None]:
+    """Store every PDF under its own job id (blocking: called from the threadpool).
+
+    Returns ([(file_name, job_id, error)], ndjson found in the archive or None).
+    """
+    items: list[tuple[str, str | None, str | None]] = []
+    archive_ndjson = None
+    limit = max(settings.bulk_convert_max_items, 1)
 
+    if archive is not None:
+        try:
+            stored = store_fileobj(
+                archive.file, job_dir(group_id) / "upload.zip", max_bytes=settings.max_request_mb * 1024 * 1024
+            )
+        except UploadTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        try:
+            zf = zipfile.ZipFile(stored.path)
+        except zipfile.BadZipFile:
+            raise HTTPException(status_code=400, detail="archive is not a ZIP file")
+        with zf:
+            for info in zf.infolist():
+                name = info.filename
+                if info.is_dir() or name.startswith("__MACOSX/") or name.rsplit("/", 1)[-1].startswith("."):
+                    continue
+                if name.lower().endswith(".ndjson"):
+                    archive_ndjson = zf.read(info).decode("utf-8")
+                    continue
+                if len(items) >= limit:
+                    raise HTTPException(status_code=413, detail=f"Too many files (max {limit})")
+                if not name.lower().endswith(".pdf"):
+                    items.append((name, None, "not a PDF"))
+                    continue
+                job_id = str(uuid.uuid4())
+                try:
+                    with zf.open(info) as src:
+                        store_fileobj(src, job_dir(job_id) / "input.pdf")
+                except UploadTooLarge as e:
+                    items.append((name, job_id, str(e)))
+                    continue
+                items.append((name, job_id, None))
+        os.remove(stored.path)
+        return items, archive_ndjson
+
+    if len(files) > limit:
+        raise HTTPException(status_code=413, detail=f"Too many files (max {limit})")
+    for upload in files:
+        name = upload.filename or f"file-{len(items) + 1}.pdf"
+        if upload.content_type not in ("application/pdf", "application/octet-stream"):
+            items.append((name, None, "not a PDF"))
+            continue
+        job_id = str(uuid.uuid4())
+        try:
+            store_fileobj(upload.file, job_dir(job_id) / "input.pdf")
+        except UploadTooLarge as e:
+            items.append((name, job_id, str(e)))
+            continue
+        items.append((name, job_id, None))
+    return items, archive_ndjson
+
+
+def _bulk_status(db: Session, group_id: str) -> BulkConvertResponse:
+    # Only canonical UUIDs (what convert_bulk issues) reach the database and the disk;
+    # the path is resolved without job_dir(), which would create the directory.
     try:
-        xml_text = Path(xml_path).read_text(encoding="utf-8")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to read generated XML: {e}")
+        valid_id = str(uuid.UUID(group_id)) == group_id
+    except ValueError:
+        valid_id = False
+    group = db.get(InvoiceJob, group_id) if valid_id else None
+    manifest_path = Path(settings.storage_local_root) / group_id / BULK_MANIFEST_NAME
+    if not group or not manifest_path.exists():
+        raise HTTPException(status_code=404, detail="Bulk conversion not found")
+    manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    children = {
+        c.id: c for c in db.query(InvoiceJob).filter(InvoiceJob.parent_job_id == group_id)
+    }
+    items = []
+    for entry in manifest["items"]:
+        child = children.get(entry["job_id"])
+        items.append(
+            BulkConvertItem(
+                index=entry["index"],
+                file_name=entry["file_name"],
+                job_id=entry["job_id"],
+                status=child.status.value if child else JobStatus.FAILED.value,
+                error_message=child.error_message if child else "job not found",
+                xml_sha256=child.xml_sha256 if child else None,
+            )
+        )
+    settled = (JobStatus.VALIDATED.value, JobStatus.FAILED.value)
+    return BulkConvertResponse(
+        group_id=group_id,
+        status=group.status.value,
+        complete=all(item.status in settled for item in items),
+        items=items,
+    )
 
-    return {
-        "profile": profile_norm,
-        "pdf_base64": base64.b64encode(out_pdf).decode("ascii"),
-        "xml": xml_text,
-        "validation": {
-            "pdfa3_converted": settings.enable_pdfa_convert,
-        },
+
+@router.post("/invoices/convert-bulk", response_model=BulkConvertResponse)
+@limiter.limit("10/minute")
+def convert_bulk(
+    request: Request,
+    archive: UploadFile | None = File(None),
+    files: list[UploadFile] | None = File(None),
+    invoice_data: str = Form(""),
+    profile: str = Form("BASIC_WL"),
+    db: Session = Depends(get_db),
+    user: User | None = Depends(get_current_user_optional),
+):
+    """Many convert-direct conversions at once, run in parallel on the worker fleet.
+
+    Input: a ZIP of PDFs (`archive`) or several `files`, plus `invoice_data` as NDJSON
+    (one line per PDF, see _bulk_invoice_data; for a ZIP it may also be a *.ndjson
+    member). Every PDF becomes a child job of a group job (`group_id`) and goes through
+    the finalize chain; items that cannot be queued are recorded as FAILED.
+
+    Poll GET /v1/invoices/convert-bulk/{group_id}; the results are streamed as a ZIP
+    by GET /v1/invoices/convert-bulk/{group_id}/download.
+
+    A plain `def`: unzipping, copying up to bulk_convert_max_items files and the
+    commit run on the threadpool, not on the event loop.
+    """
+    profile_norm = _normalize_direct_profile(profile)
+    if archive is None and not files:
+        raise HTTPException(status_code=400, detail="Please upload a ZIP (archive) or PDFs (files)")
+
+    group_id = str(uuid.uuid4())
+    try:
+        stored_items, archive_ndjson = _store_bulk_inputs(group_id, archive, list(files or []))
+    except HTTPException:
+        shutil.rmtree(job_dir(group_id), ignore_errors=True)
+        raise
+    if not stored_items:
+        shutil.rmtree(job_dir(group_id), ignore_errors=True)
+        raise HTTPException(status_code=400, detail="No PDF found")
+
+    lines = _read_bulk_lines(invoice_data or archive_ndjson or "")
+    paired = _bulk_invoice_data(lines, [None if error else name for name, _, error in stored_items])
+
+    group = InvoiceJob(
+        id=group_id,
+        status=JobStatus.UPLOADED,
+        profile=profile_norm,
+        input_pdf_url=path_to_url(str(job_dir(group_id))),
+        user_id=user.id if user else None,
+    )
+    jobs = [group]
+    queued: list[str] = []
+    manifest_items = []
+    for index, ((name, job_id, error), data) in enumerate(zip(stored_items, paired)):
+        job_id = job_id or str(uuid.uuid4())
+        final_json = None
+        if error is None:
+            if not isinstance(data, dict):
+                error = "missing invoice_data"
+            else:
+                try:
+                    final_json = _map_webapp_invoice_to_basic_wl(data)
+                except Exception as e:
+                    error = f"invalid invoice_data: {type(e).__name__}: {e}"
+        jobs.append(
+            InvoiceJob(
+                id=job_id,
+                # XML_READY: same entry point as a confirmed job (finalize chain)
+                status=JobStatus.FAILED if error else JobStatus.XML_READY,
+                profile=profile_norm,
+                input_pdf_url=path_to_url(str(job_dir(job_id) / "input.pdf")),
+                final_json=final_json,
+                error_message=error,
+                parent_job_id=group_id,
+                user_id=group.user_id,
+            )
+        )
+        manifest_items.append({"index": index, "file_name": name, "job_id": job_id})
+        if error is None:
+            queued.append(job_id)
+
+    (job_dir(group_id) / BULK_MANIFEST_NAME).write_text(
+        json.dumps({"profile": profile_norm, "items": manifest_items}, indent=2), encoding="utf-8"
+    )
+    if not queued:
+        group.status = JobStatus.FAILED
+        group.error_message = f"{len(manifest_items)}/{len(manifest_items)} invoices failed"
+    db.add_all(jobs)
+    db.commit()
+
+    for job_id in queued:
+        finalize_pipeline(job_id).apply_async()
+
+    return _bulk_status(db, group_id)
+
+
+@router.get("/invoices/convert-bulk/{group_id}", response_model=BulkConvertResponse)
+def convert_bulk_status(group_id: str, db: Session = Depends(get_db)):
+    return _bulk_status(db, group_id)
+
+
+@router.get("/invoices/convert-bulk/{group_id}/download")
+def convert_bulk_download(group_id: str, db: Session = Depends(get_db)):
+    """Stream a ZIP: factur-x/<name>.pdf per converted item, then manifest.json.
+
+    Built on the fly (one file in memory at a time); items still running or failed are
+    only listed in the manifest, with their status and error.
+    """
+    status = _bulk_status(db, group_id)
+    outputs = {
+        c.id: c.output_pdf_url
+        for c in db.query(InvoiceJob).filter(InvoiceJob.parent_job_id == group_id)
+        if c.status == JobStatus.VALIDATED and c.output_pdf_url
     }
 
+    def _entries():
+        manifest = []
+        used: set[str] = set()
+        for item in status.items:
+            entry = item.model_dump()
+            output = outputs.get(item.job_id)
+            if output:
+                stem = Path(item.file_name).stem or item.job_id
+                arcname = f"factur-x/{stem}.pdf"
+                if arcname in used:
+                    arcname = f"factur-x/{stem}-{item.index}.pdf"
+                used.add(arcname)
+                try:
+                    yield arcname, Path(output.replace("file://", "")).read_bytes()
+                    entry["output"] = arcname
+                except OSError as e:
+                    entry["error_message"] = f"output unavailable: {e}"
+            manifest.append(entry)
+        yield "manifest.json", json.dumps(
+            {"group_id": group_id, "status": status.status, "complete": status.complete, "items": manifest},
+            indent=2,
+        )
+
+    headers = {"Content-Disposition": f'attachment; filename="factur-x-bulk-{group_id}.zip"'}
+    return StreamingResponse(iter_zip(_entries()), media_type="application/zip", headers=headers)
+
+
+# POST /v1/xml/batch bodies stay in memory up to this size, then go to a temporary file
+XML_BATCH_SPOOL_BYTES = 8 * 1024 * 1024
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+
+async def _spool_xml_batch(request: Request, ndjson: bool) -> tempfile.SpooledTemporaryFile:
+    """Copy the batch body, chunk by chunk, to a spooled file (settings.max_request_mb cap).
+
+    NDJSON lines are counted and checked as they arrive (400 on the first invalid line,
+    413 past settings.xml_batch_max_items), so results can then be produced lazily.
+    """
+    limit = settings.max_request_mb * 1024 * 1024
+    spool = tempfile.SpooledTemporaryFile(max_size=XML_BATCH_SPOOL_BYTES)
+    size = items = 0
+    partial = b""
+
+    def _check_line(raw: bytes) -> None:
+        nonlocal items
+        if not raw.strip():
+            return
+        items += 1
+        if items > settings.xml_batch_max_items:
+            raise HTTPException(
+                status_code=413, detail=f"Too many invoices (max {settings.xml_batch_max_items})"
+            )
+        try:
+            json.loads(raw)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid batch body: line {items}: {e}")
+
+    try:
+        async for chunk in request.stream():
+            size += len(chunk)
+            if limit and size > limit:
+                raise HTTPException(
+                    status_code=413, detail=f"Request too large (max {settings.max_request_mb} MB)"
+                )
+            spool.write(chunk)
+            if ndjson:
+                *lines, partial = (partial + chunk).split(b"\n")
+                for raw in lines:
+                    _check_line(raw)
+        if ndjson:
+            _check_line(partial)
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
+
+
+@router.post("/xml/batch")
+@limiter.limit("30/minute")
+async def xml_batch(
+    request: Request,
+    profile: str = "BASIC_WL",
+    validate: bool = False,
+    fmt: str = Query("ndjson", alias="format"),
+    persist: bool = False,
+):
+    """XML-only conversion: many final_json objects -> CII XML, streamed back.
+
+    Body: a JSON array, or NDJSON (Content-Type: application/x-ndjson), of invoices in
+    the canonical final_json shape. `format=ndjson` streams one result per line,
+    `format=zip` streams invoice-<index>.xml files plus a manifest.json.
+    NDJSON bodies are spooled and rendered line by line; a JSON array is parsed whole.
+    Nothing is written under /data unless `persist=true`.
+    """
+    from app.pipeline.cii_builder import build_cii_xml_many, validate_profile
+
+    try:
+        validate_profile(profile)
+    except NotImplementedError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    fmt = (fmt or "ndjson").strip().lower()
+    if fmt not in ("ndjson", "zip"):
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'zip'")
+
+    content_type = (request.headers.get("content-type") or "").split(";")[0].strip().lower()
+    ndjson = content_type in NDJSON_CONTENT_TYPES
+    spool = await _spool_xml_batch(request, ndjson)
+    if ndjson:
+        invoices = parse_ndjson(spool)  # read lazily while the response streams
+    else:
+        try:
+            invoices = await asyncio.to_thread(json.load, spool)
+            if not isinstance(invoices, list):
+                raise ValueError("body must be a JSON array of invoices")
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Invalid batch body: {e}")
+        finally:
+            spool.close()
+        if len(invoices) > settings.xml_batch_max_items:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Too many invoices ({len(invoices)} > {settings.xml_batch_max_items})",
+            )
+
+    batch_id = str(uuid.uuid4())
+    out_dir = str(job_dir(batch_id)) if persist else None
+    results = build_cii_xml_many(invoices, profile, validate=validate, out_dir=out_dir)
+    headers = {"X-Batch-Id": batch_id}
+    done = BackgroundTask(spool.close)
+
+    if fmt == "ndjson":
+        return StreamingResponse(
+            iter_ndjson(results), media_type="application/x-ndjson", headers=headers, background=done
+        )
+
+    def _entries():
+        manifest = []
+        for item in results:
+            manifest.append({k: v for k, v in item.items() if k != "xml"})
+            if "xml" in item:
+                yield f"invoice-{item['index']:06d}.xml", item["xml"]
+        yield "manifest.json", json.dumps(manifest, ensure_ascii=False, indent=2)
+
+    headers["Content-Disposition"] = f'attachment; filename="cii-batch-{batch_id}.zip"'
+    return StreamingResponse(
+        iter_zip(_entries()), media_type="application/zip", headers=headers, background=done
+    )
+
 
 def _download_url(job_id: str) -> str:
     # ⚠️ IMPORTANT: si ton app est montée avec prefix="/v1" dans main.py,
@@ -516,58 +1162,252 @@ def to_user_out(u: User) -> AuthUserOut:
     )
 
 
-@router.post("/invoices", response_model=InvoiceCreateResponse)
+@router.post("/invoices", response_model=InvoiceCreateResponse | InvoiceBulkCreateResponse)
 @limiter.limit("10/minute")
 async def create_invoice(
     request: Request,
-    file: UploadFile = File(...),
+    file: UploadFile | None = File(None),
+    files: list[UploadFile] | None = File(None),
     profile: str = Form("BASIC_WL"),
     needs_review: bool = Form(False),
     db: Session = Depends(get_db),
+    user: User | None = Depends(get_current_user_optional),
 ):
-    if file.content_type not in ("application/pdf", "application/octet-stream"):
+    """Upload one PDF (`file`) or many (`files`, bulk: processed by process_invoice_batch).
+
+    With a bearer token the jobs belong to the user, whose webhooks are then notified.
+    With an Idempotency-Key header a retried upload gets the original job ids back.
+    """
+    uploads = ([file] if file else []) + list(files or [])
+    if not uploads:
         raise HTTPException(status_code=400, detail="Please upload a PDF")
+    for upload in uploads:
+        if upload.content_type not in ("application/pdf", "application/octet-stream"):
+            raise HTTPException(status_code=400, detail="Please upload a PDF")
+
+    key = idempotency_key(request)
+    if not key:
+        return await _create_invoice_jobs(db, user, uploads, bool(files), profile, needs_review)
+
+    parts: list[Any] = [profile, needs_review, bool(files)]
+    for upload in uploads:
+        parts += [upload.filename, await upload_sha256(upload)]
+    claim_ = await idem_claim(db, "create_invoice", user.id if user else None, key, idem_fingerprint(*parts))
+    if claim_.replay is not None:
+        return JSONResponse(content=claim_.replay, headers={REPLAY_HEADER: "true"})
+    try:
+        return await _create_invoice_jobs(db, user, uploads, bool(files), profile, needs_review, claim_)
+    except BaseException:
+        await asyncio.to_thread(idem_release, db, claim_)  # keeps the key once the jobs exist
+        raise
 
-    job_id = str(uuid.uuid4())
-    content = await file.read()
-    input_path = save_input_pdf(job_id, file.filename, content)
 
-    job = InvoiceJob(
-        id=job_id,
-        status=JobStatus.UPLOADED,
-        profile=profile,
-        input_pdf_url=path_to_url(input_path),
-    )
-    db.add(job)
-    db.commit()
+async def _create_invoice_jobs(
+    db: Session,
+    user: User | None,
+    uploads: list[UploadFile],
+    bulk: bool,
+    profile: str,
+    needs_review: bool,
+    claim_: IdemClaim | None = None,
+) -> InvoiceCreateResponse | InvoiceBulkCreateResponse:
+    jobs = []
+
+    def _discard_uploads(job_ids: list[str]) -> None:
+        for stale_id in job_ids:
+            shutil.rmtree(job_dir(stale_id), ignore_errors=True)
+
+    for upload in uploads:
+        job_id = str(uuid.uuid4())
+        try:
+            stored = await save_input_upload(job_id, upload)
+        except UploadTooLarge as e:
+            _discard_uploads([j.id for j in jobs] + [job_id])
+            raise HTTPException(status_code=413, detail=f"{upload.filename}: {e}")
+        jobs.append(
+            InvoiceJob(
+                id=job_id,
+                status=JobStatus.UPLOADED,
+                profile=profile,
+                input_pdf_url=path_to_url(stored.path),
+                input_sha256=stored.sha256,
+                user_id=user.id if user else None,
+            )
+        )
+    size = max(settings.invoice_batch_size, 1)
+    job_ids = [job.id for job in jobs]
+    batches = [job_ids[i : i + size] for i in range(0, len(job_ids), size)]
+    result: InvoiceCreateResponse | InvoiceBulkCreateResponse
+    if len(jobs) == 1 and not bulk:
+        result = InvoiceCreateResponse(job_id=jobs[0].id, status=JobStatus.UPLOADED.value)
+    else:
+        result = InvoiceBulkCreateResponse(
+            jobs=[InvoiceCreateResponse(job_id=job.id, status=JobStatus.UPLOADED.value) for job in jobs],
+            batches=len(batches),
+        )
+    try:
+        db.add_all(jobs)
+        if claim_ is not None:
+            # Same transaction: a duplicate request attaches to these jobs from now on
+            idem_complete(db, claim_, result.model_dump(mode="json"), commit=False)
+        db.commit()
+    except SQLAlchemyError as e:
+        # All or nothing: no job row, no stored file, and the session stays usable
+        db.rollback()
+        _discard_uploads([j.id for j in jobs])
+        logger.error(f"❌ Upload of {len(jobs)} file(s) not recorded: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Upload not recorded ({type(e).__name__}), no job was created: please retry",
+        )
 
-    process_invoice.delay(job_id, stop_after_extract=needs_review)
-    return InvoiceCreateResponse(job_id=job_id, status=job.status.value)
+    if isinstance(result, InvoiceCreateResponse):
+        process_invoice.delay(result.job_id, stop_after_extract=needs_review)
+    else:
+        for batch in batches:
+            process_invoice_batch.delay(batch, stop_after_extract=needs_review)
+    return result
+
+
+# InvoiceGetResponse field -> InvoiceJob columns it is built from (for ?fields=)
+_INVOICE_FIELD_COLUMNS: dict[str, tuple[str, ...]] = {
+    "job_id": (),
+    "status": (),
+    "profile": (),
+    "input_pdf_url": ("input_pdf_url",),
+    "output_pdf_url": ("output_pdf_url",),
+    "output_xml_url": ("output_xml_url",),
+    "xml_sha256": ("xml_sha256",),
+    "download_url": ("output_pdf_url",),
+    "extracted_json": ("extracted_json",),
+    "final_json": ("final_json",),
+    "validation_json": ("validation_json",),
+    "error_message": ("error_message",),
+    "metrics": ("metrics",),
+    "parent_job_id": ("parent_job_id",),
+    "children": (),
+}
 
 
 @router.get("/invoices/{job_id}", response_model=InvoiceGetResponse)
-def get_invoice(job_id: str, db: Session = Depends(get_db)):
-    job = db.get(InvoiceJob, job_id)
+def get_invoice(
+    job_id: str,
+    request: Request,
+    fields: str | None = None,
+    db: Session = Depends(get_db),
+):
+    """Job details. `?fields=status,download_url` returns (and loads) only those fields.
+
+    The ETag changes with the job's updated_at (and its children's): send it back in
+    If-None-Match to get a 304 when nothing changed.
+    """
+    selected = None
+    if fields:
+        selected = {f.strip() for f in fields.split(",") if f.strip()}
+        unknown = selected - _INVOICE_FIELD_COLUMNS.keys()
+        if unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown fields: {sorted(unknown)}. Allowed: {sorted(_INVOICE_FIELD_COLUMNS)}",
+            )
+
+    # Always needed: the required response fields and the ETag inputs
+    columns = {"id", "status", "profile", "updated_at"}
+    for name in selected if selected is not None else _INVOICE_FIELD_COLUMNS:
+        columns.update(_INVOICE_FIELD_COLUMNS[name])
+    job = (
+        db.query(InvoiceJob)
+        .options(load_only(*(getattr(InvoiceJob, c) for c in sorted(columns))))
+        .filter(InvoiceJob.id == job_id)
+        .one_or_none()
+    )
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
 
-    download_url = None
-    if job.status == JobStatus.VALIDATED and job.output_pdf_url:
-        download_url = _download_url(job.id)
-
-    return InvoiceGetResponse(
-        job_id=job.id,
-        status=job.status.value,
-        profile=job.profile,
-        input_pdf_url=job.input_pdf_url,
-        output_pdf_url=job.output_pdf_url,
-        output_xml_url=job.output_xml_url,
-        download_url=download_url,
-        extracted_json=job.extracted_json,
-        final_json=job.final_json,
-        validation_json=job.validation_json,
-        error_message=job.error_message,
+    children_rows = []
+    if selected is None or "children" in selected:
+        children_rows = (
+            db.query(InvoiceJob.id, InvoiceJob.status, InvoiceJob.error_message, InvoiceJob.updated_at)
+            .filter(InvoiceJob.parent_job_id == job.id)
+            .order_by(InvoiceJob.created_at)
+            .all()
+        )
+
+    version = ":".join(
+        [job.status.value, str(job.updated_at)]
+        + [f"{c.id}={c.status.value}@{c.updated_at}" for c in children_rows]
+        + sorted(selected or ["*"])
     )
+    etag = f'W/"{hashlib.sha256(version.encode("utf-8")).hexdigest()[:32]}"'
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return not_modified(etag)
+
+    values: dict[str, Any] = {"job_id": job.id, "status": job.status.value, "profile": job.profile}
+    for name in selected if selected is not None else _INVOICE_FIELD_COLUMNS:
+        if name in values:
+            continue
+        if name == "download_url":
+            values[name] = (
+                _download_url(job.id) if job.status == JobStatus.VALIDATED and job.output_pdf_url else None
+            )
+        elif name == "children":
+            values[name] = [
+                InvoiceChildSummary(job_id=c.id, status=c.status.value, error_message=c.error_message)
+                for c in children_rows
+            ]
+        else:
+            values[name] = getattr(job, _INVOICE_FIELD_COLUMNS[name][0])
+
+    body = InvoiceGetResponse(**values).model_dump(mode="json", include=selected)
+    return JSONResponse(content=body, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+
+@router.get("/invoices/{job_id}/events")
+async def invoice_events(job_id: str, request: Request):
+    """Server-Sent Events: one `status` event now, then one per status transition.
+
+    The stream ends when the job settles (VALIDATED, FAILED, NEEDS_REVIEW) or after
+    settings.job_events_max_stream_s; EventSource reconnects by itself after that.
+    """
+    if await asyncio.to_thread(read_status, job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def _stream():
+        yield "retry: 3000\n\n"
+        async for ev in job_updates(
+            job_id, settings.job_events_max_stream_s, settings.job_events_heartbeat_s
+        ):
+            if await request.is_disconnected():
+                break
+            if ev is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield f"event: status\ndata: {json.dumps(ev)}\n\n"
+
+    return StreamingResponse(
+        _stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/invoices/{job_id}/status")
+async def invoice_status(job_id: str, wait: float = 0, since: str | None = None):
+    """Job status only (no JSON payloads). Long-poll: with `wait` (seconds) and `since`
+    (the status the client already has), answers as soon as the status differs from
+    `since`, or with the unchanged status once `wait` elapses.
+    """
+    wait = min(max(wait, 0.0), settings.job_events_long_poll_max_s)
+    current = None
+    async for ev in job_updates(job_id, wait, heartbeat_s=max(wait, 1.0), stop_when_settled=False):
+        if ev is None:
+            continue
+        current = ev
+        if not wait or since is None or ev["status"] != since.upper():
+            break
+    if current is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {**current, "changed": since is not None and current["status"] != since.upper()}
 
 
 # ✅ validation pre-flight côté serveur (utile pour ton UI)
@@ -607,7 +1447,7 @@ def confirm_invoice(job_id: str, payload: InvoiceConfirmRequest, db: Session = D
 
 
 @router.get("/invoices/{job_id}/download")
-def download_facturx(job_id: str, db: Session = Depends(get_db)):
+def download_facturx(job_id: str, request: Request, db: Session = Depends(get_db)):
     job = db.get(InvoiceJob, job_id)
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
@@ -622,13 +1462,77 @@ def download_facturx(job_id: str, db: Session = Depends(get_db)):
     if not os.path.exists(path):
         raise HTTPException(status_code=404, detail=f"Output file missing on disk: {path}")
 
-    return FileResponse(
-        path,
-        media_type="application/pdf",
-        filename="output_facturx.pdf",
+    if not job.output_sha256:  # jobs wrapped before the hash was recorded
+        job.output_sha256 = file_sha256(path)
+        db.commit()
+    return file_download(request, path, "application/pdf", "output_facturx.pdf", job.output_sha256)
+
+
+def _webhook_out(endpoint: WebhookEndpoint) -> WebhookEndpointOut:
+    return WebhookEndpointOut(
+        id=endpoint.id,
+        url=endpoint.url,
+        events=endpoint.events,
+        active=endpoint.active,
+        created_at=endpoint.created_at or datetime.now(UTC),
     )
 
 
+@router.post("/webhooks", response_model=WebhookEndpointCreateResponse)
+def webhooks_create(
+    payload: WebhookEndpointCreateRequest,
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """Register an endpoint notified when the user's jobs settle (see app.webhooks)."""
+    from app.webhooks import DEFAULT_EVENTS, UnsafeWebhookURL, check_webhook_url, new_secret
+
+    try:
+        check_webhook_url(payload.url.strip())
+    except UnsafeWebhookURL as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    events = None
+    if payload.events is not None:
+        events = sorted({e.strip().upper() for e in payload.events})
+        unknown = set(events) - set(DEFAULT_EVENTS)
+        if not events or unknown:
+            raise HTTPException(
+                status_code=400, detail=f"events must be among {sorted(DEFAULT_EVENTS)}"
+            )
+
+    endpoint = WebhookEndpoint(
+        user_id=user.id, url=payload.url.strip(), secret=new_secret(), events=events, active=True
+    )
+    db.add(endpoint)
+    db.commit()
+    db.refresh(endpoint)
+    return WebhookEndpointCreateResponse(**_webhook_out(endpoint).model_dump(), secret=endpoint.secret)
+
+
+@router.get("/webhooks", response_model=list[WebhookEndpointOut])
+def webhooks_list(db: Session = Depends(get_db), user: User = Depends(get_current_user)):
+    endpoints = (
+        db.query(WebhookEndpoint)
+        .filter(WebhookEndpoint.user_id == user.id, WebhookEndpoint.active.is_(True))
+        .order_by(WebhookEndpoint.created_at)
+        .all()
+    )
+    return [_webhook_out(e) for e in endpoints]
+
+
+@router.delete("/webhooks/{endpoint_id}")
+def webhooks_delete(
+    endpoint_id: str, db: Session = Depends(get_db), user: User = Depends(get_current_user)
+):
+    """Disable an endpoint; its pending deliveries are dropped (marked failed)."""
+    endpoint = db.get(WebhookEndpoint, endpoint_id)
+    if not endpoint or endpoint.user_id != user.id:
+        raise HTTPException(status_code=404, detail="Webhook not found")
+    endpoint.active = False
+    db.commit()
+    return {"ok": True}
+
+
 @router.post("/auth/signup", response_model=AuthResponse)
 @limiter.limit("5/minute")
 def signup(request: Request, payload: AuthSignupRequest, db: Session = Depends(get_db)):
@@ -1202,30 +2106,53 @@ def conversions_stats(
 @router.post("/conversions/archive", response_model=ConversionArchiveResponse)
 def conversions_archive(
     payload: ConversionArchiveRequest,
+    request: Request,
     db: Session = Depends(get_db),
     user: User = Depends(get_current_user),
 ):
     _purge_expired_conversions(db)
 
+    key = idempotency_key(request)
+    if not key:
+        return _archive_conversion(payload, db, user)
+
+    claim_ = idem_claim_blocking(db, "conversions_archive", user.id, key, json_sha256(payload.model_dump(mode="json")))
+    if claim_.replay is not None:
+        return JSONResponse(content=claim_.replay, headers={REPLAY_HEADER: "true"})
+    try:
+        result = _archive_conversion(payload, db, user)
+    except BaseException:
+        idem_release(db, claim_)
+        raise
+    idem_complete(db, claim_, result.model_dump(mode="json"))
+    return result
+
+
+def _archive_conversion(payload: ConversionArchiveRequest, db: Session, user: User) -> ConversionArchiveResponse:
     pdf_data = (payload.pdf_base64 or "").strip()
     if not pdf_data:
         raise HTTPException(status_code=400, detail="Missing pdf_base64")
 
-    try:
-        pdf_bytes = base64.b64decode(pdf_data, validate=True)
-    except Exception:
-        raise HTTPException(status_code=400, detail="Invalid pdf_base64")
-
     record_id = str(uuid.uuid4())
     record_dir = _conversion_record_dir(record_id)
     pdf_path = record_dir / "facturx.pdf"
-    pdf_path.write_bytes(pdf_bytes)
+    try:
+        stored_pdf = store_base64(pdf_data, pdf_path)
+    except UploadTooLarge as e:
+        shutil.rmtree(record_dir, ignore_errors=True)
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception:
+        shutil.rmtree(record_dir, ignore_errors=True)
+        raise HTTPException(status_code=400, detail="Invalid pdf_base64")
 
     xml_path = None
+    xml_sha256 = None
     xml_payload = (payload.xml or "").strip()
     if xml_payload:
         xml_path = record_dir / "invoice.xml"
-        xml_path.write_text(xml_payload, encoding="utf-8")
+        xml_bytes = xml_payload.encode("utf-8")
+        xml_path.write_bytes(xml_bytes)
+        xml_sha256 = hashlib.sha256(xml_bytes).hexdigest()
 
     expires_at = datetime.now(UTC) + timedelta(days=CONVERSION_RETENTION_DAYS)
     metadata = payload.metadata.copy() if payload.metadata else {}
@@ -1243,6 +2170,8 @@ def conversions_archive(
         status=(payload.status or "ready"),
         pdf_path=str(pdf_path),
         xml_path=str(xml_path) if xml_path else None,
+        pdf_sha256=stored_pdf.sha256,
+        xml_sha256=xml_sha256,
         metadata_json=metadata,
         expires_at=expires_at,
     )
@@ -1289,6 +2218,7 @@ def conversions_list(
 def conversions_download(
     record_id: str,
     kind: str,
+    request: Request,
     db: Session = Depends(get_db),
     user: User = Depends(get_current_user),
 ):
@@ -1316,7 +2246,13 @@ def conversions_download(
     if not target_path or not os.path.exists(target_path):
         raise HTTPException(status_code=404, detail="Requested file not available")
 
-    return FileResponse(path=target_path, media_type=media_type, filename=filename)
+    hash_attr = "pdf_sha256" if kind_norm == "pdf" else "xml_sha256"
+    content_sha256 = getattr(record, hash_attr)
+    if not content_sha256:  # archived before the hashes were recorded
+        content_sha256 = file_sha256(target_path)
+        setattr(record, hash_attr, content_sha256)
+        db.commit()
+    return file_download(request, target_path, media_type, filename, content_sha256)
 
 @router.post("/billing/checkout", response_model=BillingCheckoutResponse)
 @limiter.limit("20/minute")
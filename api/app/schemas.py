@@ -11,6 +11,33 @@ class InvoiceCreateResponse(BaseModel):
     status: str
 
 
+class InvoiceBulkCreateResponse(BaseModel):
+    jobs: list[InvoiceCreateResponse]
+    batches: int
+
+
+class BulkConvertItem(BaseModel):
+    index: int
+    file_name: str
+    job_id: str
+    status: str
+    error_message: str | None = None
+    xml_sha256: str | None = None
+
+
+class BulkConvertResponse(BaseModel):
+    group_id: str
+    status: str
+    complete: bool
+    items: list[BulkConvertItem]
+
+
+class InvoiceChildSummary(BaseModel):
+    job_id: str
+    status: str
+    error_message: str | None = None
+
+
 class InvoiceGetResponse(BaseModel):
     job_id: str
     status: str
@@ -21,6 +48,7 @@ class InvoiceGetResponse(BaseModel):
     # conservés (internes / file://)
     output_pdf_url: str | None = None
     output_xml_url: str | None = None
+    xml_sha256: str | None = None
 
     # ✅ nouveau: URL HTTP pour télécharger
     download_url: str | None = None
@@ -29,6 +57,11 @@ class InvoiceGetResponse(BaseModel):
     final_json: dict[str, Any] | None = None
     validation_json: dict[str, Any] | None = None
     error_message: str | None = None
+    metrics: dict[str, Any] | None = None
+
+    # Multi-invoice PDFs: one child job per detected invoice
+    parent_job_id: str | None = None
+    children: list[InvoiceChildSummary] = Field(default_factory=list)
 
 
 class InvoiceConfirmRequest(BaseModel):
@@ -176,6 +209,25 @@ class ConversionArchiveRequest(BaseModel):
     metadata: dict[str, Any] | None = None
 
 
+class WebhookEndpointCreateRequest(BaseModel):
+    url: str
+    # Job statuses to notify: VALIDATED, NEEDS_REVIEW, FAILED (default: all three)
+    events: list[str] | None = None
+
+
+class WebhookEndpointOut(BaseModel):
+    id: str
+    url: str
+    events: list[str] | None = None
+    active: bool
+    created_at: datetime
+
+
+class WebhookEndpointCreateResponse(WebhookEndpointOut):
+    # Signing secret, only returned once
+    secret: str
+
+
 class ConversionArchiveResponse(BaseModel):
     id: str
     file_name: str
@@ -1,7 +1,31 @@
+import base64
+import hashlib
+import os
+from dataclasses import dataclass
 from pathlib import Path
+from typing import BinaryIO
+
+from fastapi import UploadFile
 
 from app.config import settings
 
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+class UploadTooLarge(Exception):
+    """Upload exceeds settings.max_upload_mb (maps to 413)."""
+
+    def __init__(self, limit_bytes: int) -> None:
+        super().__init__(f"File too large (max {limit_bytes // (1024 * 1024)} MB)")
+        self.limit_bytes = limit_bytes
+
+
+@dataclass(frozen=True)
+class StoredFile:
+    path: str
+    size: int
+    sha256: str
+
 
 def job_dir(job_id: str) -> Path:
     root = Path(settings.storage_local_root)
@@ -10,9 +34,106 @@ def job_dir(job_id: str) -> Path:
     return p
 
 
-def save_input_pdf(job_id: str, filename: str, content: bytes) -> str:
-    d = job_dir(job_id)
-    path = d / "input.pdf"
+class _CappedWriter:
+    """Write to `<path>.part`, hash on the fly, abort past `max_bytes`; renamed on commit()."""
+
+    def __init__(self, path: Path, max_bytes: int) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._tmp = path.with_name(path.name + ".part")
+        self._hash = hashlib.sha256()
+        self._f = open(self._tmp, "wb")
+
+    def write(self, chunk: bytes) -> None:
+        self.size += len(chunk)
+        if self.max_bytes and self.size > self.max_bytes:
+            raise UploadTooLarge(self.max_bytes)
+        self._hash.update(chunk)
+        self._f.write(chunk)
+
+    def commit(self) -> StoredFile:
+        self._f.close()
+        os.replace(self._tmp, self.path)
+        return StoredFile(path=str(self.path), size=self.size, sha256=self._hash.hexdigest())
+
+    def abort(self) -> None:
+        self._f.close()
+        self._tmp.unlink(missing_ok=True)
+
+
+def max_upload_bytes() -> int:
+    return max(settings.max_upload_mb, 0) * 1024 * 1024
+
+
+async def store_upload(upload: UploadFile, path: Path, max_bytes: int | None = None) -> StoredFile:
+    """Copy an upload to `path` chunk by chunk (constant memory), hashing it on the way.
+
+    Raises UploadTooLarge as soon as the limit is crossed; nothing is left on disk then.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    writer = _CappedWriter(path, max_upload_bytes() if max_bytes is None else max_bytes)
+    try:
+        while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+            writer.write(chunk)
+    except BaseException:
+        writer.abort()
+        raise
+    return writer.commit()
+
+
+def store_base64(data: str, path: Path, max_bytes: int | None = None) -> StoredFile:
+    """Decode base64 to `path` in chunks: the decoded file never sits in memory as a whole.
+
+    Raises ValueError on invalid base64, UploadTooLarge past the limit.
+    """
+    limit = max_upload_bytes() if max_bytes is None else max_bytes
+    if limit and len(data) * 3 // 4 > limit + 2:
+        raise UploadTooLarge(limit)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    writer = _CappedWriter(path, limit)
+    step = (UPLOAD_CHUNK_SIZE // 3) * 4  # multiple of 4: chunks decode independently
+    try:
+        for i in range(0, len(data), step):
+            writer.write(base64.b64decode(data[i : i + step], validate=True))
+    except BaseException:
+        writer.abort()
+        raise
+    return writer.commit()
+
+
+def store_fileobj(src: BinaryIO, path: Path, max_bytes: int | None = None) -> StoredFile:
+    """Synchronous counterpart of store_upload (e.g. a member of a ZIP archive)."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    writer = _CappedWriter(path, max_upload_bytes() if max_bytes is None else max_bytes)
+    try:
+        while chunk := src.read(UPLOAD_CHUNK_SIZE):
+            writer.write(chunk)
+    except BaseException:
+        writer.abort()
+        raise
+    return writer.commit()
+
+
+async def upload_sha256(upload: UploadFile) -> str:
+    """Hash an upload without consuming it (read in chunks, then rewound)."""
+    h = hashlib.sha256()
+    while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+        h.update(chunk)
+    await upload.seek(0)
+    return h.hexdigest()
+
+
+async def save_input_upload(job_id: str, upload: UploadFile) -> StoredFile:
+    return await store_upload(upload, job_dir(job_id) / "input.pdf")
+
+
+def job_file_path(job_id: str, name: str) -> Path:
+    return job_dir(job_id) / name
+
+
+def save_job_file(job_id: str, name: str, content: bytes) -> str:
+    path = job_file_path(job_id, name)
     path.write_bytes(content)
     return str(path)
 
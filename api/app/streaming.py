@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import json
+import zipfile
+from collections.abc import Iterable, Iterator
+from typing import Any
+
+
+class _ChunkSink:
+    """Write-only, non-seekable file object: zipfile appends, we drain after each entry."""
+
+    def __init__(self) -> None:
+        self._chunks: list[bytes] = []
+        self._pos = 0
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        out = b"".join(self._chunks)
+        self._chunks.clear()
+        return out
+
+
+def iter_zip(entries: Iterable[tuple[str, bytes | str]]) -> Iterator[bytes]:
+    """Build a ZIP on the fly: yields each entry's bytes as soon as it is compressed.
+
+    zipfile writes data descriptors when the target is not seekable, so the archive
+    is never staged in memory or on disk as a whole.
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for name, data in entries:
+            zf.writestr(name, data)
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    tail = sink.drain()
+    if tail:
+        yield tail
+
+
+def iter_ndjson(items: Iterable[dict[str, Any]]) -> Iterator[bytes]:
+    for item in items:
+        yield (json.dumps(item, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+
+
+def parse_ndjson(body: bytes | Iterable[bytes]) -> Iterator[Any]:
+    """Parse NDJSON lazily, line by line (blank lines are skipped).
+
+    `body` is the whole payload or any iterable of lines, e.g. a binary file.
+    """
+    for raw in body.splitlines() if isinstance(body, bytes) else body:
+        if raw.strip():
+            yield json.loads(raw)
+
+
+def iter_file(path: str, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            yield chunk
+
+
+def iter_multipart(
+    parts: Iterable[tuple[dict[str, str], bytes | Iterable[bytes]]], boundary: str
+) -> Iterator[bytes]:
+    """multipart/mixed body: each part is (headers, bytes or an iterator of chunks)."""
+    delimiter = f"--{boundary}\r\n".encode("ascii")
+    for headers, body in parts:
+        yield delimiter
+        yield "".join(f"{k}: {v}\r\n" for k, v in headers.items()).encode("utf-8") + b"\r\n"
+        if isinstance(body, (bytes, bytearray)):
+            yield bytes(body)
+        else:
+            yield from body
+        yield b"\r\n"
+    yield f"--{boundary}--\r\n".encode("ascii")
+
+
+def negotiate(accept: str | None, offered: tuple[str, ...]) -> str:
+    """Pick the best of `offered` for an Accept header (q-values honoured; default: first)."""
+    best, best_q = offered[0], -1.0
+    for item in (accept or "").split(","):
+        media, _, params = item.strip().partition(";")
+        media = media.strip().lower()
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if media in ("*/*", ""):
+            candidate = offered[0]
+        elif media in offered:
+            candidate = media
+        else:
+            continue
+        if q > best_q:
+            best, best_q = candidate, q
+    return best
@@ -0,0 +1,211 @@
+"""OpenTelemetry tracing for the API and the Celery workers.
+
+One trace follows an invoice across HTTP request -> Celery publish -> worker task ->
+pipeline stages -> external tools. The W3C trace context travels in the Celery message
+headers (before_task_publish / task_prerun).
+
+Export is chosen with settings.tracing_exporter: none | otlp | file | console.
+With `none` (default) spans are not recorded and every helper is a cheap no-op.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from collections.abc import Iterator, Sequence
+from contextlib import contextmanager
+from typing import Any
+
+from opentelemetry import context as otel_context
+from opentelemetry import propagate, trace
+from opentelemetry.propagators.textmap import Getter
+from opentelemetry.trace import SpanKind, Status, StatusCode
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+tracer = trace.get_tracer("pont_facturx")
+
+_configured = False
+_configure_lock = threading.Lock()
+
+
+def _file_exporter(path: str) -> Any:
+    from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+
+    class JsonLinesSpanExporter(SpanExporter):
+        """One JSON span per line; a batch is appended with a single write.
+
+        "{pid}" is resolved at export time: prefork children inherit the exporter
+        configured in the parent, and each must still write its own file.
+        """
+
+        def __init__(self, target: str) -> None:
+            self._target = target
+            os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+
+        def export(self, spans: Sequence[Any]) -> Any:
+            path = self._target.replace("{pid}", str(os.getpid()))
+            payload = "".join(s.to_json(indent=None) + "\n" for s in spans)
+            try:
+                with open(path, "a", encoding="utf-8") as f:
+                    f.write(payload)
+            except OSError as e:
+                logger.info("span export to %s failed: %s", path, e)
+                return SpanExportResult.FAILURE
+            return SpanExportResult.SUCCESS
+
+        def shutdown(self) -> None:
+            pass
+
+    return JsonLinesSpanExporter(path)
+
+
+def _make_exporter(kind: str) -> Any:
+    if kind == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+
+        return OTLPSpanExporter(endpoint=settings.otlp_traces_endpoint)
+    if kind == "file":
+        return _file_exporter(settings.tracing_file_path)
+    if kind == "console":
+        from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+
+        return ConsoleSpanExporter()
+    raise ValueError(f"Unknown tracing exporter: {kind}")
+
+
+def configure_tracing(service_name: str) -> None:
+    """Install the SDK tracer provider once per process (no-op when tracing is off)."""
+    global _configured
+    kind = (settings.tracing_exporter or "none").strip().lower()
+    if kind == "none":
+        return
+    with _configure_lock:
+        if _configured:
+            return
+        try:
+            from opentelemetry.sdk.resources import Resource
+            from opentelemetry.sdk.trace import TracerProvider
+            from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+            provider = TracerProvider(resource=Resource.create({"service.name": service_name}))
+            provider.add_span_processor(BatchSpanProcessor(_make_exporter(kind)))
+        except Exception as e:
+            logger.warning(f"⚠️ Tracing disabled ({kind}): {type(e).__name__}: {e}")
+            return
+        trace.set_tracer_provider(provider)
+        _configured = True
+        logger.warning(f"🧭 Tracing enabled: {service_name} -> {kind}")
+
+
+def _attr(value: Any) -> Any:
+    return value if isinstance(value, (str, bool, int, float)) else str(value)
+
+
+def set_attributes(current: Any, attributes: dict[str, Any]) -> None:
+    if current.is_recording():
+        for key, value in attributes.items():
+            if value is not None:
+                current.set_attribute(key, _attr(value))
+
+
+@contextmanager
+def span(name: str, kind: SpanKind = SpanKind.INTERNAL, **attributes: Any) -> Iterator[Any]:
+    """Child span of the current context; exceptions are recorded and mark it ERROR."""
+    with tracer.start_as_current_span(name, kind=kind) as current:
+        set_attributes(current, attributes)
+        yield current
+
+
+@contextmanager
+def tool_span(tool: str, cmd: Sequence[str]) -> Iterator[Any]:
+    """Span around an external tool invocation (ocrmypdf, java/Saxon, veraPDF, ...).
+
+    Callers set `process.exit_code` on the yielded span.
+    """
+    with span(f"tool.{tool}", **{"process.executable.name": tool, "process.command_args": " ".join(cmd)}) as current:
+        yield current
+
+
+def _valid_or_current(ctx: Any) -> Any:
+    """Extracted context if it carries a trace, else None (= continue the current one)."""
+    return ctx if trace.get_current_span(ctx).get_span_context().is_valid else None
+
+
+def extract_http_context(headers: Any) -> Any:
+    return _valid_or_current(propagate.extract(dict(headers)))
+
+
+# --- Celery propagation ---------------------------------------------------------------
+
+
+class _CeleryGetter(Getter):
+    """Custom message headers end up as attributes of `task.request`."""
+
+    def get(self, carrier: Any, key: str) -> list[str] | None:
+        value = getattr(carrier, key, None)
+        if value is None and isinstance(getattr(carrier, "headers", None), dict):
+            value = carrier.headers.get(key)
+        return [value] if isinstance(value, str) else None
+
+    def keys(self, carrier: Any) -> list[str]:
+        return []
+
+
+_celery_getter = _CeleryGetter()
+_task_spans: dict[str, tuple[Any, Any]] = {}
+
+
+def inject_celery_headers(headers: dict[str, Any] | None) -> None:
+    if headers is not None:
+        propagate.inject(headers)
+
+
+def start_task_span(task: Any, task_id: str, args: Sequence[Any] | None = None) -> None:
+    # No trace header (eager/inline call): continue the current context.
+    parent = _valid_or_current(propagate.extract(task.request, getter=_celery_getter))
+    current = tracer.start_span(f"celery.task {task.name}", context=parent, kind=SpanKind.CONSUMER)
+    set_attributes(
+        current,
+        {
+            "celery.task_name": task.name,
+            "celery.task_id": task_id,
+            "celery.retries": getattr(task.request, "retries", None),
+            # Stage tasks receive the job id (or a ctx dict holding it) first.
+            "job_id": _job_id_from_args(args),
+        },
+    )
+    token = otel_context.attach(trace.set_span_in_context(current))
+    _task_spans[task_id] = (current, token)
+
+
+def record_task_failure(task_id: str, exc: BaseException) -> None:
+    entry = _task_spans.get(task_id)
+    if entry:
+        entry[0].record_exception(exc)
+        entry[0].set_status(Status(StatusCode.ERROR, str(exc)))
+
+
+def end_task_span(task_id: str, state: str | None = None) -> None:
+    entry = _task_spans.pop(task_id, None)
+    if not entry:
+        return
+    current, token = entry
+    if state:
+        current.set_attribute("celery.state", state)
+    current.end()
+    otel_context.detach(token)
+
+
+def _job_id_from_args(args: Sequence[Any] | None) -> str | None:
+    if not args:
+        return None
+    first = args[0]
+    if isinstance(first, dict):
+        return first.get("job_id")
+    if isinstance(first, str):
+        return first
+    return None
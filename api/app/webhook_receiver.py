@@ -0,0 +1,98 @@
+"""Local stand-in for a customer webhook endpoint (development and tests).
+
+    python -m app.webhook_receiver --port 9100 --secret whsec_... [--fail-first 2] [--out hooks.jsonl]
+
+Checks the X-PontFacturX-Signature header (401 when it does not match), prints each
+batch and appends it to --out as one JSON line. --fail-first N answers 500 to the
+first N requests to exercise the retries. GET / returns the batches received so far.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+from app.webhooks import SIGNATURE_HEADER, verify_signature
+
+
+class WebhookReceiver(ThreadingHTTPServer):
+    def __init__(
+        self, address: tuple[str, int], secret: str | None, fail_first: int = 0, out: str | None = None
+    ):
+        super().__init__(address, _Handler)
+        self.secret = secret
+        self.fail_remaining = fail_first
+        self.out = out
+        self.batches: list[dict[str, Any]] = []
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: WebhookReceiver
+
+    def _reply(self, status: int, payload: Any) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        with self.server.lock:
+            self._reply(200, self.server.batches)
+
+    def do_POST(self) -> None:
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        secret = self.server.secret
+        if secret and not verify_signature(secret, self.headers.get(SIGNATURE_HEADER, ""), body):
+            self._reply(401, {"error": "bad signature"})
+            return
+        with self.server.lock:
+            if self.server.fail_remaining > 0:
+                self.server.fail_remaining -= 1
+                self._reply(500, {"error": "simulated failure"})
+                return
+            batch = json.loads(body)
+            self.server.batches.append(batch)
+            if self.server.out:
+                with open(self.server.out, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(batch) + "\n")
+        print(f"📬 webhook batch {batch.get('id')}: {len(batch.get('events', []))} event(s)", flush=True)
+        self._reply(200, {"ok": True})
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+def serve_in_thread(secret: str | None = None, fail_first: int = 0, port: int = 0) -> WebhookReceiver:
+    """Start a receiver on 127.0.0.1 in a daemon thread (port 0: any free port)."""
+    server = WebhookReceiver(("127.0.0.1", port), secret, fail_first)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--secret", help="endpoint signing secret (skip verification if omitted)")
+    parser.add_argument("--fail-first", type=int, default=0)
+    parser.add_argument("--out", help="append received batches to this JSONL file")
+    args = parser.parse_args()
+
+    server = WebhookReceiver((args.host, args.port), args.secret, args.fail_first, args.out)
+    print(f"📡 webhook receiver listening on {args.host}:{args.port}", flush=True)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+"""Outbound job webhooks.
+
+When a job owned by a user reaches VALIDATED, NEEDS_REVIEW or FAILED, one
+WebhookDelivery row is stored per matching endpoint (from app.events, after commit).
+The `deliver_webhooks` task (queue `webhooks`) then POSTs all pending events of an
+endpoint as one batch:
+
+    POST <url>
+    X-PontFacturX-Signature: t=<unix ts>,v1=<hex HMAC-SHA256(secret, "<ts>.<body>")>
+    {"id": "<batch id>", "created": <unix ts>, "events": [{"type": "invoice.status", ...}]}
+
+Events arriving within settings.webhook_batch_window_s share a delivery. A send is
+only scheduled when the endpoint had nothing pending: otherwise the already scheduled
+send (or the retry of a failed one, with its exponential backoff) picks the new rows up.
+Rows that used up their attempts are marked failed. Delivery is at least once:
+receivers dedupe on each event's `delivery_id`.
+
+Endpoint URLs must resolve to public addresses, checked at registration, before every
+delivery and on the connected socket itself (a DNS answer changed in between cannot
+redirect a delivery to the database, Redis, localhost or cloud metadata services);
+redirects are not followed.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import hmac
+import ipaddress
+import json
+import logging
+import secrets
+import socket
+import time
+import uuid
+from datetime import UTC, datetime
+from typing import Any
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from sqlalchemy.orm import Session
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from app.config import settings
+from app.db import SessionLocal
+from app.models import WebhookDelivery, WebhookEndpoint
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_HEADER = "X-PontFacturX-Signature"
+# Job statuses an endpoint can subscribe to, and its subscription when it names none
+DEFAULT_EVENTS = ("VALIDATED", "NEEDS_REVIEW", "FAILED")
+_session: requests.Session | None = None
+
+
+class UnsafeWebhookURL(ValueError):
+    """The endpoint URL is not http(s) or does not resolve to public addresses only."""
+
+
+def _is_public(address: str) -> bool:
+    ip = ipaddress.ip_address(address.split("%", 1)[0])
+    if isinstance(ip, ipaddress.IPv6Address) and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+def check_webhook_url(url: str) -> None:
+    """Raise UnsafeWebhookURL unless every address the host resolves to is public.
+
+    Private, loopback, link-local (169.254.169.254), shared and reserved ranges are
+    refused, unless settings.webhook_allow_private_targets (local development).
+    """
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        raise UnsafeWebhookURL("url must be an absolute http(s) URL")
+    if settings.webhook_allow_private_targets:
+        return
+    try:
+        port = parsed.port or (443 if parsed.scheme == "https" else 80)
+        infos = socket.getaddrinfo(parsed.hostname, port, proto=socket.IPPROTO_TCP)
+    except (OSError, ValueError) as e:
+        raise UnsafeWebhookURL(f"url host cannot be resolved: {parsed.hostname}") from e
+    blocked = sorted({info[4][0] for info in infos if not _is_public(info[4][0])})
+    if not infos or blocked:
+        raise UnsafeWebhookURL(
+            f"url must resolve to public addresses only ({parsed.hostname} -> {', '.join(blocked)})"
+        )
+
+
+def _check_peer(sock: socket.socket, host: str) -> None:
+    address = sock.getpeername()[0]
+    if not settings.webhook_allow_private_targets and not _is_public(address):
+        sock.close()
+        raise UnsafeWebhookURL(f"url must resolve to public addresses only ({host} -> {address})")
+
+
+class _PublicHTTPConnection(HTTPConnection):
+    # The address actually connected to, after the resolution made by the connect itself
+    def _new_conn(self) -> socket.socket:
+        sock = super()._new_conn()
+        _check_peer(sock, self.host)
+        return sock
+
+
+class _PublicHTTPSConnection(HTTPSConnection):
+    def _new_conn(self) -> socket.socket:
+        sock = super()._new_conn()
+        _check_peer(sock, self.host)
+        return sock
+
+
+class _PublicHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _PublicHTTPConnection
+
+
+class _PublicHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _PublicHTTPSConnection
+
+
+class _PublicOnlyAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args: Any, **kwargs: Any) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _PublicHTTPConnectionPool,
+            "https": _PublicHTTPSConnectionPool,
+        }
+
+
+def _http() -> requests.Session:
+    """Session whose connections refuse non-public peers (per worker process)."""
+    global _session
+    if _session is None:
+        session = requests.Session()
+        session.trust_env = False  # no environment proxies: the peer must be the endpoint
+        adapter = _PublicOnlyAdapter()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _session = session
+    return _session
+
+
+def new_secret() -> str:
+    return "whsec_" + secrets.token_urlsafe(32)
+
+
+def sign(secret: str, body: bytes, timestamp: int | None = None) -> str:
+    ts = int(time.time()) if timestamp is None else timestamp
+    digest = hmac.new(secret.encode("utf-8"), f"{ts}.".encode("ascii") + body, hashlib.sha256).hexdigest()
+    return f"t={ts},v1={digest}"
+
+
+def verify_signature(secret: str, header: str, body: bytes, tolerance_s: int = 300) -> bool:
+    """Receiver side: check the signature and that the timestamp is recent (replays)."""
+    try:
+        fields = dict(item.split("=", 1) for item in header.split(","))
+        ts = int(fields["t"])
+    except (KeyError, ValueError):
+        return False
+    if tolerance_s and abs(time.time() - ts) > tolerance_s:
+        return False
+    return hmac.compare_digest(sign(secret, body, ts), f"t={ts},v1={fields.get('v1', '')}")
+
+
+def enqueue_job_events(events: list[dict[str, Any]]) -> None:
+    """Store a pending delivery per (event, subscribed endpoint) and schedule the senders.
+
+    `events` are status events carrying the job owner's `user_id`. Best effort: a
+    failure is logged and never reaches the transaction that changed the job.
+    """
+    if not events or not settings.enable_webhooks:
+        return
+    db = SessionLocal()
+    try:
+        user_ids = {ev["user_id"] for ev in events}
+        endpoints = (
+            db.query(WebhookEndpoint)
+            .filter(WebhookEndpoint.user_id.in_(user_ids), WebhookEndpoint.active.is_(True))
+            .all()
+        )
+        # Endpoints with pending rows already have a send (or a retry) scheduled
+        busy = {
+            endpoint_id
+            for (endpoint_id,) in db.query(WebhookDelivery.endpoint_id)
+            .filter(
+                WebhookDelivery.endpoint_id.in_([endpoint.id for endpoint in endpoints]),
+                WebhookDelivery.status == "pending",
+            )
+            .distinct()
+        }
+        to_schedule = set()
+        for endpoint in endpoints:
+            wanted = set(endpoint.events or DEFAULT_EVENTS)
+            for ev in events:
+                if ev["user_id"] == endpoint.user_id and ev["status"] in wanted:
+                    payload = {k: v for k, v in ev.items() if k != "user_id"}
+                    db.add(
+                        WebhookDelivery(endpoint_id=endpoint.id, event={"type": "invoice.status", **payload})
+                    )
+                    if endpoint.id not in busy:
+                        to_schedule.add(endpoint.id)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"⚠️ webhook events not stored: {type(e).__name__}: {e}")
+        return
+    finally:
+        db.close()
+
+    for endpoint_id in to_schedule:
+        schedule_delivery(endpoint_id)
+
+
+def schedule_delivery(endpoint_id: str) -> None:
+    """Send the endpoint's pending events once the batch window has passed."""
+    from app.workers.tasks import deliver_webhooks
+
+    deliver_webhooks.apply_async((endpoint_id,), countdown=max(settings.webhook_batch_window_s, 0))
+
+
+def pending_deliveries(db: Session, endpoint_id: str) -> list[WebhookDelivery]:
+    return (
+        db.query(WebhookDelivery)
+        .filter(WebhookDelivery.endpoint_id == endpoint_id, WebhookDelivery.status == "pending")
+        .order_by(WebhookDelivery.created_at)
+        .limit(max(settings.webhook_batch_max, 1))
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+
+
+def has_pending(db: Session, endpoint_id: str) -> bool:
+    return (
+        db.query(WebhookDelivery.id)
+        .filter(WebhookDelivery.endpoint_id == endpoint_id, WebhookDelivery.status == "pending")
+        .first()
+        is not None
+    )
+
+
+def post_batch(endpoint: WebhookEndpoint, rows: list[WebhookDelivery]) -> None:
+    """POST one signed batch; raises on network errors and non-2xx answers.
+
+    UnsafeWebhookURL when the host no longer resolves to public addresses, or the
+    connection lands on a non-public one.
+    """
+    check_webhook_url(endpoint.url)
+    events = [{**row.event, "delivery_id": row.id} for row in rows]
+    body = json.dumps(
+        {"id": str(uuid.uuid4()), "created": int(time.time()), "events": events},
+        separators=(",", ":"),
+    ).encode("utf-8")
+    response = _http().post(
+        endpoint.url,
+        data=body,
+        headers={
+            "Content-Type": "application/json",
+            "User-Agent": "pont-facturx-webhooks/1",
+            SIGNATURE_HEADER: sign(endpoint.secret, body),
+        },
+        timeout=settings.webhook_timeout_s,
+        allow_redirects=False,
+    )
+    if not 200 <= response.status_code < 300:
+        raise RuntimeError(f"HTTP {response.status_code} from {endpoint.url}")
+
+
+def mark_rows(rows: list[WebhookDelivery], status: str, error: str | None = None) -> None:
+    now = datetime.now(UTC)
+    for row in rows:
+        row.attempts = (row.attempts or 0) + 1
+        row.last_error = error
+        row.status = status
+        if status == "delivered":
+            row.delivered_at = now
@@ -1,6 +1,34 @@
+import logging
+import os
+import shutil
+import tempfile
+import time
+from collections.abc import Callable
+from typing import Any
+
 from celery import Celery
+from celery.signals import (
+    before_task_publish,
+    task_failure,
+    task_postrun,
+    task_prerun,
+    worker_init,
+    worker_process_init,
+    worker_process_shutdown,
+)
 
+from app import events  # noqa: F401  (publishes job status transitions)
 from app.config import settings
+from app.metrics import JOBS_IN_FLIGHT, mark_process_dead, start_worker_exporter
+from app.tracing import (
+    configure_tracing,
+    end_task_span,
+    inject_celery_headers,
+    record_task_failure,
+    start_task_span,
+)
+
+logger = logging.getLogger(__name__)
 
 celery = Celery(
     "pont_facturx",
@@ -8,10 +36,165 @@ celery = Celery(
     backend=settings.redis_url.replace("/0", "/1"),
 )
 
+# Finalize stages run on their own queues so each worker pool can be scaled separately:
+#   light         -> XML build, Factur-X wrap (cheap, pure Python)
+#   ocr           -> PDF/A-3 conversion (ocrmypdf/tesseract/ghostscript, CPU heavy)
+#   java-validate -> Schematron (Saxon) + veraPDF (JVM)
+# Outbound HTTP (webhooks) has its own queue: a slow customer endpoint never holds a stage slot.
 celery.conf.task_routes = {
     "app.workers.tasks.process_invoice": {"queue": "invoices"},
+    "app.workers.tasks.process_invoice_batch": {"queue": "invoices"},
     "app.workers.tasks.finalize_invoice": {"queue": "invoices"},
+    "app.workers.tasks.build_xml_stage": {"queue": "light"},
+    "app.workers.tasks.pdfa_stage": {"queue": "ocr"},
+    "app.workers.tasks.wrap_stage": {"queue": "light"},
+    "app.workers.tasks.validate_stage": {"queue": "java-validate"},
+    "app.workers.tasks.deliver_webhooks": {"queue": "webhooks"},
+    "app.workers.tasks.purge_idempotency_keys": {"queue": "light"},
+}
+
+# Periodic housekeeping, sent by `celery -A app.workers.celery_app.celery beat` (one instance)
+celery.conf.beat_schedule = {
+    "purge-idempotency-keys": {
+        "task": "app.workers.tasks.purge_idempotency_keys",
+        "schedule": settings.idempotency_purge_interval_s,
+    },
 }
 
+# A pool process only reports itself up (and receives tasks) once worker_process_init
+# handlers have returned: give the warm-up time to finish instead of the default 4s.
+celery.conf.worker_proc_alive_timeout = settings.worker_warmup_timeout_s
+
+
+def warm_up() -> dict[str, Any]:
+    """Preload imports, templates, schemas and stylesheets, then run a synthetic invoice
+    through extract -> XML -> XSD -> wrap in a scratch job directory.
+
+    Steps are best-effort: a failing step is logged and reported, never fatal.
+    Subprocess stages (ocrmypdf, Saxon CLI, veraPDF) have nothing to warm in-process.
+    """
+    steps: dict[str, float] = {}
+    errors: dict[str, str] = {}
+
+    def _step(name: str, fn: Callable[[], Any]) -> Any:
+        t0 = time.perf_counter()
+        try:
+            return fn()
+        except Exception as e:
+            errors[name] = f"{type(e).__name__}: {e}"
+        finally:
+            steps[name] = round((time.perf_counter() - t0) * 1000, 1)
+
+    def _imports() -> None:
+        import facturx  # noqa: F401
+        import pdfminer.high_level  # noqa: F401
+        import pikepdf  # noqa: F401
+
+        import app.workers.tasks  # noqa: F401
+
+    def _templates() -> None:
+        from app.pipeline.cii_builder import check_cii_templates
+
+        check_cii_templates()
+
+    def _xsd() -> None:
+        from app.pipeline.validate import PROFILE_TO_XSD_LEVEL, _facturx_xsd
+
+        for level in set(PROFILE_TO_XSD_LEVEL.values()):
+            _facturx_xsd(level)
+
+    def _xslt() -> None:
+        from app.pipeline.schematron import _compiled_xslt, _find_cii_xslt
+
+        xslt_path = _find_cii_xslt(settings.en16931_validators_root)
+        if xslt_path:
+            _compiled_xslt(xslt_path)
+
+    def _synthetic_invoice() -> None:
+        import pikepdf
+
+        from app.pipeline.cii_builder import SAMPLE_INVOICE, render_cii
+        from app.pipeline.extract import extract_invoice_json
+        from app.pipeline.facturx_wrap import wrap_facturx
+        from app.pipeline.validate import validate_xml_xsd_inprocess
+
+        job_id = f"warmup-{os.getpid()}"
+        tmp = tempfile.mkdtemp(prefix="pfx-warmup-")
+        try:
+            pdf_path = os.path.join(tmp, "input.pdf")
+            pdf = pikepdf.new()
+            pdf.add_blank_page()
+            pdf.save(pdf_path)
+
+            _step("extract", lambda: extract_invoice_json(job_id, pdf_path))
+            cii = _step("build_xml", lambda: render_cii("EN16931", SAMPLE_INVOICE))
+            if cii is not None:
+                _step("xsd", lambda: validate_xml_xsd_inprocess(cii.data, "EN16931"))
+                _step("wrap", lambda: wrap_facturx(job_id, pdf_path, cii.data, "EN16931"))
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+            shutil.rmtree(os.path.join("/data", job_id), ignore_errors=True)
+
+    t0 = time.perf_counter()
+    _step("imports", _imports)
+    _step("templates", _templates)
+    _step("xsd_schemas", _xsd)
+    if settings.enable_schematron:
+        _step("xslt", _xslt)
+    _synthetic_invoice()
+    return {
+        "total_ms": round((time.perf_counter() - t0) * 1000, 1),
+        "steps_ms": steps,
+        "errors": errors,
+    }
+
+
+@worker_process_init.connect
+def _warm_up_worker_process(**_: Any) -> None:
+    configure_tracing("pont-facturx-worker")
+    if not settings.enable_worker_warmup:
+        return
+    report = warm_up()
+    logger.warning(f"🔥 Worker {os.getpid()} warm-up done in {report['total_ms']} ms: {report}")
+
+
+@worker_init.connect
+def _start_metrics_exporter(**_: Any) -> None:
+    # solo/threads pools have no worker_process_init; prefork children inherit this provider.
+    configure_tracing("pont-facturx-worker")
+    # Main worker process only; prefork children write to PROMETHEUS_MULTIPROC_DIR.
+    if settings.worker_metrics_port:
+        start_worker_exporter(settings.worker_metrics_port)
+        logger.warning(f"📈 Worker metrics exporter on :{settings.worker_metrics_port}")
+
+
+@worker_process_shutdown.connect
+def _metrics_process_dead(pid: int | None = None, **_: Any) -> None:
+    mark_process_dead(pid or os.getpid())
+
+
+@before_task_publish.connect
+def _propagate_trace(headers: dict[str, Any] | None = None, **_: Any) -> None:
+    inject_celery_headers(headers)
+
+
+@task_prerun.connect
+def _task_started(task_id: str = "", task: Any = None, args: Any = None, **_: Any) -> None:
+    JOBS_IN_FLIGHT.labels(task.name).inc()
+    start_task_span(task, task_id, args)
+
+
+@task_failure.connect
+def _task_failed(task_id: str = "", exception: BaseException | None = None, **_: Any) -> None:
+    if exception is not None:
+        record_task_failure(task_id, exception)
+
+
+@task_postrun.connect
+def _task_finished(task_id: str = "", task: Any = None, state: str | None = None, **_: Any) -> None:
+    JOBS_IN_FLIGHT.labels(task.name).dec()
+    end_task_span(task_id, state)
+
+
 # IMPORTANT: load tasks
 celery.autodiscover_tasks(["app.workers"], force=True)
@@ -1,94 +1,498 @@
 from __future__ import annotations
 
+import json
+import logging
+import uuid
+from collections.abc import Callable, Iterator
 from pathlib import Path
+from typing import Any
 
+from billiard.pool import Pool
+from celery import chain, group
+from celery.exceptions import Ignore
 from sqlalchemy.orm import Session
 
 from app.config import settings
 from app.db import SessionLocal
-from app.models import InvoiceJob, JobStatus
-from app.pipeline.cii_builder import build_cii_xml
+from app.idempotency import purge_expired
+from app.models import InvoiceJob, JobStatus, WebhookDelivery, WebhookEndpoint
+from app.pipeline.checkpoint import file_sha256, inputs_hash, json_sha256, run_checkpointed
+from app.pipeline.cii_builder import build_cii_xml, persist_cii, render_cii, should_stream_cii
+from app.pipeline.embedded import can_skip_pdfa, cii_xml_to_final_json, find_embedded_invoice_xml
 from app.pipeline.extract import extract_invoice_json
 from app.pipeline.facturx_wrap import wrap_facturx
 from app.pipeline.pdfa import ensure_pdfa3
+from app.pipeline.split import detect_invoice_boundaries, split_pdf
+from app.pipeline.stage_metrics import measure_stage
 from app.pipeline.validate import validate_bundle
+from app.pipeline.xml_canon import canonical_sha256_file
+from app.storage import job_dir, path_to_url, save_job_file
+from app.tracing import span
+from app.webhooks import (
+    UnsafeWebhookURL,
+    has_pending,
+    mark_rows,
+    pending_deliveries,
+    post_batch,
+    schedule_delivery,
+)
 from app.workers.celery_app import celery
 
+logger = logging.getLogger(__name__)
+
 
 def _db() -> Session:
     return SessionLocal()
 
 
-def _finalize(job: InvoiceJob) -> None:
-    """Generate XML, wrap PDF, validate."""
-    import logging
-    logger = logging.getLogger(__name__)
-    
-    # 2) Build XML (BASIC WL, MINIMUM, or EN16931)
+def _stage_build_xml(job: InvoiceJob) -> str:
+    """Generate the CII XML (BASIC WL, MINIMUM, or EN16931), written once to the job dir."""
     job.status = JobStatus.XML_READY
-    xml_path = build_cii_xml(job.id, job.profile, job.final_json or {})
+    invoice = job.final_json or {}
+
+    def _build() -> str:
+        if should_stream_cii(job.profile, invoice):
+            xml_path = build_cii_xml(job.id, job.profile, invoice)
+            job.xml_sha256 = canonical_sha256_file(xml_path)
+        else:
+            cii = render_cii(job.profile, invoice)
+            xml_path = persist_cii(job.id, cii)
+            job.xml_sha256 = cii.sha256
+        return xml_path
+
+    xml_path = run_checkpointed(
+        job.id,
+        "build_xml",
+        inputs_hash(json_sha256(invoice), job.profile, settings.cii_builder_engine, settings.cii_output_mode),
+        _build,
+    )
+    if not job.xml_sha256:
+        job.xml_sha256 = canonical_sha256_file(xml_path)
     job.output_xml_url = f"file://{xml_path}"
+    return xml_path
+
 
-    # 3) (Optional) Convert to PDF/A-3 before embedding
+def _stage_pdfa(job: InvoiceJob) -> str:
+    """(Optional) Convert the input to PDF/A-3 before embedding. Returns the PDF to wrap."""
     input_pdf_path = job.input_pdf_url.replace("file://", "")
-    pdf_for_wrap = input_pdf_path
-    
+    return run_checkpointed(
+        job.id,
+        "pdfa",
+        inputs_hash(job.input_sha256 or file_sha256(input_pdf_path), f"convert={settings.enable_pdfa_convert}"),
+        lambda: _convert_pdfa(job.id, input_pdf_path),
+    )
+
+
+def _convert_pdfa(job_id: str, input_pdf_path: str) -> str:
     # DEBUG: Log configuration status
     logger.warning(f"🔍 PDF/A Conversion Check - Flag: {settings.enable_pdfa_convert}, Type: {type(settings.enable_pdfa_convert)}")
-    
+
+    if settings.enable_pdfa_convert and can_skip_pdfa(input_pdf_path):
+        logger.warning(f"⏩ PDF/A conversion SKIPPED - {input_pdf_path} is already Factur-X PDF/A-3")
+        return input_pdf_path
     if settings.enable_pdfa_convert:
         logger.warning(f"✅ PDF/A conversion ENABLED - Converting {input_pdf_path}")
-        out_dir = Path(settings.storage_local_root) / job.id
+        out_dir = Path(settings.storage_local_root) / job_id
         pdfa_path = str(out_dir / "input_pdfa3.pdf")
         pdf_for_wrap = ensure_pdfa3(input_pdf_path, pdfa_path)
         logger.warning(f"✅ PDF/A conversion COMPLETE - Output: {pdf_for_wrap}")
-    else:
-        logger.warning(f"❌ PDF/A conversion DISABLED - Using original PDF")
+        return pdf_for_wrap
+    logger.warning(f"❌ PDF/A conversion DISABLED - Using original PDF")
+    return input_pdf_path
 
-    # 4) Wrap into Factur-X PDF (pass profile for correct metadata)
-    out_pdf = wrap_facturx(job.id, pdf_for_wrap, xml_path, job.profile)
+
+def _stage_wrap(job: InvoiceJob, pdf_for_wrap: str, xml_path: str) -> str:
+    """Wrap into a Factur-X PDF (profile drives the XMP metadata)."""
+    out_pdf = run_checkpointed(
+        job.id,
+        "wrap",
+        inputs_hash(file_sha256(pdf_for_wrap), file_sha256(xml_path), job.profile),
+        lambda: wrap_facturx(job.id, pdf_for_wrap, xml_path, job.profile),
+    )
     job.output_pdf_url = f"file://{out_pdf}"
+    job.output_sha256 = file_sha256(out_pdf)
+    job.status = JobStatus.WRAPPED
+    return out_pdf
+
 
-    # 5) Validate (pass profile to validation for strictness logic)
-    validation = validate_bundle(xml_path, out_pdf, job.profile)
-    job.validation_json = validation
+def _stage_validate(job: InvoiceJob, xml_path: str, out_pdf: str) -> None:
+    """Validate the bundle (profile drives strictness)."""
+    def _validate() -> str:
+        validation = validate_bundle(xml_path, out_pdf, job.profile)
+        return save_job_file(job.id, "validation.json", json.dumps(validation).encode("utf-8"))
+
+    path = run_checkpointed(
+        job.id,
+        "validate",
+        inputs_hash(
+            file_sha256(xml_path),
+            file_sha256(out_pdf),
+            job.profile,
+            f"schematron={settings.enable_schematron}",
+            f"verapdf={settings.enable_verapdf}",
+        ),
+        _validate,
+    )
+    job.validation_json = json.loads(Path(path).read_text(encoding="utf-8"))
     job.status = JobStatus.VALIDATED
 
 
+def _merge_metrics(job: InvoiceJob, metrics: dict[str, Any]) -> None:
+    # Reassign (not mutate) so SQLAlchemy sees the JSON change.
+    if metrics:
+        job.metrics = {**(job.metrics or {}), **metrics}
+
+
+def _run_stage(task: Any, job_id: str, stage: str, fn: Callable[[InvoiceJob], Any]) -> Any:
+    """Run one finalize stage in its own session, recording its metrics on the job.
+
+    Failures are retried (stage only) up to `task.max_retries`; after that the job
+    is marked FAILED and the chain stops.
+    """
+    db = _db()
+    job = None
+    metrics: dict[str, Any] = {}
+    try:
+        job = db.get(InvoiceJob, job_id)
+        if not job:
+            raise Ignore()
+        with measure_stage(metrics, stage, job_id=job_id, profile=job.profile):
+            result = fn(job)
+        _merge_metrics(job, metrics)
+        with span("db.commit", job_id=job_id):
+            db.commit()
+        return result
+    except Ignore:
+        raise
+    except Exception as e:
+        if task.request.retries < task.max_retries:
+            db.rollback()
+            logger.warning(f"🔁 {task.name} failed for {job_id}, retrying: {e}")
+            raise task.retry(exc=e, countdown=settings.stage_retry_delay_s * (task.request.retries + 1))
+        job = db.get(InvoiceJob, job_id)
+        if job:
+            job.status = JobStatus.FAILED
+            job.error_message = str(e)
+            _merge_metrics(job, metrics)
+            db.commit()
+        raise
+    finally:
+        # The last stage (or a final failure) settles the job: let its split parent know.
+        if job is not None and job.parent_job_id and job.status in (JobStatus.VALIDATED, JobStatus.FAILED):
+            _refresh_split_parent(db, job.parent_job_id)
+        db.close()
+
+
+@celery.task(bind=True, max_retries=settings.stage_max_retries)
+def build_xml_stage(self, job_id: str) -> dict[str, str]:
+    xml_path = _run_stage(self, job_id, "build_xml", _stage_build_xml)
+    return {"job_id": job_id, "xml_path": xml_path}
+
+
+@celery.task(bind=True, max_retries=settings.stage_max_retries)
+def pdfa_stage(self, ctx: dict[str, str]) -> dict[str, str]:
+    pdf_for_wrap = _run_stage(self, ctx["job_id"], "pdfa", _stage_pdfa)
+    return {**ctx, "pdf_for_wrap": pdf_for_wrap}
+
+
+@celery.task(bind=True, max_retries=settings.stage_max_retries)
+def wrap_stage(self, ctx: dict[str, str]) -> dict[str, str]:
+    out_pdf = _run_stage(
+        self, ctx["job_id"], "wrap", lambda job: _stage_wrap(job, ctx["pdf_for_wrap"], ctx["xml_path"])
+    )
+    return {**ctx, "out_pdf": out_pdf}
+
+
+@celery.task(bind=True, max_retries=settings.stage_max_retries)
+def validate_stage(self, ctx: dict[str, str]) -> dict[str, str]:
+    _run_stage(
+        self, ctx["job_id"], "validate", lambda job: _stage_validate(job, ctx["xml_path"], ctx["out_pdf"])
+    )
+    return ctx
+
+
+def finalize_pipeline(job_id: str) -> Any:
+    """build_xml (light) -> pdfa (ocr) -> wrap (light) -> validate (java-validate)."""
+    return chain(build_xml_stage.s(job_id), pdfa_stage.s(), wrap_stage.s(), validate_stage.s())
+
+
+def _extract_embedded(job_id: str, input_pdf_path: str) -> dict | None:
+    """Parse an embedded Factur-X/ZUGFeRD XML into final_json, or None to fall back."""
+    embedded = find_embedded_invoice_xml(input_pdf_path)
+    if not embedded:
+        return None
+    name, xml_bytes = embedded
+    try:
+        extracted = cii_xml_to_final_json(job_id, xml_bytes)
+    except Exception as e:
+        logger.warning(f"Embedded {name} could not be parsed for {job_id}, using heuristics: {e}")
+        return None
+    extracted["_debug"]["embedded_file"] = name
+    return extracted
+
+
+def _extract_checkpointed(job_id: str, input_pdf_path: str) -> dict:
+    """Heuristic extraction; OCR is the slow part, so a retry reuses the checkpointed result.
+
+    Module-level (picklable): also run in the batch process pool.
+    """
+    extracted_path = run_checkpointed(
+        job_id,
+        "extract",
+        inputs_hash(file_sha256(input_pdf_path)),
+        lambda: save_job_file(
+            job_id,
+            "extracted.json",
+            json.dumps(extract_invoice_json(job_id, input_pdf_path)).encode("utf-8"),
+        ),
+    )
+    return json.loads(Path(extracted_path).read_text(encoding="utf-8"))
+
+
+def _extract_measured(job_id: str, input_pdf_path: str) -> tuple[dict, dict[str, Any]]:
+    metrics: dict[str, Any] = {}
+    with measure_stage(metrics, "extract", job_id=job_id):
+        extracted = _extract_checkpointed(job_id, input_pdf_path)
+    return extracted, metrics
+
+
+def _extract_many(
+    items: dict[str, str],
+) -> Iterator[tuple[str, tuple[dict, dict[str, Any]] | Exception]]:
+    """Extract {job_id: pdf_path} on a process pool.
+
+    Yields (job_id, (json, metrics)) or (job_id, exception).
+
+    The pool is billiard's: Celery prefork children are daemonic, and
+    concurrent.futures/multiprocessing refuse to start processes from them.
+    """
+    workers = min(settings.batch_extract_workers, len(items))
+    pool = None
+    if workers > 1:
+        try:
+            pool = Pool(processes=workers)
+        except Exception as e:
+            logger.warning(f"⚠️ batch extraction pool unavailable, extracting in-process: {e}")
+
+    if pool is None:
+        for job_id, path in items.items():
+            try:
+                yield job_id, _extract_measured(job_id, path)
+            except Exception as e:
+                yield job_id, e
+        return
+
+    try:
+        pending = {job_id: pool.apply_async(_extract_measured, (job_id, path)) for job_id, path in items.items()}
+        for job_id, result in pending.items():
+            try:
+                yield job_id, result.get()
+            except Exception as e:
+                yield job_id, e
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _split_into_children(db: Session, job: InvoiceJob, input_pdf_path: str) -> list[str]:
+    """Create one child job per invoice found in a multi-invoice PDF.
+
+    Returns the child job ids (empty when the PDF holds a single invoice).
+    """
+    ranges = detect_invoice_boundaries(input_pdf_path)
+    if len(ranges) <= 1:
+        return []
+
+    child_ids = [str(uuid.uuid4()) for _ in ranges]
+    out_paths = [str(job_dir(cid) / "input.pdf") for cid in child_ids]
+    split_pdf(input_pdf_path, ranges, out_paths)
+
+    for cid, out_path in zip(child_ids, out_paths):
+        db.add(
+            InvoiceJob(
+                id=cid,
+                status=JobStatus.UPLOADED,
+                profile=job.profile,
+                input_pdf_url=path_to_url(out_path),
+                parent_job_id=job.id,
+                user_id=job.user_id,
+            )
+        )
+    job.extracted_json = {
+        "split": [
+            {"job_id": cid, "pages": [start + 1, end + 1]}
+            for cid, (start, end) in zip(child_ids, ranges)
+        ]
+    }
+    return child_ids
+
+
+def _refresh_split_parent(db: Session, parent_job_id: str) -> None:
+    """Aggregate the children's statuses onto their parent job.
+
+    The parent row is locked so concurrent children serialize their updates.
+    """
+    parent = (
+        db.query(InvoiceJob).filter(InvoiceJob.id == parent_job_id).with_for_update().one_or_none()
+    )
+    if not parent:
+        return
+    statuses = [
+        row.status
+        for row in db.query(InvoiceJob.status).filter(InvoiceJob.parent_job_id == parent_job_id)
+    ]
+    if not statuses:
+        db.commit()
+        return
+
+    # EXTRACTED is transient (review uploads settle at NEEDS_REVIEW): the chain is still to run
+    pending = {JobStatus.UPLOADED, JobStatus.EXTRACTED, JobStatus.XML_READY, JobStatus.WRAPPED}
+    failed = sum(1 for st in statuses if st == JobStatus.FAILED)
+    if any(st in pending for st in statuses):
+        pass  # keep the parent as is until every child settles
+    elif all(st == JobStatus.VALIDATED for st in statuses):
+        parent.status = JobStatus.VALIDATED
+        parent.error_message = None
+    elif failed:
+        parent.status = JobStatus.FAILED
+        parent.error_message = f"{failed}/{len(statuses)} invoices failed"
+    else:
+        parent.status = JobStatus.NEEDS_REVIEW
+    db.commit()
+
+
 @celery.task(bind=True)
 def process_invoice(self, job_id: str, stop_after_extract: bool = False):
     db = _db()
+    parent_job_id = None
+    dispatched = False
+    metrics: dict[str, Any] = {}
     try:
         job = db.get(InvoiceJob, job_id)
         if not job:
             return
+        parent_job_id = job.parent_job_id
+
+        # 1) Extract (fast path: the PDF already embeds Factur-X/ZUGFeRD XML)
+        input_pdf_path = job.input_pdf_url.replace("file://", "")
+        with measure_stage(metrics, "embedded_xml", job_id=job_id):
+            extracted = _extract_embedded(job_id, input_pdf_path)
 
-        # 1) Extract
-        extracted = extract_invoice_json(job_id, job.input_pdf_url.replace("file://", ""))
+        # 0) Multi-invoice PDF: fan out one child job per invoice
+        if extracted is None and settings.enable_invoice_split and not parent_job_id:
+            with measure_stage(metrics, "split", job_id=job_id):
+                child_ids = _split_into_children(db, job, input_pdf_path)
+            if child_ids:
+                _merge_metrics(job, metrics)
+                db.commit()
+                group(
+                    process_invoice.s(cid, stop_after_extract=stop_after_extract)
+                    for cid in child_ids
+                ).apply_async()
+                return
+
+        if extracted is None:
+            with measure_stage(metrics, "extract", job_id=job_id):
+                extracted = _extract_checkpointed(job_id, input_pdf_path)
         job.extracted_json = extracted
 
         # Keep a working copy for human review/edit. Even if the user wants
         # to review, we prefill final_json with the extracted data.
         job.final_json = extracted
 
-        # Review flow: extraction is always a first-class step.
-        # The UI will take EXTRACTED -> /confirm -> finalize.
-        job.status = JobStatus.EXTRACTED
+        # Review flow: extraction is always a first-class step. A job uploaded for
+        # review settles at NEEDS_REVIEW (events, webhooks); the UI then takes it
+        # through /confirm -> finalize. Otherwise EXTRACTED is transient.
+        job.status = JobStatus.NEEDS_REVIEW if stop_after_extract else JobStatus.EXTRACTED
+        _merge_metrics(job, metrics)
 
-        if stop_after_extract:
+        with span("db.commit", job_id=job_id):
             db.commit()
+        if stop_after_extract:
             return
 
-        _finalize(job)
-        db.commit()
+        finalize_pipeline(job_id).apply_async()
+        dispatched = True
 
     except Exception as e:
         job = db.get(InvoiceJob, job_id)
         if job:
             job.status = JobStatus.FAILED
             job.error_message = str(e)
+            _merge_metrics(job, metrics)
             db.commit()
         raise
+    finally:
+        # Once the finalize chain is dispatched, its last stage refreshes the parent.
+        if parent_job_id and not dispatched:
+            _refresh_split_parent(db, parent_job_id)
+        db.close()
+
+
+@celery.task(bind=True)
+def process_invoice_batch(self, job_ids: list[str], stop_after_extract: bool = False):
+    """Batch variant of `process_invoice` for bulk uploads.
+
+    Jobs are loaded with one query, extracted on a process pool and their status
+    updates committed together. A failing job is marked FAILED without failing the
+    batch. Finalize chains then run on a warm worker (templates, XSD, XSLT cached).
+    """
+    db = _db()
+    try:
+        jobs = db.query(InvoiceJob).filter(InvoiceJob.id.in_(job_ids)).all()
+        by_id = {job.id: job for job in jobs}
+
+        def _extracted(job: InvoiceJob, extracted: dict) -> None:
+            job.extracted_json = extracted
+            job.final_json = extracted
+            job.status = JobStatus.NEEDS_REVIEW if stop_after_extract else JobStatus.EXTRACTED
+
+        def _failed(job: InvoiceJob, e: Exception) -> None:
+            logger.warning(f"❌ batch extraction failed for {job.id}: {e}")
+            job.status = JobStatus.FAILED
+            job.error_message = str(e)
+
+        to_extract: dict[str, str] = {}
+        child_batches: list[list[str]] = []
+        for job in jobs:
+            input_pdf_path = job.input_pdf_url.replace("file://", "")
+            try:
+                extracted = _extract_embedded(job.id, input_pdf_path)
+                if extracted is None and settings.enable_invoice_split and not job.parent_job_id:
+                    child_ids = _split_into_children(db, job, input_pdf_path)
+                    if child_ids:
+                        child_batches.append(child_ids)
+                        continue
+            except Exception as e:
+                _failed(job, e)
+                continue
+            if extracted is None:
+                to_extract[job.id] = input_pdf_path
+            else:
+                _extracted(job, extracted)
+
+        for job_id, result in _extract_many(to_extract):
+            if isinstance(result, Exception):
+                _failed(by_id[job_id], result)
+            else:
+                extracted, metrics = result
+                _extracted(by_id[job_id], extracted)
+                _merge_metrics(by_id[job_id], metrics)
+
+        with span("db.commit", jobs=len(jobs)):
+            db.commit()
+
+        for child_ids in child_batches:
+            process_invoice_batch.delay(child_ids, stop_after_extract=stop_after_extract)
+
+        parents: set[str] = set()
+        for job in jobs:
+            if job.status == JobStatus.EXTRACTED:
+                finalize_pipeline(job.id).apply_async()
+            elif job.parent_job_id and job.status in (JobStatus.NEEDS_REVIEW, JobStatus.FAILED):
+                parents.add(job.parent_job_id)
+        for parent_job_id in parents:
+            _refresh_split_parent(db, parent_job_id)
     finally:
         db.close()
 
@@ -97,10 +501,13 @@ def process_invoice(self, job_id: str, stop_after_extract: bool = False):
 def finalize_invoice(self, job_id: str):
     """Finalize an invoice after the user corrected `final_json` (human-in-the-loop)."""
     db = _db()
+    parent_job_id = None
+    dispatched = False
     try:
         job = db.get(InvoiceJob, job_id)
         if not job:
             return
+        parent_job_id = job.parent_job_id
         if not job.final_json:
             raise RuntimeError("final_json is empty; cannot finalize")
         # ✅ Idempotence: si déjà validé, ne rien faire
@@ -110,8 +517,8 @@ def finalize_invoice(self, job_id: str):
         # ✅ on finalise seulement si XML_READY (après confirm)
         if job.status != JobStatus.XML_READY:
             return
-        _finalize(job)
-        db.commit()
+        finalize_pipeline(job_id).apply_async()
+        dispatched = True
     except Exception as e:
         job = db.get(InvoiceJob, job_id)
         if job:
@@ -119,5 +526,75 @@ def finalize_invoice(self, job_id: str):
             job.error_message = str(e)
             db.commit()
         raise
+    finally:
+        if parent_job_id and not dispatched:
+            _refresh_split_parent(db, parent_job_id)
+        db.close()
+
+
+def _post_webhook_batch(
+    task: Any, db: Session, endpoint: WebhookEndpoint, rows: list[WebhookDelivery]
+) -> None:
+    try:
+        post_batch(endpoint, rows)
+    except UnsafeWebhookURL as e:
+        # Not retried: the host now points at a private address.
+        mark_rows(rows, "failed", str(e))
+        db.commit()
+        logger.warning(f"🚫 webhook batch to {endpoint.url} refused: {e}")
+        return
+    except Exception as e:
+        mark_rows(rows, "pending", str(e))
+        for row in rows:
+            if row.attempts >= settings.webhook_max_attempts:
+                row.status = "failed"
+        db.commit()
+        retrying = [row.attempts for row in rows if row.status == "pending"]
+        logger.warning(f"🔁 webhook batch to {endpoint.url} failed ({len(rows)} events): {e}")
+        if retrying:
+            countdown = min(
+                settings.webhook_retry_base_s * 2 ** (max(retrying) - 1), settings.webhook_retry_max_s
+            )
+            raise task.retry(exc=e, countdown=countdown, max_retries=None)
+        return
+    mark_rows(rows, "delivered")
+    db.commit()
+
+
+@celery.task(bind=True)
+def deliver_webhooks(self, endpoint_id: str):
+    """POST the endpoint's pending job events as one signed batch (see app.webhooks).
+
+    A failed batch stays pending and the task retries with exponential backoff (the
+    only resend: new events of the endpoint wait for it); events that used up
+    settings.webhook_max_attempts are marked failed.
+    """
+    db = _db()
+    try:
+        rows = pending_deliveries(db, endpoint_id)
+        if not rows:
+            return
+        endpoint = db.get(WebhookEndpoint, endpoint_id)
+        if not endpoint or not endpoint.active:
+            mark_rows(rows, "failed", "endpoint disabled")
+            db.commit()
+        else:
+            _post_webhook_batch(self, db, endpoint, rows)
+        # Events stored while this batch was sent did not schedule a send of their own
+        if has_pending(db, endpoint_id):
+            schedule_delivery(endpoint_id)
+    finally:
+        db.close()
+
+
+@celery.task
+def purge_idempotency_keys() -> int:
+    """Delete expired Idempotency-Key records (celery beat, see celery_app.beat_schedule)."""
+    db = _db()
+    try:
+        deleted = purge_expired(db)
     finally:
         db.close()
+    if deleted:
+        logger.info(f"🧹 {deleted} expired idempotency key(s) purged")
+    return deleted
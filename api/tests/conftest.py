@@ -0,0 +1,37 @@
+import os
+import tempfile
+
+# Settings and the engine are built at import time: point them at scratch storage first.
+_ROOT = tempfile.mkdtemp(prefix="pfx-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_ROOT}/test.sqlite")
+os.environ.setdefault("STORAGE_LOCAL_ROOT", _ROOT)
+os.environ.setdefault("REDIS_URL", "redis://127.0.0.1:1/0")  # unreachable: best-effort paths
+os.environ.setdefault("ENABLE_PDFA_CONVERT", "0")
+
+import pytest  # noqa: E402
+
+from app.db import Base, SessionLocal, engine  # noqa: E402
+from app.workers.celery_app import celery  # noqa: E402
+
+
+@pytest.fixture(autouse=True, scope="session")
+def _schema():
+    import app.models  # noqa: F401
+
+    Base.metadata.create_all(engine)
+    celery.conf.task_always_eager = True
+    yield
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def storage_root() -> str:
+    return _ROOT
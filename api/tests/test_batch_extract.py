@@ -0,0 +1,46 @@
+import uuid
+
+import billiard
+
+from app.config import settings
+from app.db import engine
+from app.models import InvoiceJob, JobStatus
+from app.storage import save_job_file
+from app.workers import tasks
+
+
+def _fake_extract(job_id: str, input_pdf_path: str) -> dict:
+    return {"invoice_number": job_id[:8]}
+
+
+def _run_batch(job_ids: list[str]) -> None:
+    engine.dispose()  # connections are not shared across fork
+    tasks.process_invoice_batch.apply(args=(job_ids,), kwargs={"stop_after_extract": True})
+
+
+def test_batch_runs_in_a_daemonic_worker_process(db, monkeypatch):
+    # Celery prefork children are daemonic: the extraction pool must still start there.
+    monkeypatch.setattr(settings, "batch_extract_workers", 2)
+    monkeypatch.setattr(settings, "enable_invoice_split", False)
+    monkeypatch.setattr(settings, "enable_stage_checkpoints", False)
+    monkeypatch.setattr(tasks, "_extract_embedded", lambda job_id, path: None)
+    monkeypatch.setattr(tasks, "_extract_checkpointed", _fake_extract)
+
+    job_ids = []
+    for _ in range(3):
+        job_id = str(uuid.uuid4())
+        path = save_job_file(job_id, "input.pdf", b"%PDF-1.4 test")
+        db.add(InvoiceJob(id=job_id, input_pdf_url=f"file://{path}"))
+        job_ids.append(job_id)
+    db.commit()
+
+    proc = billiard.Process(target=_run_batch, args=(job_ids,), daemon=True)
+    proc.start()
+    proc.join(60)
+    assert proc.exitcode == 0
+
+    db.expire_all()
+    for job_id in job_ids:
+        job = db.get(InvoiceJob, job_id)
+        assert job.status == JobStatus.NEEDS_REVIEW, job.error_message
+        assert job.extracted_json == {"invoice_number": job_id[:8]}
@@ -0,0 +1,59 @@
+import uuid
+from pathlib import Path
+
+import pytest
+
+from app.config import settings
+from app.pipeline.checkpoint import MANIFEST_NAME, inputs_hash, load_manifest, run_checkpointed
+from app.storage import job_file_path, save_job_file
+
+
+@pytest.fixture
+def job_id() -> str:
+    return str(uuid.uuid4())
+
+
+def _counting_stage(job_id: str, calls: list[str]):
+    def _run() -> str:
+        calls.append("run")
+        return save_job_file(job_id, "out.txt", f"run {len(calls)}".encode())
+
+    return _run
+
+
+def test_stage_with_same_inputs_is_skipped(job_id):
+    calls: list[str] = []
+    first = run_checkpointed(job_id, "build_xml", inputs_hash("a"), _counting_stage(job_id, calls))
+    again = run_checkpointed(job_id, "build_xml", inputs_hash("a"), _counting_stage(job_id, calls))
+
+    assert calls == ["run"] and again == first
+    assert load_manifest(job_id)["build_xml"]["input_hash"] == inputs_hash("a")
+
+
+def test_stage_reruns_when_inputs_change_or_output_is_gone(job_id):
+    calls: list[str] = []
+    out = run_checkpointed(job_id, "wrap", inputs_hash("a"), _counting_stage(job_id, calls))
+    run_checkpointed(job_id, "wrap", inputs_hash("b"), _counting_stage(job_id, calls))
+    Path(out).unlink()
+    run_checkpointed(job_id, "wrap", inputs_hash("b"), _counting_stage(job_id, calls))
+
+    assert calls == ["run", "run", "run"]
+
+
+def test_unreadable_manifest_is_ignored(job_id):
+    job_file_path(job_id, MANIFEST_NAME).write_text("{truncated", encoding="utf-8")
+    calls: list[str] = []
+    run_checkpointed(job_id, "pdfa", inputs_hash("a"), _counting_stage(job_id, calls))
+
+    assert calls == ["run"]
+    assert "pdfa" in load_manifest(job_id)
+
+
+def test_checkpoints_can_be_disabled(job_id, monkeypatch):
+    monkeypatch.setattr(settings, "enable_stage_checkpoints", False)
+    calls: list[str] = []
+    for _ in range(2):
+        run_checkpointed(job_id, "validate", inputs_hash("a"), _counting_stage(job_id, calls))
+
+    assert calls == ["run", "run"]
+    assert load_manifest(job_id) == {}
@@ -0,0 +1,43 @@
+import pytest
+
+from app.config import settings
+from app.pipeline.cii_builder import SAMPLE_INVOICE, build_cii_xml, render_cii, should_stream_cii
+from app.pipeline.xml_canon import canonical_sha256_file
+
+LINE = {"description": "Article", "quantity": 2, "unit_price": 1.5, "total": 3.0, "vat_rate": 20}
+
+
+@pytest.fixture
+def many_lines() -> dict:
+    n = settings.cii_stream_min_lines
+    return dict(SAMPLE_INVOICE, lines=[dict(LINE, description=f"Article {i}") for i in range(n)])
+
+
+@pytest.mark.parametrize(
+    ("engine", "mode", "streamed"),
+    [
+        ("lxml", "minified", True),
+        ("lxml", "pretty", False),
+        ("lxml", "c14n", False),
+        ("jinja", "minified", False),
+        ("jinja", "pretty", False),
+    ],
+)
+def test_streaming_follows_the_configuration(monkeypatch, many_lines, engine, mode, streamed):
+    monkeypatch.setattr(settings, "cii_builder_engine", engine)
+    monkeypatch.setattr(settings, "cii_output_mode", mode)
+
+    assert should_stream_cii("EN16931", many_lines) is streamed
+    assert should_stream_cii("BASIC_WL", many_lines) is False
+
+
+def test_streamed_file_matches_the_rendered_output(monkeypatch, many_lines):
+    monkeypatch.setattr(settings, "cii_builder_engine", "lxml")
+    monkeypatch.setattr(settings, "cii_output_mode", "minified")
+
+    path = build_cii_xml("stream-job", "EN16931", many_lines)
+    rendered = render_cii("EN16931", many_lines)
+
+    with open(path, "rb") as f:
+        assert b"\n  <" not in f.read()  # minified, like the rendered output
+    assert canonical_sha256_file(path) == rendered.sha256
@@ -0,0 +1,55 @@
+import pytest
+from lxml import etree
+
+from app.config import settings
+from app.pipeline import validate
+from app.pipeline.cii_builder import SAMPLE_INVOICE, render_cii
+from app.pipeline.cii_tree import compare_engines
+
+CORPUS = [
+    SAMPLE_INVOICE,
+    dict(SAMPLE_INVOICE, invoice_number="F-2", currency="USD", iban="FR7630006000011234567890189"),
+    dict(
+        SAMPLE_INVOICE,
+        invoice_number="F-3",
+        lines=[
+            {"description": "Café", "quantity": 3, "unit_price": 12.5, "total": 37.5, "vat_rate": 5.5},
+            {"description": "Livraison", "quantity": 1, "unit_price": 9.9, "total": 9.9},
+        ],
+    ),
+]
+
+
+def test_lxml_engine_matches_the_templates():
+    assert compare_engines(CORPUS) == []
+
+
+@pytest.mark.parametrize("profile", ["MINIMUM", "BASIC_WL", "EN16931"])
+def test_lxml_engine_keeps_its_tree(monkeypatch, profile):
+    monkeypatch.setattr(settings, "cii_builder_engine", "lxml")
+    monkeypatch.setattr(settings, "cii_output_mode", "pretty")
+
+    cii = render_cii(profile, SAMPLE_INVOICE)
+
+    assert cii._tree is not None  # built, not reparsed from the bytes
+    assert etree.tostring(cii.tree) == etree.tostring(etree.fromstring(cii.data))
+
+
+def test_validate_bundle_reuses_the_given_tree(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "enable_schematron", False)
+    monkeypatch.setattr(settings, "enable_verapdf", False)
+    cii = render_cii("BASIC_WL", SAMPLE_INVOICE)
+    pdf = tmp_path / "out.pdf"
+    pdf.write_bytes(b"%PDF-1.7\n" + b"0" * 2000)
+
+    xml_path = str(tmp_path / "factur-x.xml")
+    parse = etree.parse
+
+    def _parse(source, *args, **kwargs):
+        assert source != xml_path, "xml_doc given: the XML must not be parsed again"
+        return parse(source, *args, **kwargs)
+
+    monkeypatch.setattr(validate.etree, "parse", _parse)
+    result = validate.validate_bundle(xml_path, str(pdf), "BASIC_WL", cii.tree)
+
+    assert result["xml_xsd"]["status"] == "ok"
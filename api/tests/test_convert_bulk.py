@@ -0,0 +1,88 @@
+import io
+import json
+import os
+import uuid
+import zipfile
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.models import InvoiceJob, JobStatus
+from app.routes import invoices
+from app.storage import save_job_file
+
+PDF = b"%PDF-1.4 test"
+
+
+@pytest.fixture
+def queued(monkeypatch) -> list[str]:
+    """Job ids whose finalize chain was dispatched (not run)."""
+    queued: list[str] = []
+
+    class _Chain:
+        def __init__(self, job_id: str) -> None:
+            self.job_id = job_id
+
+        def apply_async(self) -> None:
+            queued.append(self.job_id)
+
+    monkeypatch.setattr(invoices, "finalize_pipeline", _Chain)
+    return queued
+
+
+@pytest.fixture
+def client(queued) -> TestClient:
+    return TestClient(app)
+
+
+def _bulk(client: TestClient) -> dict:
+    response = client.post(
+        "/v1/invoices/convert-bulk",
+        files=[("files", ("a.pdf", PDF, "application/pdf")), ("files", ("b.pdf", PDF, "application/pdf"))],
+        data={"invoice_data": json.dumps({"file": "a.pdf", "invoice_data": {"invoiceNumber": "F-1"}})},
+    )
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_bulk_queues_the_items_with_invoice_data(client, queued):
+    body = _bulk(client)
+
+    assert [(i["file_name"], i["status"]) for i in body["items"]] == [
+        ("a.pdf", "XML_READY"),
+        ("b.pdf", "FAILED"),
+    ]
+    assert body["items"][1]["error_message"] == "missing invoice_data"
+    assert queued == [body["items"][0]["job_id"]]
+    assert body["complete"] is False
+
+
+def test_download_streams_converted_items_and_a_manifest(client, db):
+    body = _bulk(client)
+    done = db.get(InvoiceJob, body["items"][0]["job_id"])
+    done.status = JobStatus.VALIDATED
+    done.output_pdf_url = "file://" + save_job_file(done.id, "output_facturx.pdf", PDF)
+    db.commit()
+
+    status = client.get(f"/v1/invoices/convert-bulk/{body['group_id']}").json()
+    assert status["complete"] is True
+
+    response = client.get(f"/v1/invoices/convert-bulk/{body['group_id']}/download")
+    archive = zipfile.ZipFile(io.BytesIO(response.content))
+    assert archive.namelist() == ["factur-x/a.pdf", "manifest.json"]
+    assert archive.read("factur-x/a.pdf") == PDF
+    manifest = json.loads(archive.read("manifest.json"))
+    assert [i.get("output") for i in manifest["items"]] == ["factur-x/a.pdf", None]
+
+
+@pytest.mark.parametrize(
+    "group_id",
+    [str(uuid.uuid4()), "not-a-uuid", str(uuid.uuid4()).upper(), "{" + str(uuid.uuid4()) + "}"],
+)
+def test_unknown_groups_are_404_without_touching_the_disk(client, storage_root, group_id):
+    before = set(os.listdir(storage_root))
+
+    assert client.get(f"/v1/invoices/convert-bulk/{group_id}").status_code == 404
+    assert client.get(f"/v1/invoices/convert-bulk/{group_id}/download").status_code == 404
+    assert set(os.listdir(storage_root)) == before
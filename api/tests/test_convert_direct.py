@@ -0,0 +1,77 @@
+import base64
+import io
+import json
+import shutil
+
+import pikepdf
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.pipeline import facturx_wrap
+from app.storage import job_dir
+
+
+def _fake_wrap(job_id: str, input_pdf_path: str, xml: bytes, profile: str = "basic") -> str:
+    # The factur-x library is exercised by the worker tests; here only the response shapes matter
+    out = job_dir(job_id) / "output_facturx.pdf"
+    shutil.copyfile(input_pdf_path, out)
+    return str(out)
+
+
+@pytest.fixture
+def convert(monkeypatch):
+    monkeypatch.setattr(facturx_wrap, "wrap_facturx", _fake_wrap)
+    client = TestClient(app)
+    buf = io.BytesIO()
+    pdf = pikepdf.new()
+    pdf.add_blank_page()
+    pdf.save(buf)
+
+    def _post(accept: str | None, number: str = "F-1"):
+        return client.post(
+            "/v1/invoices/convert-direct",
+            files={"file": ("in.pdf", buf.getvalue(), "application/pdf")},
+            data={"invoice_data": json.dumps({"invoiceNumber": number}), "profile": "BASIC_WL"},
+            headers={"Accept": accept} if accept else {},
+        )
+
+    return _post
+
+
+def test_json_is_the_default(convert):
+    response = convert(None)
+
+    assert response.status_code == 200
+    assert "Accept" in response.headers["vary"]
+    body = response.json()
+    assert base64.b64decode(body["pdf_base64"]).startswith(b"%PDF")
+    assert "<rsm:CrossIndustryInvoice" in body["xml"]
+
+
+def test_pdf_is_streamed_with_metadata_headers(convert):
+    expected = convert("application/json", "F-2").json()
+    response = convert("application/pdf", "F-2")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/pdf"
+    assert response.content.startswith(b"%PDF")
+    assert response.headers["x-facturx-profile"] == "BASIC_WL"
+    assert response.headers["x-facturx-xml-sha256"] == expected["xml_sha256"]
+    assert json.loads(response.headers["x-facturx-validation"]) == expected["validation"]
+
+
+def test_multipart_has_json_xml_and_pdf_parts(convert):
+    response = convert("multipart/mixed; q=1.0, application/json; q=0.5", "F-3")
+
+    assert response.status_code == 200
+    content_type = response.headers["content-type"]
+    assert content_type.startswith("multipart/mixed; boundary=")
+    boundary = content_type.split("boundary=")[1].strip('"').encode()
+    parts = response.content.split(b"--" + boundary)[1:-1]
+    assert [p.split(b"\r\n")[1] for p in parts] == [
+        b"Content-Type: application/json",
+        b"Content-Type: application/xml; charset=utf-8",
+        b"Content-Type: application/pdf",
+    ]
+    assert b"%PDF" in parts[2]
@@ -0,0 +1,44 @@
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.exc import IntegrityError
+
+from app.db import SessionLocal, get_db
+from app.main import app
+from app.models import InvoiceJob
+from app.routes import invoices
+
+
+@pytest.fixture
+def failing_commit_db():
+    session = SessionLocal()
+
+    def _commit():
+        raise IntegrityError("INSERT INTO invoice_jobs", {}, Exception("duplicate key"))
+
+    session.commit = _commit
+    app.dependency_overrides[get_db] = lambda: session
+    try:
+        yield session
+    finally:
+        app.dependency_overrides.pop(get_db, None)
+        session.close()
+
+
+def test_failed_bulk_commit_rolls_back_and_discards_uploads(
+    failing_commit_db, storage_root, monkeypatch
+):
+    dispatched = []
+    monkeypatch.setattr(invoices.process_invoice_batch, "delay", lambda *a, **kw: dispatched.append(a))
+    before = set(os.listdir(storage_root))
+    files = [("files", (f"f{i}.pdf", b"%PDF-1.4 test", "application/pdf")) for i in range(3)]
+
+    response = TestClient(app).post("/v1/invoices", files=files)
+
+    assert response.status_code == 500
+    assert "no job was created" in response.json()["detail"]
+    assert set(os.listdir(storage_root)) == before
+    assert dispatched == []
+    # The session was rolled back and is usable again
+    assert failing_commit_db.query(InvoiceJob).filter(InvoiceJob.id == "missing").count() == 0
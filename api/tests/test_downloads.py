@@ -0,0 +1,94 @@
+import hashlib
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.config import settings
+from app.main import app
+from app.models import ConversionRecord, InvoiceJob, JobStatus, User
+from app.security import create_access_token
+from app.storage import path_to_url, save_job_file
+
+PDF = b"%PDF-1.4 factur-x output" + b"0" * 1000
+
+
+@pytest.fixture
+def job(db) -> InvoiceJob:
+    job_id = str(uuid.uuid4())
+    path = save_job_file(job_id, "output_facturx.pdf", PDF)
+    job = InvoiceJob(
+        id=job_id,
+        status=JobStatus.VALIDATED,
+        input_pdf_url="file:///tmp/input.pdf",
+        output_pdf_url=path_to_url(path),
+    )
+    db.add(job)
+    db.commit()
+    return job
+
+
+def test_strong_etag_from_the_content_hash(db, job):
+    client = TestClient(app)
+    response = client.get(f"/v1/invoices/{job.id}/download")
+
+    assert response.status_code == 200
+    assert response.content == PDF
+    digest = hashlib.sha256(PDF).hexdigest()
+    assert response.headers["ETag"] == f'"{digest}"'
+    db.expire_all()
+    assert db.get(InvoiceJob, job.id).output_sha256 == digest  # recorded for the next requests
+
+    cached = client.get(f"/v1/invoices/{job.id}/download", headers={"If-None-Match": f'"{digest}"'})
+    assert cached.status_code == 304
+    assert cached.content == b""
+
+
+def test_range_request(job):
+    response = TestClient(app).get(f"/v1/invoices/{job.id}/download", headers={"Range": "bytes=0-7"})
+
+    assert response.status_code == 206
+    assert response.content == PDF[:8]
+    assert response.headers["Content-Range"] == f"bytes 0-7/{len(PDF)}"
+
+
+def test_x_accel_offload(job, monkeypatch):
+    monkeypatch.setattr(settings, "download_offload", "x-accel")
+
+    response = TestClient(app).get(f"/v1/invoices/{job.id}/download")
+
+    assert response.status_code == 200
+    assert response.content == b""  # streamed by the proxy
+    assert response.headers["X-Accel-Redirect"] == f"/_protected/{job.id}/output_facturx.pdf"
+    assert response.headers["Content-Disposition"] == 'attachment; filename="output_facturx.pdf"'
+    assert response.headers["ETag"]
+
+
+def test_x_sendfile_offload(job, monkeypatch):
+    monkeypatch.setattr(settings, "download_offload", "x-sendfile")
+
+    response = TestClient(app).get(f"/v1/invoices/{job.id}/download")
+
+    assert response.headers["X-Sendfile"].endswith(f"/{job.id}/output_facturx.pdf")
+
+
+def test_conversion_xml_download(db):
+    user = User(id=str(uuid.uuid4()), email=f"{uuid.uuid4().hex}@example.com", hashed_password="x")
+    xml = b"<rsm:CrossIndustryInvoice/>"
+    xml_path = save_job_file(str(uuid.uuid4()), "invoice.xml", xml)
+    record = ConversionRecord(
+        user_id=user.id, file_name="f.pdf", pdf_path="/missing.pdf", xml_path=str(xml_path)
+    )
+    db.add_all([user, record])
+    db.commit()
+    headers = {"Authorization": f"Bearer {create_access_token(user.id)}"}
+    client = TestClient(app)
+
+    response = client.get(f"/v1/conversions/{record.id}/xml", headers=headers)
+    assert response.status_code == 200
+    assert response.content == xml
+    etag = response.headers["ETag"]
+    assert etag == f'"{hashlib.sha256(xml).hexdigest()}"'
+
+    headers["If-None-Match"] = f"W/{etag}"  # weak comparison for If-None-Match
+    assert client.get(f"/v1/conversions/{record.id}/xml", headers=headers).status_code == 304
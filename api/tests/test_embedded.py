@@ -0,0 +1,65 @@
+import uuid
+
+import pikepdf
+import pytest
+
+from app.pipeline.cii_builder import SAMPLE_INVOICE, render_cii
+from app.pipeline.embedded import GUIDELINE_TO_PROFILE, can_skip_pdfa, cii_xml_to_final_json
+from app.storage import job_dir
+from app.workers import tasks
+
+BASIC_GUIDELINE = "urn:cen.eu:en16931:2017#compliant#urn:factur-x.eu:1p0:basic"
+
+
+def _pdf(xml: bytes | None = None, pdfa3: bool = False) -> str:
+    path = str(job_dir(str(uuid.uuid4())) / "input.pdf")
+    pdf = pikepdf.new()
+    pdf.add_blank_page()
+    if xml is not None:
+        pdf.attachments["factur-x.xml"] = pikepdf.AttachedFileSpec(pdf, xml, filename="factur-x.xml")
+    if pdfa3:
+        with pdf.open_metadata(set_pikepdf_as_editor=False) as meta:
+            meta["pdfaid:part"] = "3"
+            meta["pdfaid:conformance"] = "B"
+    pdf.save(path)
+    return path
+
+
+@pytest.fixture
+def facturx_xml() -> bytes:
+    return render_cii("BASIC_WL", SAMPLE_INVOICE).data
+
+
+def test_embedded_xml_becomes_final_json(facturx_xml):
+    extracted = tasks._extract_embedded("job-1", _pdf(facturx_xml))
+
+    assert extracted["invoice_number"] == SAMPLE_INVOICE["invoice_number"]
+    assert extracted["_debug"]["source"] == "embedded_xml"
+    assert extracted["_debug"]["embedded_file"] == "factur-x.xml"
+    assert extracted["_debug"]["profile"] == "BASIC_WL"
+
+
+def test_pdf_without_xml_falls_back_to_extraction():
+    assert tasks._extract_embedded("job-1", _pdf()) is None
+
+
+def test_basic_guideline_is_not_downgraded(facturx_xml):
+    xml = facturx_xml.replace(b"urn:factur-x.eu:1p0:basicwl", BASIC_GUIDELINE.encode())
+
+    assert GUIDELINE_TO_PROFILE[BASIC_GUIDELINE] == "BASIC"
+    assert cii_xml_to_final_json("job-1", xml)["_debug"]["profile"] == "BASIC"
+
+
+def test_zugferd1_root_is_rejected():
+    with pytest.raises(ValueError, match="CrossIndustryDocument"):
+        cii_xml_to_final_json("job-1", b"<CrossIndustryDocument/>")
+
+
+def test_pdfa_pass_skipped_only_for_valid_embedded_xml(facturx_xml):
+    assert can_skip_pdfa(_pdf(facturx_xml, pdfa3=True))
+    # The XMP claim alone, a non-PDF/A-3 file or XML failing its XSD all keep the pass
+    assert not can_skip_pdfa(_pdf(pdfa3=True))
+    assert not can_skip_pdfa(_pdf(facturx_xml))
+    invalid = facturx_xml.replace(b"<ram:TypeCode>380</ram:TypeCode>", b"")
+    assert invalid != facturx_xml
+    assert not can_skip_pdfa(_pdf(invalid, pdfa3=True))
@@ -0,0 +1,67 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.executor import BoundedPool, PoolSaturated
+
+
+def _pool(max_queue: int = 4, max_wait_s: float = 5.0) -> BoundedPool:
+    return BoundedPool("test", max_workers=1, max_queue=max_queue, max_wait_s=max_wait_s)
+
+
+def test_slot_is_returned_when_the_running_request_is_cancelled():
+    pool = _pool()
+    release = threading.Event()
+
+    async def scenario():
+        running = asyncio.create_task(pool.run(lambda: release.wait(5)))
+        while pool._slots is None or not pool._slots.locked():
+            await asyncio.sleep(0.01)
+        running.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await running
+        assert not pool._slots.locked()
+        release.set()
+        assert await pool.run(lambda: "next") == "next"
+
+    asyncio.run(scenario())
+
+
+def test_slot_is_returned_when_a_waiting_request_is_cancelled():
+    pool = _pool()
+    release = threading.Event()
+
+    async def scenario():
+        first = asyncio.create_task(pool.run(lambda: release.wait(5)))
+        while pool._slots is None or not pool._slots.locked():
+            await asyncio.sleep(0.01)
+        waiting = asyncio.create_task(pool.run(lambda: "never"))
+        await asyncio.sleep(0.05)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        release.set()
+        await first
+        assert not pool._slots.locked()
+        assert pool._waiting == 0
+
+    asyncio.run(scenario())
+
+
+def test_max_wait_maps_to_pool_saturated():
+    pool = _pool(max_wait_s=0.05)
+    release = threading.Event()
+
+    async def scenario():
+        first = asyncio.create_task(pool.run(lambda: release.wait(5)))
+        while pool._slots is None or not pool._slots.locked():
+            await asyncio.sleep(0.01)
+        with pytest.raises(PoolSaturated) as exc:
+            await pool.run(lambda: "late")
+        assert exc.value.reason == "max_wait"
+        release.set()
+        await first
+        assert not pool._slots.locked()
+
+    asyncio.run(scenario())
@@ -0,0 +1,110 @@
+import asyncio
+import threading
+import time
+import uuid
+from datetime import UTC, datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from app import idempotency
+from app.main import app
+from app.models import IdempotencyRecord
+from app.routes import invoices
+from app.workers import tasks
+from app.workers.celery_app import celery
+
+
+def test_claim_runs_the_db_work_off_the_event_loop(db, monkeypatch):
+    threads = []
+    try_claim = idempotency._try_claim
+
+    def recording(*args):
+        threads.append(threading.get_ident())
+        return try_claim(*args)
+
+    monkeypatch.setattr(idempotency, "_try_claim", recording)
+
+    async def scenario():
+        return threading.get_ident(), await idempotency.claim(db, "test", None, "off-loop", "fp")
+
+    loop_thread, claim = asyncio.run(scenario())
+    assert claim.replay is None
+    assert threads and loop_thread not in threads
+
+
+def test_replay_then_expiry(db):
+    claim = idempotency.claim_blocking(db, "test", "u1", "k-expiry", "fp")
+    idempotency.complete(db, claim, {"job_id": "j1"})
+    assert idempotency.claim_blocking(db, "test", "u1", "k-expiry", "fp").replay == {"job_id": "j1"}
+
+    record = db.get(IdempotencyRecord, claim.record_id)
+    record.expires_at = datetime.now(UTC) - timedelta(seconds=1)
+    db.commit()
+    # An expired record frees the key even before the purge runs.
+    assert idempotency.claim_blocking(db, "test", "u1", "k-expiry", "other").replay is None
+
+
+def test_purge_expired(db):
+    db.add(
+        IdempotencyRecord(
+            id="expired-" + "0" * 56,
+            endpoint="test",
+            fingerprint="fp",
+            expires_at=datetime.now(UTC) - timedelta(hours=1),
+        )
+    )
+    db.commit()
+    assert idempotency.purge_expired(db) >= 1
+    assert db.get(IdempotencyRecord, "expired-" + "0" * 56) is None
+
+
+def test_duplicate_of_a_running_request_is_answered_at_once(db):
+    idempotency.claim_blocking(db, "test", "u1", "k-running", "fp")
+
+    started = time.monotonic()
+    with pytest.raises(HTTPException) as exc:
+        idempotency.claim_blocking(db, "test", "u1", "k-running", "fp")
+    assert exc.value.status_code == 409
+    assert exc.value.headers["Retry-After"]
+    assert time.monotonic() - started < 1
+
+
+def test_duplicate_upload_attaches_to_the_created_job(monkeypatch):
+    dispatched = []
+
+    def dispatch(job_id, **kwargs):
+        dispatched.append(job_id)
+        raise RuntimeError("broker down")
+
+    monkeypatch.setattr(invoices.process_invoice, "delay", dispatch)
+    client = TestClient(app, raise_server_exceptions=False)
+    headers = {"Idempotency-Key": f"upload-{uuid.uuid4()}"}
+    files = {"file": ("f.pdf", b"%PDF-1.4 test", "application/pdf")}
+
+    assert client.post("/v1/invoices", files=files, headers=headers).status_code == 500
+    # The job exists: its key is kept (completed with the job) and the retry gets it back
+    retried = client.post("/v1/invoices", files=files, headers=headers)
+    assert retried.status_code == 200
+    assert retried.headers[idempotency.REPLAY_HEADER] == "true"
+    assert retried.json()["job_id"] == dispatched[0]
+    assert len(dispatched) == 1
+
+
+def test_purge_runs_as_a_beat_task(db):
+    schedule = celery.conf.beat_schedule["purge-idempotency-keys"]
+    assert schedule["task"] == tasks.purge_idempotency_keys.name
+
+    record_id = "beat-" + uuid.uuid4().hex
+    db.add(
+        IdempotencyRecord(
+            id=record_id,
+            endpoint="test",
+            fingerprint="fp",
+            expires_at=datetime.now(UTC) - timedelta(hours=1),
+        )
+    )
+    db.commit()
+    assert tasks.purge_idempotency_keys.apply().get() >= 1
+    assert db.get(IdempotencyRecord, record_id) is None
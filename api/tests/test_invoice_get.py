@@ -0,0 +1,72 @@
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app.db import engine
+from app.main import app
+from app.models import InvoiceJob, JobStatus
+
+
+@pytest.fixture
+def job(db) -> InvoiceJob:
+    job = InvoiceJob(
+        id=str(uuid.uuid4()),
+        status=JobStatus.EXTRACTED,
+        input_pdf_url="file:///tmp/input.pdf",
+        final_json={"invoice_number": "F1", "lines": ["x" * 2000]},
+        validation_json={"stdout_tail": "y" * 2000},
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)  # loaded now: reading job.id later issues no query
+    return job
+
+
+@pytest.fixture
+def statements():
+    seen = []
+
+    def record(conn, cursor, statement, *args):
+        seen.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    yield seen
+    event.remove(engine, "before_cursor_execute", record)
+
+
+def test_fields_selects_the_response_and_the_columns(job, statements):
+    response = TestClient(app).get(f"/v1/invoices/{job.id}?fields=status,download_url")
+
+    assert response.status_code == 200
+    assert response.json() == {"status": "EXTRACTED", "download_url": None}
+    job_select = next(s for s in statements if "FROM invoice_jobs" in s)
+    assert "final_json" not in job_select and "validation_json" not in job_select
+
+
+def test_unknown_field_is_refused(job):
+    response = TestClient(app).get(f"/v1/invoices/{job.id}?fields=status,secret")
+
+    assert response.status_code == 400
+    assert "secret" in response.json()["detail"]
+
+
+def test_etag_revalidation(db, job):
+    client = TestClient(app)
+    first = client.get(f"/v1/invoices/{job.id}")
+    etag = first.headers["ETag"]
+    assert first.json()["final_json"]["invoice_number"] == "F1"
+
+    cached = client.get(f"/v1/invoices/{job.id}", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+    # Another projection is another representation
+    assert client.get(f"/v1/invoices/{job.id}?fields=status").headers["ETag"] != etag
+
+    job.status = JobStatus.NEEDS_REVIEW
+    db.commit()
+    changed = client.get(f"/v1/invoices/{job.id}", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert changed.json()["status"] == "NEEDS_REVIEW"
@@ -0,0 +1,32 @@
+import os
+
+from app.pipeline import output_cache
+
+RESULT = {"profile": "BASIC_WL", "xml": "<x/>", "xml_sha256": "0" * 64, "validation": {}}
+
+
+def _output(tmp_path, name: str, content: bytes = b"%PDF-1.7 output") -> str:
+    path = tmp_path / name / "output_facturx.pdf"
+    path.parent.mkdir(parents=True)
+    path.write_bytes(content)
+    return str(path)
+
+
+def test_store_links_instead_of_copying(tmp_path):
+    pdf = _output(tmp_path, "job-store")
+    output_cache.store("a1" * 32, pdf, RESULT)
+    cached = output_cache._entry_dir("a1" * 32) / output_cache.PDF_NAME
+    assert os.path.samefile(pdf, cached)
+
+
+def test_hit_is_served_from_the_requests_own_link(tmp_path):
+    output_cache.store("b2" * 32, _output(tmp_path, "job-first"), RESULT)
+    own = tmp_path / "job-hit" / output_cache.PDF_NAME
+
+    hit = output_cache.lookup("b2" * 32, str(own))
+    assert hit["out_pdf_path"] == str(own) and hit["xml"] == "<x/>"
+
+    # Eviction (by any replica) does not pull the file from under the response.
+    assert output_cache.prune(max_bytes=0) >= 1
+    assert own.read_bytes() == b"%PDF-1.7 output"
+    assert output_cache.lookup("b2" * 32, str(tmp_path / "job-miss.pdf")) is None
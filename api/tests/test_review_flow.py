@@ -0,0 +1,67 @@
+import asyncio
+import uuid
+
+from app import events, webhooks
+from app.models import InvoiceJob, JobStatus, User
+from app.storage import save_job_file
+from app.workers import tasks
+
+
+def _job_for_review(db, monkeypatch) -> str:
+    user = User(id=str(uuid.uuid4()), email=f"{uuid.uuid4().hex}@example.com", hashed_password="x")
+    job_id = str(uuid.uuid4())
+    path = save_job_file(job_id, "input.pdf", b"%PDF-1.4 test")
+    db.add(user)
+    db.add(InvoiceJob(id=job_id, input_pdf_url=f"file://{path}", user_id=user.id))
+    db.commit()
+    monkeypatch.setattr(
+        tasks, "_extract_embedded", lambda job_id, path: {"invoice_number": "F1", "_debug": {}}
+    )
+    return job_id
+
+
+def test_review_job_settles_at_needs_review(db, monkeypatch):
+    job_id = _job_for_review(db, monkeypatch)
+    published, notified = [], []
+    monkeypatch.setattr(events, "publish", published.extend)
+    monkeypatch.setattr(webhooks, "enqueue_job_events", notified.extend)
+
+    tasks.process_invoice.apply(args=(job_id,), kwargs={"stop_after_extract": True})
+
+    db.expire_all()
+    assert db.get(InvoiceJob, job_id).status == JobStatus.NEEDS_REVIEW
+    assert [ev["status"] for ev in published if ev["job_id"] == job_id] == ["NEEDS_REVIEW"]
+    assert [ev["status"] for ev in notified if ev["job_id"] == job_id] == ["NEEDS_REVIEW"]
+
+
+def test_review_job_ends_the_status_stream(db, monkeypatch):
+    job_id = _job_for_review(db, monkeypatch)
+    tasks.process_invoice.apply(args=(job_id,), kwargs={"stop_after_extract": True})
+
+    async def _collect():
+        return [ev async for ev in events.job_updates(job_id, timeout_s=5, heartbeat_s=1)]
+
+    updates = asyncio.run(asyncio.wait_for(_collect(), timeout=10))
+    assert [ev["status"] for ev in updates] == ["NEEDS_REVIEW"]
+
+
+def test_automatic_job_passes_through_extracted(db, monkeypatch):
+    job_id = _job_for_review(db, monkeypatch)
+    published, dispatched = [], []
+    monkeypatch.setattr(events, "publish", published.extend)
+
+    class _Chain:
+        def __init__(self, jid: str) -> None:
+            self.jid = jid
+
+        def apply_async(self) -> None:
+            dispatched.append(self.jid)
+
+    monkeypatch.setattr(tasks, "finalize_pipeline", _Chain)
+
+    tasks.process_invoice.apply(args=(job_id,))
+
+    db.expire_all()
+    assert db.get(InvoiceJob, job_id).status == JobStatus.EXTRACTED
+    assert [ev["status"] for ev in published if ev["job_id"] == job_id] == ["EXTRACTED"]
+    assert dispatched == [job_id]
@@ -0,0 +1,28 @@
+from sqlalchemy import create_engine, inspect, text
+
+from app.db import ADDED_COLUMNS, upgrade_schema
+
+
+def _columns(engine, table: str) -> set[str]:
+    return {c["name"] for c in inspect(engine).get_columns(table)}
+
+
+def test_upgrade_adds_missing_columns_once(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/old.sqlite")
+    with engine.begin() as conn:
+        # invoice_jobs as created by a release that predates ADDED_COLUMNS
+        conn.execute(text("CREATE TABLE invoice_jobs (id VARCHAR PRIMARY KEY, status VARCHAR)"))
+        conn.execute(text("INSERT INTO invoice_jobs (id, status) VALUES ('j1', 'VALIDATED')"))
+
+    added = {c for t, c, _, _ in ADDED_COLUMNS if t == "invoice_jobs"}
+    assert set(upgrade_schema(engine)) == {f"invoice_jobs.{c}" for c in added}
+    assert upgrade_schema(engine) == []
+
+    assert added <= _columns(engine, "invoice_jobs")
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT id FROM invoice_jobs")).scalars().all() == ["j1"]
+
+
+def test_upgrade_skips_tables_create_all_will_create(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/empty.sqlite")
+    assert upgrade_schema(engine) == []
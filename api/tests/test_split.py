@@ -0,0 +1,55 @@
+import pikepdf
+import pytest
+
+from app.config import Settings
+from app.pipeline import split
+
+
+def _boundaries(monkeypatch, pages: list[str]) -> list[tuple[int, int]]:
+    monkeypatch.setattr(split, "_pages_text", lambda path: pages)
+    return split.detect_invoice_boundaries("unused.pdf")
+
+
+def test_splitting_is_opt_in():
+    assert Settings().enable_invoice_split is False
+
+
+def test_two_invoices_are_split(monkeypatch):
+    pages = [
+        "FACTURE N° F-2024-001\nPage 1/1\nTotal TTC 120,00",
+        "Invoice #INV-88\npage 1 of 2\nWidgets",
+        "Invoice #INV-88\npage 2 of 2\nTotal 42.00",
+    ]
+    assert _boundaries(monkeypatch, pages) == [(0, 0), (1, 2)]
+
+
+@pytest.mark.parametrize(
+    "pages",
+    [
+        # One invoice whose every page repeats the header with its own page number
+        ["Facture N° F-001\nPage 1/2", "Facture N° F-001\nPage 2/2"],
+        # Page 2 refers to another invoice (credit note style): no "page 1" marker
+        ["Facture N° F-001\nPage 1/2", "Avoir sur facture N° F-000\nPage 2/2"],
+        # Annexes that restart their own page numbering but carry no invoice number
+        ["Facture N° F-001\nPage 1/1", "Bon de livraison N° BL-17\nPage 1/1"],
+        # Quantities and dates that look like page markers, loose "N°" references
+        ["Facture N° F-001\n3 x Article 1/3", "Réf. N° 4567, facture du 12/03/2024\n1/2"],
+        # A "page 1" header with a number the first page never declared
+        ["Relevé de compte\nPage 1/1", "Invoice number: 42\nPage 1/1"],
+    ],
+)
+def test_single_invoice_is_not_split(monkeypatch, pages):
+    assert _boundaries(monkeypatch, pages) == [(0, len(pages) - 1)]
+
+
+def test_split_pdf_writes_each_range(tmp_path):
+    src = tmp_path / "multi.pdf"
+    pdf = pikepdf.new()
+    for _ in range(3):
+        pdf.add_blank_page()
+    pdf.save(src)
+
+    outs = [str(tmp_path / "a.pdf"), str(tmp_path / "b.pdf")]
+    split.split_pdf(str(src), [(0, 0), (1, 2)], outs)
+
+    assert [len(pikepdf.open(p).pages) for p in outs] == [1, 2]
@@ -0,0 +1,29 @@
+import uuid
+
+from app.models import InvoiceJob, JobStatus
+from app.workers.tasks import _refresh_split_parent
+
+
+def _family(db, *child_statuses: JobStatus) -> str:
+    parent_id = str(uuid.uuid4())
+    db.add(InvoiceJob(id=parent_id, input_pdf_url="file:///dev/null"))
+    for status in child_statuses:
+        db.add(InvoiceJob(input_pdf_url="file:///dev/null", status=status, parent_job_id=parent_id))
+    db.commit()
+    return parent_id
+
+
+def test_parent_waits_for_extracted_children(db):
+    parent_id = _family(db, JobStatus.VALIDATED, JobStatus.EXTRACTED)
+    _refresh_split_parent(db, parent_id)
+    assert db.get(InvoiceJob, parent_id).status == JobStatus.UPLOADED
+
+
+def test_parent_settles_once_children_do(db):
+    parent_id = _family(db, JobStatus.VALIDATED, JobStatus.VALIDATED)
+    _refresh_split_parent(db, parent_id)
+    assert db.get(InvoiceJob, parent_id).status == JobStatus.VALIDATED
+
+    parent_id = _family(db, JobStatus.VALIDATED, JobStatus.NEEDS_REVIEW)
+    _refresh_split_parent(db, parent_id)
+    assert db.get(InvoiceJob, parent_id).status == JobStatus.NEEDS_REVIEW
@@ -0,0 +1,73 @@
+import asyncio
+import base64
+import hashlib
+import io
+import os
+
+import pytest
+from fastapi import UploadFile
+from fastapi.testclient import TestClient
+
+from app.config import settings
+from app.main import app
+from app.storage import UploadTooLarge, store_base64, store_fileobj, store_upload
+
+DATA = b"%PDF-1.4 " + bytes(range(256)) * 8192  # ~2 MB: several chunks
+
+
+def test_upload_is_copied_in_chunks_and_hashed(tmp_path):
+    path = tmp_path / "input.pdf"
+    stored = asyncio.run(store_upload(UploadFile(io.BytesIO(DATA), filename="in.pdf"), path))
+
+    assert path.read_bytes() == DATA
+    assert (stored.size, stored.sha256) == (len(DATA), hashlib.sha256(DATA).hexdigest())
+    assert not path.with_name("input.pdf.part").exists()
+
+
+def test_oversized_upload_leaves_nothing_on_disk(tmp_path):
+    path = tmp_path / "input.pdf"
+    upload = UploadFile(io.BytesIO(DATA), filename="in.pdf")
+
+    with pytest.raises(UploadTooLarge):
+        asyncio.run(store_upload(upload, path, max_bytes=1024 * 1024))
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_base64_is_decoded_in_chunks(tmp_path):
+    path = tmp_path / "input.pdf"
+    stored = store_base64(base64.b64encode(DATA).decode(), path)
+
+    assert path.read_bytes() == DATA
+    assert stored.sha256 == hashlib.sha256(DATA).hexdigest()
+
+
+@pytest.mark.parametrize(
+    ("data", "error"),
+    [
+        (base64.b64encode(DATA).decode(), UploadTooLarge),  # rejected from its length alone
+        ("not base64!", ValueError),
+    ],
+)
+def test_bad_base64_is_rejected(tmp_path, data, error):
+    with pytest.raises(error):
+        store_base64(data, tmp_path / "input.pdf", max_bytes=1024 * 1024 if error is UploadTooLarge else None)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_fileobj_respects_the_cap(tmp_path):
+    stored = store_fileobj(io.BytesIO(DATA), tmp_path / "a.pdf", max_bytes=len(DATA))
+    assert stored.size == len(DATA)
+
+    with pytest.raises(UploadTooLarge):
+        store_fileobj(io.BytesIO(DATA), tmp_path / "b.pdf", max_bytes=len(DATA) - 1)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["a.pdf"]
+
+
+def test_upload_route_returns_413_past_the_limit(monkeypatch, storage_root):
+    monkeypatch.setattr(settings, "max_upload_mb", 1)
+    before = set(os.listdir(storage_root))
+
+    response = TestClient(app).post("/v1/invoices", files={"file": ("big.pdf", DATA, "application/pdf")})
+
+    assert response.status_code == 413
+    assert set(os.listdir(storage_root)) == before
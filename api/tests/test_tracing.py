@@ -0,0 +1,22 @@
+import os
+
+import billiard
+
+from app.tracing import _file_exporter
+
+
+def _export_in_child(exporter) -> None:
+    exporter.export([])
+
+
+def test_file_exporter_writes_one_file_per_process(tmp_path):
+    exporter = _file_exporter(str(tmp_path / "spans-{pid}.jsonl"))
+    exporter.export([])
+
+    proc = billiard.Process(target=_export_in_child, args=(exporter,))
+    proc.start()
+    proc.join(30)
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted(
+        [f"spans-{os.getpid()}.jsonl", f"spans-{proc.pid}.jsonl"]
+    )
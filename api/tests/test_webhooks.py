@@ -0,0 +1,192 @@
+import asyncio
+import socket
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import events, webhooks
+from app.config import settings
+from app.db import SessionLocal
+from app.models import InvoiceJob, User, WebhookDelivery, WebhookEndpoint
+from app.security import create_access_token
+from app.workers import tasks
+
+PRIVATE_URLS = [
+    "http://127.0.0.1:8000/hook",
+    "http://localhost/hook",
+    "http://169.254.169.254/latest/meta-data/",
+    "http://10.0.0.5/hook",
+    "http://192.168.1.10/hook",
+    "http://[::1]/hook",
+    "http://[::ffff:127.0.0.1]/hook",
+    "http://0.0.0.0/hook",
+]
+
+
+@pytest.mark.parametrize("url", PRIVATE_URLS)
+def test_private_targets_are_refused(url):
+    with pytest.raises(webhooks.UnsafeWebhookURL):
+        webhooks.check_webhook_url(url)
+
+
+def test_internal_service_names_are_refused(monkeypatch):
+    # e.g. "redis" or "db" on the compose network
+    def resolve(host, port, **_):
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", ("172.18.0.3", port))]
+
+    monkeypatch.setattr(webhooks.socket, "getaddrinfo", resolve)
+    with pytest.raises(webhooks.UnsafeWebhookURL):
+        webhooks.check_webhook_url("http://redis:6379/")
+
+
+def test_public_targets_and_schemes():
+    webhooks.check_webhook_url("https://93.184.215.14/hook")
+    with pytest.raises(webhooks.UnsafeWebhookURL):
+        webhooks.check_webhook_url("ftp://93.184.215.14/hook")
+
+
+def test_registration_refuses_private_targets(db):
+    from app.main import app
+
+    user = User(id=str(uuid.uuid4()), email=f"{uuid.uuid4().hex}@example.com", hashed_password="x")
+    db.add(user)
+    db.commit()
+    headers = {"Authorization": f"Bearer {create_access_token(user.id)}"}
+
+    response = TestClient(app).post(
+        "/v1/webhooks", json={"url": "http://169.254.169.254/latest/"}, headers=headers
+    )
+    assert response.status_code == 400
+    assert db.query(WebhookEndpoint).filter(WebhookEndpoint.user_id == user.id).count() == 0
+
+
+def test_delivery_rechecks_the_target(db, monkeypatch):
+    # Registered while public, now resolving to a private address (DNS change).
+    user = User(id=str(uuid.uuid4()), email=f"{uuid.uuid4().hex}@example.com", hashed_password="x")
+    endpoint = WebhookEndpoint(user_id=user.id, url="http://127.0.0.1:9/hook", secret="s")
+    db.add_all([user, endpoint])
+    db.flush()
+    row = WebhookDelivery(endpoint_id=endpoint.id, event={"type": "invoice.status"})
+    db.add(row)
+    db.commit()
+
+    def no_request(*args, **kwargs):
+        raise AssertionError("a request was sent to a private address")
+
+    monkeypatch.setattr(webhooks, "_http", no_request)
+    monkeypatch.setattr(settings, "webhook_allow_private_targets", False)
+    tasks.deliver_webhooks.apply(args=(endpoint.id,))
+
+    db.expire_all()
+    row = db.get(WebhookDelivery, row.id)
+    assert row.status == "failed"
+    assert "public addresses" in row.last_error
+
+
+def _endpoint(db, **kwargs) -> WebhookEndpoint:
+    user = User(id=str(uuid.uuid4()), email=f"{uuid.uuid4().hex}@example.com", hashed_password="x")
+    endpoint = WebhookEndpoint(user_id=user.id, url="http://127.0.0.1:9/hook", secret="s", **kwargs)
+    db.add_all([user, endpoint])
+    db.commit()
+    return endpoint
+
+
+def test_delivery_refuses_a_rebound_address(db, monkeypatch):
+    # The check resolved a public address, the connection resolves to loopback.
+    received = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            received.append(self.path)
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        endpoint = _endpoint(db)
+        endpoint.url = f"http://127.0.0.1:{server.server_port}/hook"
+        row = WebhookDelivery(endpoint_id=endpoint.id, event={"type": "invoice.status"})
+        db.add(row)
+        db.commit()
+        monkeypatch.setattr(webhooks, "check_webhook_url", lambda url: None)
+        monkeypatch.setattr(settings, "webhook_allow_private_targets", False)
+
+        with pytest.raises(webhooks.UnsafeWebhookURL, match="127.0.0.1"):
+            webhooks.post_batch(endpoint, [row])
+        assert received == []
+
+        monkeypatch.setattr(settings, "webhook_allow_private_targets", True)
+        webhooks.post_batch(endpoint, [row])
+        assert received == ["/hook"]
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_events_wait_for_the_pending_retry(db, monkeypatch):
+    endpoint = _endpoint(db)
+    db.add(WebhookDelivery(endpoint_id=endpoint.id, event={"type": "invoice.status"}, attempts=2))
+    db.commit()
+    scheduled = []
+    monkeypatch.setattr(webhooks, "schedule_delivery", scheduled.append)
+    event = {"job_id": "j1", "status": "VALIDATED", "user_id": endpoint.user_id}
+
+    webhooks.enqueue_job_events([event])
+
+    # Stored for the retry that is already scheduled, no send of its own
+    assert scheduled == []
+    pending = db.query(WebhookDelivery).filter(WebhookDelivery.endpoint_id == endpoint.id).count()
+    assert pending == 2
+
+    other = _endpoint(db)
+    webhooks.enqueue_job_events([{**event, "user_id": other.user_id}])
+    assert scheduled == [other.id]
+
+
+def test_failed_batch_is_resent_only_by_its_retry(db, monkeypatch):
+    endpoint = _endpoint(db)
+    db.add(WebhookDelivery(endpoint_id=endpoint.id, event={"type": "invoice.status"}))
+    db.commit()
+    retries, scheduled = [], []
+
+    def refuse(endpoint, rows):
+        raise RuntimeError("HTTP 503")
+
+    def retry(**kwargs):
+        retries.append(kwargs["countdown"])
+        return RuntimeError("retry")
+
+    monkeypatch.setattr(tasks, "post_batch", refuse)
+    monkeypatch.setattr(tasks, "schedule_delivery", scheduled.append)
+    monkeypatch.setattr(tasks.deliver_webhooks, "retry", retry)
+
+    with pytest.raises(RuntimeError, match="retry"):
+        tasks.deliver_webhooks.run(endpoint.id)
+
+    assert retries == [settings.webhook_retry_base_s]
+    assert scheduled == []
+
+
+def test_commit_on_the_event_loop_publishes_off_it(db, monkeypatch):
+    threads = []
+    monkeypatch.setattr(events, "publish", lambda evs: threads.append(threading.get_ident()))
+
+    async def commit() -> int:
+        session = SessionLocal()
+        try:
+            session.add(InvoiceJob(id=str(uuid.uuid4()), input_pdf_url="file:///tmp/x.pdf"))
+            session.commit()
+        finally:
+            session.close()
+        await asyncio.sleep(0.2)
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(commit())
+    assert threads and loop_thread not in threads
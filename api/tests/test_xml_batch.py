@@ -0,0 +1,69 @@
+import io
+import json
+import zipfile
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.config import settings
+from app.main import app
+from app.pipeline.cii_builder import SAMPLE_INVOICE
+
+NDJSON = {"Content-Type": "application/x-ndjson"}
+
+
+@pytest.fixture
+def client() -> TestClient:
+    return TestClient(app)
+
+
+def _ndjson(items: list) -> bytes:
+    return b"".join(json.dumps(item).encode() + b"\n" for item in items)
+
+
+def test_ndjson_batch_streams_one_result_per_line(client):
+    body = _ndjson([SAMPLE_INVOICE, "not an object", dict(SAMPLE_INVOICE, invoice_number="F-2")])
+
+    response = client.post("/v1/xml/batch?validate=true", content=body, headers=NDJSON)
+
+    assert response.status_code == 200
+    results = [json.loads(line) for line in response.text.splitlines()]
+    assert [(r["index"], r["ok"]) for r in results] == [(0, True), (1, False), (2, True)]
+    assert "<ram:ID>F-2</ram:ID>" in results[2]["xml"]
+
+
+def test_json_array_batch_as_zip(client):
+    response = client.post(
+        "/v1/xml/batch", params={"format": "zip", "profile": "EN16931"}, json=[SAMPLE_INVOICE]
+    )
+
+    assert response.status_code == 200
+    names = zipfile.ZipFile(io.BytesIO(response.content)).namelist()
+    assert names == ["invoice-000000.xml", "manifest.json"]
+
+
+@pytest.mark.parametrize(
+    ("params", "body", "status"),
+    [
+        ({"profile": "XRECHNUNG"}, b"", 400),
+        ({"format": "csv"}, b"", 400),
+        ({}, b'{"invoice_number": "F-1"}\n{not json\n', 400),
+    ],
+)
+def test_invalid_batches_are_rejected(client, params, body, status):
+    assert client.post("/v1/xml/batch", params=params, content=body, headers=NDJSON).status_code == status
+
+
+def test_batch_caps_items_and_size(client, monkeypatch):
+    monkeypatch.setattr(settings, "xml_batch_max_items", 2)
+    too_many = _ndjson([SAMPLE_INVOICE] * 3)
+    assert client.post("/v1/xml/batch", content=too_many, headers=NDJSON).status_code == 413
+
+    monkeypatch.setattr(settings, "xml_batch_max_items", 10_000)
+    monkeypatch.setattr(settings, "max_request_mb", 1)
+
+    def _chunked():  # no Content-Length: only the streamed cap applies
+        for _ in range(3):
+            yield b" " * (512 * 1024)
+
+    assert client.post("/v1/xml/batch", content=_chunked(), headers=NDJSON).status_code == 413
@@ -0,0 +1,48 @@
+import pytest
+
+from app.config import settings
+from app.pipeline.cii_builder import SAMPLE_INVOICE, render_cii
+from app.pipeline.xml_canon import canonical_sha256, canonical_sha256_file, canonicalize, minify
+
+
+def test_output_mode_defaults_to_pretty():
+    assert settings.cii_output_mode == "pretty"
+
+
+@pytest.mark.parametrize("engine", ["jinja", "lxml"])
+def test_hash_is_the_same_for_every_output_mode(monkeypatch, engine):
+    monkeypatch.setattr(settings, "cii_builder_engine", engine)
+    outputs = {mode: render_cii("EN16931", SAMPLE_INVOICE, mode) for mode in ("pretty", "minified", "c14n")}
+
+    assert outputs["c14n"].data != outputs["pretty"].data
+    assert len({cii.sha256 for cii in outputs.values()}) == 1
+    assert outputs["c14n"].sha256 == canonical_sha256(outputs["pretty"].data)
+
+
+def test_minified_output_has_no_indentation_or_comments():
+    cii = render_cii("BASIC_WL", SAMPLE_INVOICE, "minified")
+
+    assert b"\n  " not in cii.data and b"<!--" not in cii.data
+    assert cii.data.startswith(b"<?xml")
+    assert cii._tree is not None  # minify() hands over its parsed tree
+
+
+def test_canonical_form_keeps_text_verbatim():
+    xml = b"<a>\n  <!-- note -->\n  <b> padded value </b>\n  <c>x</c>\n</a>"
+
+    assert canonicalize(xml) == b"<a><b> padded value </b><c>x</c></a>"
+    data, _ = minify(xml)
+    assert b"<b> padded value </b>" in data
+
+
+def test_file_hash_matches_in_memory_hash(tmp_path):
+    cii = render_cii("EN16931", SAMPLE_INVOICE, "pretty")
+    path = tmp_path / "factur-x.xml"
+    path.write_bytes(cii.data)
+
+    assert canonical_sha256_file(str(path)) == cii.sha256
+
+
+def test_unknown_output_mode_is_rejected():
+    with pytest.raises(ValueError, match="output mode"):
+        render_cii("BASIC_WL", SAMPLE_INVOICE, "gzip")